@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from colorama import Fore
+from spotify_ripper.utils import *
+import os
+import time
+import json
+import codecs
+import shutil
+
+
+def chart_entries(chart):
+    return [item["track"]["uri"] for item in chart["entries"]["items"]]
+
+
+class ChartMirror(object):
+    """Mirrors many charts at once (``--mirror-charts``).
+
+    All chart URIs are fetched concurrently up front, so planning finds
+    them in the Web API cache.  Each chart is compared with the previous
+    snapshot of the same metric/region/window in the settings directory,
+    and the new snapshot replaces it.
+    """
+
+    def __init__(self, args, ripper):
+        self.args = args
+        self.ripper = ripper
+        self.snapshot_dir = os.path.join(settings_dir(), "charts")
+
+    def fetch(self, uris):
+        chart_uris = [uri for uri in uris if not isinstance(uri, list) and
+                      uri.startswith("spotify:charts:")]
+        web = self.ripper.web
+        charts = web.client.map(web.get_charts, chart_uris)
+        return [(uri, chart) for uri, chart in zip(chart_uris, charts)
+                if chart is not None]
+
+    def snapshot_file(self, uri):
+        # spotify:charts:metric:region:time_window:date
+        return os.path.join(self.snapshot_dir,
+                            "-".join(uri.split(':')[2:5]) + ".json")
+
+    def load_snapshot(self, uri):
+        snapshot_file = self.snapshot_file(uri)
+        try:
+            with codecs.open(enc_str(snapshot_file), 'r', "utf-8") as f:
+                return json.loads(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save_snapshot(self, uri, entries):
+        snapshot_file = self.snapshot_file(uri)
+        snapshot = {
+            "uri": uri,
+            "fetched": time.time(),
+            "entries": entries,
+        }
+        try:
+            if not path_exists(self.snapshot_dir):
+                os.makedirs(enc_str(self.snapshot_dir))
+            tmp_file = snapshot_file + "." + str(os.getpid()) + ".tmp"
+            with codecs.open(enc_str(tmp_file), 'w', "utf-8") as f:
+                f.write(json.dumps(snapshot))
+            shutil.move(enc_str(tmp_file), enc_str(snapshot_file))
+        except (IOError, OSError) as e:
+            print(Fore.YELLOW + "Warning: could not save the chart snapshot " +
+                  snapshot_file + Fore.RESET)
+            print(str(e))
+
+    def diff(self, charts):
+        """print what changed in each chart since its last snapshot and
+        save the new snapshots"""
+        new_uris = set()
+        for uri, chart in charts:
+            entries = chart_entries(chart)
+            previous = self.load_snapshot(uri)
+            if previous is None:
+                print(Fore.GREEN + chart["name"] + ": " + str(len(entries)) +
+                      " entries, no earlier snapshot" + Fore.RESET)
+                new_uris.update(entries)
+            else:
+                previous_entries = set(previous["entries"])
+                added = [e for e in entries if e not in previous_entries]
+                dropped = len(previous_entries - set(entries))
+                print(Fore.GREEN + chart["name"] + ": " + str(len(added)) +
+                      " new, " + str(dropped) + " dropped since " +
+                      time.strftime("%Y-%m-%d",
+                                    time.localtime(previous["fetched"])) +
+                      Fore.RESET)
+                new_uris.update(added)
+            self.save_snapshot(uri, entries)
+
+        print(Fore.GREEN + str(len(new_uris)) + " new tracks across " +
+              str(len(charts)) + " charts" + Fore.RESET)
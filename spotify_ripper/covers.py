@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from colorama import Fore
+from spotify_ripper.utils import *
+from spotify_ripper.lru import LRUCache
+from io import BytesIO
+import os
+import shutil
+import hashlib
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def resize_image(data, max_size=None, quality=None):
+    """a JPEG of the image no larger than ``max_size`` pixels, or the
+    original data if that isn't smaller"""
+    image = Image.open(BytesIO(data))
+    if max_size is not None and max(image.size) > max_size:
+        resample = getattr(Image, "LANCZOS", None) or Image.ANTIALIAS
+        image.thumbnail((max_size, max_size), resample)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    out = BytesIO()
+    image.save(out, "JPEG", quality=quality or 90, optimize=True)
+    resized = out.getvalue()
+    return resized if len(resized) < len(data) else data
+
+
+class CoverCache(object):
+    """Cover images keyed by Spotify image ID, shared by every album,
+    playlist and run.
+
+    Images are stored content-addressed below ``cache_dir`` (so the same
+    image under several IDs is only kept once) and the last used ones
+    are also kept in memory.  With ``max_size`` or ``quality`` the cover
+    that is embedded is a downscaled/recompressed variant, made once per
+    image by whichever tagging worker needs it first.
+    """
+
+    def __init__(self, cache_dir, max_size=None, quality=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.quality = quality
+        self.memory = LRUCache(16 * MB_BYTES)
+        self.lock = threading.Lock()
+        self.id_locks = {}
+        self.original_sizes = {}
+
+        self.hits = 0
+        self.downloads = 0
+        self.bytes_saved = 0
+
+        if (max_size is not None or quality is not None) and Image is None:
+            print(Fore.YELLOW + "Warning: resizing cover images needs the "
+                                "Pillow package, embedding the original "
+                                "covers" + Fore.RESET)
+            self.max_size = None
+            self.quality = None
+
+    @property
+    def variant(self):
+        if self.max_size is None and self.quality is None:
+            return None
+        return str(self.max_size or 0) + "px-q" + str(self.quality or 90)
+
+    def get(self, image_uri, load_image):
+        """the cover to embed, ``load_image`` returns the original image
+        data if it isn't cached yet"""
+        image_id = image_uri.split(':')[-1]
+        key = image_id if self.variant is None \
+            else image_id + "-" + self.variant
+
+        # one worker fetches and resizes an image, the others wait
+        with self.lock:
+            id_lock = self.id_locks.setdefault(image_id, threading.Lock())
+        with id_lock:
+            data = self.memory.get(key)
+            if data is None:
+                data = self.read(key)
+                if data is None:
+                    data = self.create(image_id, key, load_image)
+                else:
+                    self.count(hits=1)
+                self.memory.put(key, data, len(data))
+            else:
+                self.count(hits=1)
+
+            if key != image_id:
+                self.count(bytes_saved=max(
+                    self.original_size(image_id) - len(data), 0))
+        return data
+
+    def original_size(self, image_id):
+        size = self.original_sizes.get(image_id)
+        if size is None:
+            try:
+                with open(enc_str(self.id_file(image_id)), "r") as f:
+                    digest = f.read().strip()
+                size = os.path.getsize(enc_str(self.data_file(digest)))
+            except (IOError, OSError):
+                size = 0
+            self.original_sizes[image_id] = size
+        return size
+
+    def create(self, image_id, key, load_image):
+        original = self.read(image_id)
+        if original is None:
+            original = load_image()
+            self.count(downloads=1)
+            self.write(image_id, original)
+        else:
+            self.count(hits=1)
+        self.original_sizes[image_id] = len(original)
+        if key == image_id:
+            return original
+
+        try:
+            data = resize_image(original, self.max_size, self.quality)
+        except (IOError, OSError, ValueError) as e:
+            print(Fore.YELLOW + "Could not resize cover image " + image_id +
+                  Fore.RESET)
+            print(str(e))
+            return original
+        self.write(key, data)
+        return data
+
+    def count(self, hits=0, downloads=0, bytes_saved=0):
+        with self.lock:
+            self.hits += hits
+            self.downloads += downloads
+            self.bytes_saved += bytes_saved
+
+    def id_file(self, key):
+        return os.path.join(self.cache_dir, "ids", key)
+
+    def data_file(self, digest):
+        return os.path.join(self.cache_dir, "data", digest[:2],
+                            digest + ".jpg")
+
+    def read(self, key):
+        try:
+            with open(enc_str(self.id_file(key)), "r") as f:
+                digest = f.read().strip()
+            with open(enc_str(self.data_file(digest)), "rb") as f:
+                return f.read()
+        except (IOError, OSError):
+            return None
+
+    def write(self, key, data):
+        digest = hashlib.sha1(data).hexdigest()
+        try:
+            data_file = self.data_file(digest)
+            if not path_exists(data_file):
+                self.write_file(data_file, data)
+            self.write_file(self.id_file(key), digest.encode("ascii"))
+        except (IOError, OSError) as e:
+            print(Fore.YELLOW + "Warning: could not write to the cover "
+                                "cache " + self.cache_dir + Fore.RESET)
+            print(str(e))
+
+    def write_file(self, path, data):
+        dir_name = os.path.dirname(path)
+        if not path_exists(dir_name):
+            try:
+                os.makedirs(enc_str(dir_name))
+            except OSError:
+                # created by another worker in the meantime
+                if not path_exists(dir_name):
+                    raise
+        tmp_file = path + "." + str(os.getpid()) + "." + \
+            str(threading.current_thread().ident) + ".tmp"
+        with open(enc_str(tmp_file), "wb") as f:
+            f.write(data)
+        shutil.move(enc_str(tmp_file), enc_str(path))
@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from subprocess import Popen, PIPE
+from colorama import Fore
+from mutagen import flac
+from spotify_ripper.utils import *
+from spotify_ripper.tags import tag_fields
+import os
+import shutil
+import base64
+import itertools
+import wave
+
+#  output_type -> encoder class
+encoders = {}
+
+_temp_ids = itertools.count()
+
+
+def register_encoder(cls):
+    encoders[cls.output_type] = cls
+    return cls
+
+
+def get_encoder(output_type):
+    return encoders.get(output_type)
+
+
+def temp_dir():
+    """temporary files are kept inside the output directory so they can
+    be renamed into place"""
+    return os.path.join(base_dir(), ".spotify-ripper-tmp")
+
+
+def is_ascii(_str):
+    try:
+        _str.encode("ascii")
+        return True
+    except UnicodeError:
+        return False
+
+
+def tag_str(_str):
+    # tags are passed as UTF-8 whatever the path encoding is
+    return _str.encode("utf-8")
+
+
+def picture_spec(cover_file):
+    """flac/opusenc --picture argument for a front cover"""
+    return enc_str("3|image/jpeg|Front Cover||" + cover_file)
+
+
+class Encoder(object):
+    """Base class for an encoder backend, one per ``args.output_type``.
+
+    ``command`` and ``package`` name the executable and the package to
+    install if it is missing.  Backends that don't run an external
+    program (wav, pcm) leave ``command`` as None and override
+    :meth:`open_file`.
+
+    Encoders that can write tags themselves override :meth:`tag_args`,
+    so the file doesn't have to be rewritten by mutagen afterwards.
+    """
+
+    output_type = None
+    command = None
+    package = None
+    tags_at_encode = False
+    embeds_cover = False
+
+    def __init__(self, args):
+        self.args = args
+        self.dev_null = None
+
+    @classmethod
+    def is_available(cls):
+        return cls.command is None or which(cls.command) is not None
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        raise NotImplementedError
+
+    def tag_args(self, fields, cover_file):
+        """command line options that write the tag ``fields`` (and the
+        cover, if ``cover_file`` is given), and the fields they cover"""
+        return [], set()
+
+    def open_file(self, audio_file_enc, proc):
+        raise NotImplementedError
+
+    def spawn(self, stdin=None, metadata=None):
+        """start the encoder writing to a temporary file, the final path
+        is set later with :meth:`EncoderProcess.bind`.  If ``stdin`` is
+        given, the encoder reads its input from that file instead of a
+        pipe.  With resolved ``metadata`` the encoder tags the file if
+        it can"""
+        _temp_dir = temp_dir()
+        if not path_exists(_temp_dir):
+            os.makedirs(enc_str(_temp_dir))
+
+        temp_file = os.path.join(
+            _temp_dir, "%d-%d.%s" % (os.getpid(), next(_temp_ids),
+                                     self.output_type))
+        return EncoderProcess(self, temp_file, stdin, metadata)
+
+    def popen(self, audio_file_enc, stdin=PIPE, tag_args=()):
+        return Popen(self.command_line(audio_file_enc, tag_args),
+                     stdin=stdin)
+
+
+class EncoderProcess(object):
+    """An encoder started for one track"""
+
+    def __init__(self, encoder, temp_file, stdin=None, metadata=None):
+        self.encoder = encoder
+        self.temp_file = temp_file
+        self.audio_file = None
+        self.closed = False
+        self.rip_proc = None
+        self.pipe = None
+        self.wav_file = None
+        self.pcm_file = None
+        # tag fields the encoder writes itself
+        self.tagged = set()
+        self.cover_file = None
+
+        temp_file_enc = enc_str(temp_file)
+        if encoder.command is None:
+            encoder.open_file(temp_file_enc, self)
+            return
+
+        tag_args = self.tag_args(metadata) \
+            if metadata is not None and metadata.resolved else []
+        if stdin is not None:
+            self.rip_proc = encoder.popen(temp_file_enc, stdin=stdin,
+                                          tag_args=tag_args)
+        else:
+            self.rip_proc = encoder.popen(temp_file_enc, tag_args=tag_args)
+            self.pipe = self.rip_proc.stdin
+
+    def tag_args(self, metadata):
+        encoder = self.encoder
+        args = encoder.args
+
+        # the cover goes next to the files with --cover-file
+        if encoder.embeds_cover and metadata.cover is not None and \
+                args.cover_file is None:
+            self.cover_file = self.temp_file + ".jpg"
+            with open(enc_str(self.cover_file), "wb") as f:
+                f.write(metadata.cover)
+
+        tag_args, self.tagged = encoder.tag_args(
+            tag_fields(args, metadata), self.cover_file)
+        if self.cover_file is not None and "COVER" not in self.tagged:
+            self.remove_cover_file()
+        return tag_args
+
+    def remove_cover_file(self):
+        if self.cover_file is not None:
+            rm_file(enc_str(self.cover_file))
+            self.cover_file = None
+
+    def bind(self, audio_file):
+        self.audio_file = audio_file
+
+    def close(self):
+        """close the encoder input, wait for it to finish writing and
+        move the output into place"""
+        if self.rip_proc is not None:
+            if self.pipe is not None:
+                self.pipe.flush()
+                self.pipe.close()
+
+            # wait for process to end before continuing
+            ret_code = self.rip_proc.wait()
+            if ret_code != 0:
+                print(
+                    Fore.YELLOW + "Warning: encoder returned non-zero "
+                                  "error code " + str(ret_code) + Fore.RESET)
+            self.rip_proc = None
+            self.pipe = None
+        self.remove_cover_file()
+
+        if self.wav_file is not None:
+            self.wav_file.close()
+            self.wav_file = None
+
+        if self.pcm_file is not None:
+            self.pcm_file.flush()
+            os.fsync(self.pcm_file.fileno())
+            self.pcm_file.close()
+            self.pcm_file = None
+
+        shutil.move(enc_str(self.temp_file), enc_str(self.audio_file))
+        self.closed = True
+
+    def abort(self):
+        """stop the encoder and delete anything it wrote"""
+        if self.rip_proc is not None:
+            try:
+                if self.pipe is not None:
+                    self.pipe.close()
+            except (IOError, OSError):
+                pass
+            if self.rip_proc.poll() is None:
+                self.rip_proc.kill()
+            self.rip_proc.wait()
+            self.rip_proc = None
+            self.pipe = None
+        self.remove_cover_file()
+
+        for _file in (self.wav_file, self.pcm_file):
+            if _file is not None:
+                _file.close()
+        self.wav_file = None
+        self.pcm_file = None
+
+        rm_file(enc_str(self.temp_file))
+        if self.closed:
+            rm_file(enc_str(self.audio_file))
+
+
+class EncoderSpawner(object):
+    """Hands out encoder processes for the configured output type and
+    keeps one spare process started ahead of time, so fork/exec of the
+    encoder is not on the critical path of the next track.  Once the
+    next track's metadata is resolved, the spare is started with its
+    tags if the encoder can write them"""
+
+    def __init__(self, args):
+        self.encoder = get_encoder(args.output_type)(args)
+        self.spare = None
+        # the track whose tags the spare writes, None for an untagged one
+        self.spare_uri = None
+        self.spare_hits = 0
+        self.spare_misses = 0
+
+    def tags_at_encode(self, metadata):
+        return metadata is not None and metadata.resolved and \
+            self.encoder.tags_at_encode
+
+    def acquire(self, audio_file, metadata=None):
+        """the spare encoder for ``audio_file`` unless it was started
+        with another track's tags, otherwise a new one"""
+        if self.spare_uri is not None and \
+                (metadata is None or metadata.uri != self.spare_uri):
+            self.discard_spare()
+
+        if self.spare is not None:
+            proc = self.spare
+            self.spare = None
+            self.spare_uri = None
+            self.spare_hits += 1
+        else:
+            proc = self.encoder.spawn(
+                metadata=metadata if self.tags_at_encode(metadata) else None)
+            self.spare_misses += 1
+        proc.bind(audio_file)
+        return proc
+
+    def prespawn(self, metadata=None):
+        """start the spare for the next track, with its tags if its
+        ``metadata`` is resolved"""
+        if self.tags_at_encode(metadata):
+            if self.spare_uri != metadata.uri:
+                self.discard_spare()
+                self.spare = self.encoder.spawn(metadata=metadata)
+                self.spare_uri = metadata.uri
+        elif self.spare is None:
+            self.spare = self.encoder.spawn()
+
+    def discard_spare(self):
+        if self.spare is not None:
+            self.spare.abort()
+            self.spare = None
+            self.spare_uri = None
+
+    def close(self):
+        self.discard_spare()
+
+        # remove temp directory if nothing else is using it
+        try:
+            os.rmdir(enc_str(temp_dir()))
+        except OSError:
+            pass
+
+
+@register_encoder
+class WavEncoder(Encoder):
+    output_type = "wav"
+
+    def open_file(self, audio_file_enc, proc):
+        # wave treats anything but a native string as a file object
+        if not isinstance(audio_file_enc, str):
+            audio_file_enc = audio_file_enc.decode("utf-8")
+        proc.wav_file = wave.open(audio_file_enc, "wb")
+        proc.wav_file.setparams((2, 2, 44100, 0, 'NONE', 'not compressed'))
+
+
+@register_encoder
+class PcmEncoder(Encoder):
+    output_type = "pcm"
+
+    def open_file(self, audio_file_enc, proc):
+        proc.pcm_file = open(audio_file_enc, 'wb')
+
+
+@register_encoder
+class FlacEncoder(Encoder):
+    output_type = "flac"
+    command = "flac"
+    package = "flac"
+    tags_at_encode = True
+    embeds_cover = True
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        args = self.args
+        return ["flac", "-f", ("-" + str(args.comp)), "--silent", "--endian",
+                "little", "--channels", "2", "--bps", "16", "--sample-rate",
+                "44100", "--sign", "signed"] + list(tag_args) + \
+            ["-o", audio_file_enc, "-"]
+
+    def tag_args(self, fields, cover_file):
+        tag_args = ["--no-utf8-convert"]
+        for key, value in fields.items():
+            tag_args.extend(["-T", tag_str(key + "=" + value)])
+        tagged = set(fields)
+        if cover_file is not None:
+            tag_args.extend(["--picture", picture_spec(cover_file)])
+            tagged.add("COVER")
+        return tag_args, tagged
+
+
+@register_encoder
+class AlacEncoder(Encoder):
+    output_type = "alac.m4a"
+    command = "avconv"
+    package = "libav-tools"
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        return ["avconv", "-nostats", "-loglevel", "0", "-f", "s16le", "-ar",
+                "44100", "-ac", "2", "-channel_layout", "stereo", "-i", "-",
+                "-acodec", "alac", audio_file_enc]
+
+
+@register_encoder
+class VorbisEncoder(Encoder):
+    output_type = "ogg"
+    command = "oggenc"
+    package = "vorbis-tools"
+    tags_at_encode = True
+    embeds_cover = True
+
+    # Linux's MAX_ARG_STRLEN, including the terminating NUL
+    max_arg_size = 128 * 1024
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        args = self.args
+        if args.cbr:
+            return ["oggenc", "--quiet", "--raw", "-b", args.bitrate] + \
+                list(tag_args) + ["-o", audio_file_enc, "-"]
+        else:
+            return ["oggenc", "--quiet", "--raw", "-q", args.vbr] + \
+                list(tag_args) + ["-o", audio_file_enc, "-"]
+
+    def tag_args(self, fields, cover_file):
+        tag_args = ["--utf8"]
+        for key, value in fields.items():
+            tag_args.extend(["-c", tag_str(key + "=" + value)])
+        tagged = set(fields)
+
+        # oggenc has no picture option, the cover is passed as a
+        # comment if it fits in a command line argument
+        if cover_file is not None:
+            pic = flac.Picture()
+            pic.type = 3
+            pic.mime = "image/jpeg"
+            pic.desc = "Front Cover"
+            with open(enc_str(cover_file), "rb") as f:
+                pic.data = f.read()
+            cover_arg = b"METADATA_BLOCK_PICTURE=" + \
+                base64.b64encode(pic.write())
+            if len(cover_arg) < self.max_arg_size:
+                tag_args.extend(["-c", cover_arg])
+                tagged.add("COVER")
+        return tag_args, tagged
+
+
+@register_encoder
+class OpusEncoder(Encoder):
+    output_type = "opus"
+    command = "opusenc"
+    package = "opus-tools"
+    tags_at_encode = True
+    embeds_cover = True
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        args = self.args
+        if args.cbr:
+            return ["opusenc", "--quiet", "--comp", args.comp, "--cvbr",
+                    "--bitrate", str(int(args.bitrate) / 2), "--raw",
+                    "--raw-rate", "44100"] + list(tag_args) + \
+                ["-", audio_file_enc]
+        else:
+            return ["opusenc", "--quiet", "--comp", args.comp, "--vbr",
+                    "--bitrate", args.vbr, "--raw", "--raw-rate",
+                    "44100"] + list(tag_args) + ["-", audio_file_enc]
+
+    def tag_args(self, fields, cover_file):
+        tag_args = []
+        for key, value in fields.items():
+            tag_args.extend(["--comment", tag_str(key + "=" + value)])
+        tagged = set(fields)
+        if cover_file is not None:
+            tag_args.extend(["--picture", picture_spec(cover_file)])
+            tagged.add("COVER")
+        return tag_args, tagged
+
+
+@register_encoder
+class AacEncoder(Encoder):
+    output_type = "aac"
+    command = "faac"
+    package = "faac"
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        args = self.args
+        if args.cbr:
+            return ["faac", "-P", "-X", "-b", args.bitrate, "-o",
+                    audio_file_enc, "-"]
+        else:
+            return ["faac", "-P", "-X", "-q", args.vbr, "-o",
+                    audio_file_enc, "-"]
+
+    def popen(self, audio_file_enc, stdin=PIPE, tag_args=()):
+        if self.dev_null is None:
+            self.dev_null = open(os.devnull, 'wb')
+        return Popen(self.command_line(audio_file_enc, tag_args),
+                     stdin=stdin, stdout=self.dev_null,
+                     stderr=self.dev_null)
+
+
+@register_encoder
+class Mp4Encoder(Encoder):
+    output_type = "m4a"
+    command = "fdkaac"
+    package = "fdk-aac-encoder"
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        args = self.args
+        if args.cbr:
+            return ["fdkaac", "-S", "-R", "-b",
+                    args.bitrate, "-o", audio_file_enc, "-"]
+        else:
+            return ["fdkaac", "-S", "-R", "-m", args.vbr,
+                    "-o", audio_file_enc, "-"]
+
+
+@register_encoder
+class LameEncoder(Encoder):
+    output_type = "mp3"
+    command = "lame"
+    package = "lame"
+    tags_at_encode = True
+    embeds_cover = True
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        args = self.args
+        lame_args = ["lame", "--silent"]
+
+        if args.stereo_mode is not None:
+            lame_args.extend(["-m", args.stereo_mode])
+
+        if args.cbr:
+            lame_args.extend(["-cbr", "-b", args.bitrate])
+        else:
+            lame_args.extend(["-V", args.vbr])
+
+        # always leave room in the ID3v2 tag, also when the file is
+        # tagged afterwards, so mutagen can save the tags in place
+        lame_args.extend(["--id3v2-only", "--pad-id3v2-size", "4096"])
+        lame_args.extend(tag_args)
+        lame_args.extend(["-h", "-r", "-", audio_file_enc])
+        return lame_args
+
+    def tag_args(self, fields, cover_file):
+        # lame's ID3 text is only reliable for ASCII and it has no
+        # multi-value genres, so those are left to mutagen
+        tag_args = []
+        if not all(is_ascii(value) for value in fields.values()):
+            return tag_args, set()
+
+        options = [("ALBUM", "--tl"), ("TITLE", "--tt"),
+                   ("ARTIST", "--ta"), ("YEAR", "--ty"),
+                   ("COMMENT", "--tc")]
+        tagged = set()
+        for key, option in options:
+            if key in fields:
+                tag_args.extend([option, fields[key]])
+                tagged.add(key)
+
+        def idx_of_total_str(idx, total):
+            return idx if total == "0" else idx + "/" + total
+
+        tag_args.extend(["--tn", idx_of_total_str(fields["TRACKNUMBER"],
+                                                  fields["TRACKTOTAL"])])
+        tag_args.extend(["--tv", "TPOS=" + idx_of_total_str(
+            fields["DISCNUMBER"], fields["DISCTOTAL"])])
+        tagged.update(["TRACKNUMBER", "TRACKTOTAL", "DISCNUMBER",
+                       "DISCTOTAL"])
+
+        if cover_file is not None:
+            tag_args.extend(["--ti", enc_str(cover_file)])
+            tagged.add("COVER")
+        return tag_args, tagged
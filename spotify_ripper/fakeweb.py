@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+"""A local stand-in for the Spotify Web API and charts API.
+
+Serves made-up but realistically shaped responses for the endpoints
+:class:`spotify_ripper.web.WebAPI` uses, with optional latency and
+injected 429/5xx errors, so the Web API code can be exercised and
+benchmarked without network access::
+
+    python -m spotify_ripper.fakeweb --port 8765 --latency 0.05
+    spotify-ripper --web-api-url http://127.0.0.1:8765/v1/ \\
+        --charts-url http://127.0.0.1:8765/charts/ ...
+"""
+
+from __future__ import unicode_literals
+
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+
+try:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+genre_names = ["rock", "pop", "jazz", "folk", "indie", "metal", "soul",
+               "house", "techno", "hip hop", "classical", "ambient"]
+
+
+def seed_of(spotify_id):
+    return int(hashlib.sha1(spotify_id.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def genres_of(spotify_id):
+    seed = seed_of(spotify_id)
+    return [genre_names[(seed + i) % len(genre_names)]
+            for i in range(seed % 3 + 1)]
+
+
+def artist_json(artist_id):
+    return {
+        "id": artist_id,
+        "uri": "spotify:artist:" + artist_id,
+        "name": "Artist " + artist_id,
+        "genres": genres_of(artist_id),
+    }
+
+
+def album_json(album_id):
+    artists = [artist_json("a" + album_id)]
+    if seed_of(album_id) % 4 == 0:
+        artists.append(artist_json("b" + album_id))
+    return {
+        "id": album_id,
+        "uri": "spotify:album:" + album_id,
+        "name": "Album " + album_id,
+        "album_type": "album",
+        "artists": artists,
+        "genres": genres_of(album_id),
+    }
+
+
+def artist_albums_json(artist_id, offset, limit):
+    # every artist has between 1 and 249 albums
+    total = seed_of(artist_id) % 249 + 1
+    items = [album_json(artist_id + "x" + str(i))
+             for i in range(offset, min(offset + limit, total))]
+    return {"items": items, "total": total, "offset": offset,
+            "limit": limit}
+
+
+def charts_json(metrics, region, recurrence, date, limit):
+    chart_id = "-".join((metrics, region, recurrence, date))
+    return {
+        "name": region + " " + metrics + " " + recurrence + " " + date,
+        "entries": {"items": [
+            {"current_position": i + 1,
+             "track": {"uri": "spotify:track:" + chart_id + "-" + str(i),
+                       "name": "Track " + str(i)}}
+            for i in range(limit)]},
+    }
+
+
+class FakeWebHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        if server.latency > 0:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+
+        fault = server.fault()
+        if fault == 429:
+            self.send_json(429, {"error": {"status": 429,
+                                           "message": "API rate limit "
+                                                      "exceeded"}},
+                           {"Retry-After": str(server.retry_after)})
+            return
+        elif fault is not None:
+            self.send_json(fault, {"error": {"status": fault,
+                                             "message": "Server error"}})
+            return
+
+        url = urlparse(self.path)
+        query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        body = self.route(url.path, query)
+        if body is None:
+            self.send_json(404, {"error": {"status": 404,
+                                           "message": "Not found"}})
+        else:
+            self.send_json(200, body)
+
+    def route(self, path, query):
+        ids = query.get("ids", "").split(",")
+
+        match = re.match(r"^/v1/artists/([^/]+)/albums/?$", path)
+        if match is not None:
+            return artist_albums_json(match.group(1),
+                                      int(query.get("offset", 0)),
+                                      int(query.get("limit", 20)))
+        match = re.match(r"^/v1/(artist|album)s/([^/]+)$", path)
+        if match is not None:
+            item_json = artist_json if match.group(1) == "artist" \
+                else album_json
+            return item_json(match.group(2))
+        match = re.match(r"^/v1/(artist|album)s/?$", path)
+        if match is not None:
+            item_json = artist_json if match.group(1) == "artist" \
+                else album_json
+            return {match.group(1) + "s": [item_json(_id) for _id in ids]}
+        if re.match(r"^/charts/?$", path) is not None:
+            return charts_json(query.get("type"), query.get("country"),
+                               query.get("recurrence"), query.get("date"),
+                               int(query.get("limit", 200)))
+        return None
+
+    def send_json(self, status, obj, headers=None):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class FakeWebServer(ThreadingMixIn, HTTPServer):
+    """The fake Web API on ``host:port`` (port 0 picks a free one).
+
+    Every request is delayed by ``latency`` seconds (+/- 50%), and fails
+    with a 429 (with ``Retry-After``) or a 503 with the given rates.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0,
+                 rate_429=0.0, rate_5xx=0.0, retry_after=1, verbose=False):
+        HTTPServer.__init__(self, (host, port), FakeWebHandler)
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return "http://%s:%d/" % self.server_address[:2]
+
+    @property
+    def api_url(self):
+        return self.base_url + "v1/"
+
+    @property
+    def charts_url(self):
+        return self.base_url + "charts/"
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def fault(self):
+        roll = random.random()
+        if roll < self.rate_429:
+            return 429
+        elif roll < self.rate_429 + self.rate_5xx:
+            return 503
+        return None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.name = 'SpotifyFakeWebThread'
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main(prog_args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(
+        prog='python -m spotify_ripper.fakeweb',
+        description='Local stand-in for the Spotify Web API and charts API')
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Average response delay in seconds')
+    parser.add_argument('--rate-429', type=float, default=0.0,
+                        help='Fraction of requests answered with a 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0,
+                        help='Fraction of requests answered with a 503')
+    parser.add_argument('--retry-after', type=int, default=1,
+                        help='Retry-After of the 429 responses in seconds')
+    args = parser.parse_args(prog_args)
+
+    server = FakeWebServer(args.host, args.port, args.latency,
+                           args.rate_429, args.rate_5xx, args.retry_after,
+                           verbose=True)
+    print("Web API at " + server.api_url)
+    print("Charts API at " + server.charts_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from colorama import Fore
+from spotify_ripper.utils import *
+import os
+import time
+import json
+import codecs
+import shutil
+import hashlib
+import threading
+
+
+class HTTPCache(object):
+    """On-disk cache of Web API responses, one json file per URL below
+    ``cache_dir``.
+
+    Entries keep the ``ETag``/``Last-Modified`` headers of the response
+    so a stale entry can be revalidated instead of downloaded again.
+    Once the cache grows past ``max_size`` bytes the least recently used
+    entries are removed.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.size = None
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def entry_file(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".json")
+
+    def get(self, url):
+        """the cached entry of the URL (fresh or not), or None"""
+        entry_file = self.entry_file(url)
+        try:
+            with codecs.open(enc_str(entry_file), 'r', "utf-8") as f:
+                entry = json.loads(f.read())
+            # last access time for the LRU eviction
+            os.utime(enc_str(entry_file), None)
+        except (IOError, OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def is_fresh(self, entry, ttl):
+        return entry["stored"] + ttl > time.time()
+
+    def put(self, url, body, headers=None):
+        headers = headers or {}
+        entry = {
+            "url": url,
+            "stored": time.time(),
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "body": body,
+        }
+        self.write_entry(entry)
+
+    def touch(self, entry):
+        """the server says the entry is still valid"""
+        entry["stored"] = time.time()
+        self.write_entry(entry)
+
+    def validators(self, entry):
+        """conditional request headers to revalidate the entry"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def write_entry(self, entry):
+        entry_file = self.entry_file(entry["url"])
+        entry_dir = os.path.dirname(entry_file)
+        data = json.dumps(entry)
+
+        with self.lock:
+            try:
+                if not path_exists(entry_dir):
+                    os.makedirs(enc_str(entry_dir))
+                old_size = os.path.getsize(enc_str(entry_file)) \
+                    if path_exists(entry_file) else 0
+
+                tmp_file = entry_file + "." + str(os.getpid()) + ".tmp"
+                with codecs.open(enc_str(tmp_file), 'w', "utf-8") as f:
+                    f.write(data)
+                shutil.move(enc_str(tmp_file), enc_str(entry_file))
+            except (IOError, OSError) as e:
+                print(Fore.YELLOW + "Warning: could not write to the Web API "
+                                    "cache " + self.cache_dir + Fore.RESET)
+                print(str(e))
+                return
+
+            if self.size is None:
+                self.size = self.current_size()
+            else:
+                self.size += os.path.getsize(enc_str(entry_file)) - old_size
+            if self.size > self.max_size:
+                self.evict()
+
+    def entries(self):
+        """(last access, size, file) of every cache entry"""
+        entries = []
+        if not path_exists(self.cache_dir):
+            return entries
+        for dir_path, dir_names, file_names in os.walk(
+                enc_str(self.cache_dir)):
+            for file_name in file_names:
+                if not file_name.endswith(b".json"):
+                    continue
+                entry_file = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(entry_file)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_file))
+        return entries
+
+    def current_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """remove the least recently used entries until the cache is back
+        to 3/4 of its maximum size"""
+        target = self.max_size * 3 // 4
+        for _, size, entry_file in sorted(self.entries()):
+            if self.size <= target:
+                break
+            rm_file(entry_file)
+            self.size -= size
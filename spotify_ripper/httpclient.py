@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.ratelimit import retry_after, backoff_delay
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    # Python 3
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+
+class InFlight(object):
+    """a request other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+class Batch(object):
+    """results of a :meth:`HTTPClient.map` call"""
+
+    def __init__(self, size):
+        self.results = [None] * size
+        self.errors = [None] * size
+        self.remaining = size
+        self.cond = threading.Condition()
+
+    def set(self, idx, result, error):
+        with self.cond:
+            self.results[idx] = result
+            self.errors[idx] = error
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.cond.notify_all()
+
+    def wait(self):
+        with self.cond:
+            while self.remaining > 0:
+                self.cond.wait()
+        for error in self.errors:
+            if error is not None:
+                raise error
+        return self.results
+
+
+class HTTPClient(object):
+    """HTTP client shared by all Web API calls.
+
+    Requests go through one ``requests.Session`` so connections are kept
+    alive, every request has a timeout, and concurrent GETs of the same
+    URL are coalesced into a single request whose response all callers
+    share.  :meth:`map` runs independent requests (e.g. the pages of a
+    listing) on ``num_workers`` threads.
+
+    Every request waits for the ``limiter``.  Throttled (429), 5xx and
+    failed requests are retried up to ``max_retries`` times, after the
+    server's ``Retry-After`` or with exponential backoff.
+    """
+
+    retry_status = (429, 500, 502, 503, 504)
+
+    def __init__(self, num_workers, timeout, limiter, max_retries=5):
+        self.num_workers = max(num_workers, 1)
+        self.timeout = timeout
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.num_workers,
+                              pool_maxsize=self.num_workers * 2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.retries = 0
+        # seconds slept before retrying a 5xx or failed request, the
+        # limiter's waits only count the rate limit and 429s
+        self.backoff = 0.0
+
+        self.queue = queue.Queue()
+        self.workers = []
+
+    def get(self, url, headers=None):
+        # conditional requests can get different answers
+        key = (url, tuple(sorted((headers or {}).items())))
+        with self.lock:
+            call = self.in_flight.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = InFlight()
+                self.in_flight[key] = call
+                self.requests += 1
+                leader = True
+
+        if leader:
+            try:
+                call.response = self.send(url, headers)
+            except requests.RequestException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.in_flight[key]
+                call.done.set()
+        return call.wait()
+
+    def send(self, url, headers):
+        limiter = self.limiter
+        attempt = 0
+        while True:
+            limiter.acquire()
+            try:
+                response = self.session.get(url, headers=headers,
+                                            timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                response = None
+
+            if response is not None and \
+                    (response.status_code not in self.retry_status or
+                     attempt >= self.max_retries):
+                return response
+
+            delay = retry_after(response) if response is not None else None
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if response is not None and response.status_code == 429:
+                limiter.pause(delay)
+            else:
+                with self.lock:
+                    self.backoff += delay
+                time.sleep(delay)
+            with self.lock:
+                self.retries += 1
+            attempt += 1
+
+    def map(self, func, items):
+        """``[func(item) for item in items]``, run on the worker threads"""
+        self.start_workers()
+        batch = Batch(len(items))
+        for idx, item in enumerate(items):
+            self.queue.put((func, item, idx, batch))
+        return batch.wait()
+
+    def start_workers(self):
+        with self.lock:
+            while len(self.workers) < self.num_workers:
+                thread = threading.Thread(target=self.worker)
+                thread.name = 'SpotifyWebThread'
+                thread.daemon = True
+                thread.start()
+                self.workers.append(thread)
+
+    def worker(self):
+        while True:
+            func, item, idx, batch = self.queue.get()
+            try:
+                batch.set(idx, func(item), None)
+            except Exception as e:
+                batch.set(idx, None, e)
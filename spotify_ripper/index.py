@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.utils import *
+import os
+import errno
+import shutil
+import threading
+
+
+class OutputIndex(object):
+    """In-memory index of the directories below the output directory.
+
+    A directory is listed once, the first time a path in it is looked
+    up, and its listing is kept up to date as files are added, moved or
+    removed.  Existence checks and directory creation below the output
+    directory are answered from the listings, so a large library (e.g.
+    on NFS) isn't stat'ed over and over, and only the directories that
+    are written to are ever listed.  Paths outside of it go to the file
+    system as before.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.normpath(root)
+        self.lock = threading.RLock()
+        # directory -> names in it, None if it doesn't exist
+        self.listings = {}
+
+    def key(self, path):
+        if isinstance(path, bytes):
+            path = path.decode("utf-8")
+        return os.path.normpath(path)
+
+    def is_indexed(self, path):
+        return path == self.root or \
+            path.startswith(self.root.rstrip(os.sep) + os.sep)
+
+    def listing(self, dir_path):
+        """the names in ``dir_path``, listed on first use"""
+        if dir_path in self.listings:
+            return self.listings[dir_path]
+
+        # no need to ask the file system if the parent is known not to
+        # contain it
+        names = None
+        if dir_path == self.root or \
+                self.contains(os.path.dirname(dir_path),
+                              os.path.basename(dir_path)):
+            try:
+                names = set(self.key(name)
+                            for name in os.listdir(enc_str(dir_path)))
+            except OSError:
+                names = None
+        self.listings[dir_path] = names
+        return names
+
+    def contains(self, dir_path, name):
+        names = self.listing(dir_path)
+        return names is not None and name in names
+
+    def lookup(self, path):
+        if path == self.root:
+            return self.listing(path) is not None
+        return self.contains(os.path.dirname(path), os.path.basename(path))
+
+    def exists(self, path):
+        path = self.key(path)
+        if not self.is_indexed(path):
+            return path_exists(path)
+
+        with self.lock:
+            return self.lookup(path)
+
+    def makedirs(self, path):
+        """create the directory (and its parents) unless the index already
+        knows about it"""
+        path = self.key(path)
+        if not self.is_indexed(path):
+            if not path_exists(path):
+                os.makedirs(enc_str(path))
+            return
+
+        with self.lock:
+            if self.listing(path) is not None:
+                return
+
+            try:
+                os.makedirs(enc_str(path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            # list the new directories again when they are next used
+            while self.is_indexed(path):
+                self.listings.pop(path, None)
+                if path == self.root:
+                    break
+                parent = os.path.dirname(path)
+                names = self.listings.get(parent)
+                if names is not None:
+                    names.add(os.path.basename(path))
+                    break
+                path = parent
+
+    def add(self, path):
+        """a file was written"""
+        path = self.key(path)
+        if self.is_indexed(path) and path != self.root:
+            with self.lock:
+                parent = os.path.dirname(path)
+                if parent not in self.listings:
+                    return
+                names = self.listings[parent]
+                if names is None:
+                    # created behind our back
+                    del self.listings[parent]
+                else:
+                    names.add(os.path.basename(path))
+
+    def discard(self, path):
+        """a file was removed"""
+        path = self.key(path)
+        if self.is_indexed(path) and path != self.root:
+            with self.lock:
+                names = self.listings.get(os.path.dirname(path))
+                if names is not None:
+                    names.discard(os.path.basename(path))
+
+    def refresh(self, paths):
+        """other processes may have written ``paths``, list their
+        directories (and the parents) again when they are next used"""
+        with self.lock:
+            for path in paths:
+                path = os.path.dirname(self.key(path))
+                while self.is_indexed(path):
+                    self.listings.pop(path, None)
+                    if path == self.root:
+                        break
+                    path = os.path.dirname(path)
+
+    def remove(self, path):
+        rm_file(enc_str(path))
+        self.discard(path)
+
+    def move(self, src, dst):
+        shutil.move(enc_str(src), enc_str(dst))
+        self.discard(src)
+        self.add(dst)
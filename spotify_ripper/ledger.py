@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from colorama import Fore
+from spotify_ripper.utils import *
+import os
+import time
+import sqlite3
+import threading
+
+
+def output_quality(args):
+    """the encoder settings of an output, a track ripped with different
+    settings is not considered done"""
+    quality = args.quality + "k"
+    if args.output_type in ("wav", "pcm", "alac.m4a"):
+        return quality
+    elif args.output_type == "flac":
+        return quality + " comp " + args.comp
+    elif args.cbr:
+        return quality + " cbr " + args.bitrate
+    else:
+        return quality + " vbr " + args.vbr
+
+
+class RipLedger(object):
+    """Records every finished rip in an SQLite database in the settings
+    directory, keyed by track URI and output format/quality.
+
+    Whether a track still needs to be ripped is looked up here by URI,
+    so done tracks can be skipped without loading them or formatting
+    their paths.  Writes are queued and committed ``batch_size`` at a
+    time in a single transaction.
+    """
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS rips ("
+        "uri TEXT NOT NULL, output_type TEXT NOT NULL, "
+        "quality TEXT NOT NULL, audio_file TEXT NOT NULL, "
+        "size INTEGER, duration INTEGER, completed REAL, "
+        "PRIMARY KEY (uri, output_type, quality))",
+        "CREATE TABLE IF NOT EXISTS failures ("
+        "uri TEXT PRIMARY KEY, count INTEGER, last_failed REAL)",
+    ]
+
+    def __init__(self, db_file, batch_size=50):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+
+        db_dir = os.path.dirname(db_file)
+        if not path_exists(db_dir):
+            os.makedirs(enc_str(db_dir))
+
+        # used from the finisher and spool threads, and by every session
+        # of a session pool
+        self.conn = sqlite3.connect(db_file, timeout=60,
+                                    check_same_thread=False)
+        with self.conn:
+            for statement in self.schema:
+                self.conn.execute(statement)
+
+    def done_files(self, uri, output_args):
+        """the files a track was ripped to for each output, or None if
+        any output hasn't been ripped with the current settings"""
+        audio_files = []
+        with self.lock:
+            for _args in output_args:
+                row = self.conn.execute(
+                    "SELECT audio_file FROM rips WHERE uri = ? AND "
+                    "output_type = ? AND quality = ?",
+                    (uri, _args.output_type, output_quality(_args))
+                ).fetchone()
+                if row is None:
+                    return None
+                audio_files.append(row[0])
+        return audio_files
+
+    def add_rip(self, uri, args, audio_file, duration):
+        try:
+            size = os.path.getsize(enc_str(audio_file))
+        except OSError:
+            size = None
+        self.queue(
+            ("INSERT OR REPLACE INTO rips VALUES (?, ?, ?, ?, ?, ?, ?)",
+             (uri, args.output_type, output_quality(args), audio_file,
+              size, duration, time.time())))
+        self.queue(("DELETE FROM failures WHERE uri = ?", (uri, )))
+
+    def add_failure(self, uri):
+        self.queue(
+            ("INSERT OR REPLACE INTO failures VALUES (?, "
+             "COALESCE((SELECT count FROM failures WHERE uri = ?), 0) + 1, "
+             "?)", (uri, uri, time.time())))
+
+    def queue(self, statement):
+        with self.lock:
+            self.pending.append(statement)
+            if len(self.pending) >= self.batch_size:
+                self.commit()
+
+    def flush(self):
+        with self.lock:
+            self.commit()
+
+    def commit(self):
+        if not self.pending:
+            return
+        try:
+            with self.conn:
+                for sql, params in self.pending:
+                    self.conn.execute(sql, params)
+        except sqlite3.Error as e:
+            print(Fore.YELLOW + "Warning: could not update the rip ledger " +
+                  self.db_file + Fore.RESET)
+            print(str(e))
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
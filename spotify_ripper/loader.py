@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+import threading
+import spotify
+
+
+class BatchLoader(object):
+    """Loads a whole window of tracks at once.
+
+    libspotify loads tracks in the background as soon as they are
+    created, so instead of blocking on ``track.load()`` one track at a
+    time we keep up to ``window_size`` tracks in flight, poll them
+    together and hand each one downstream as soon as it is ready.  A
+    track that isn't loaded within ``timeout`` seconds is given up on.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, window_size, timeout):
+        self.window_size = max(window_size, 1)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.timeouts = 0
+
+    def load(self, tracks):
+        """yields ``(idx, track, error)`` in the order the tracks finish
+        loading, ``error`` is None if the track loaded"""
+        pending = {}
+        next_idx = 0
+        while next_idx < len(tracks) or pending:
+            while next_idx < len(tracks) and len(pending) < self.window_size:
+                pending[next_idx] = time.time()
+                next_idx += 1
+
+            now = time.time()
+            finished = []
+            for idx, start_time in pending.items():
+                track = tracks[idx]
+                try:
+                    # a track that failed to load is never loaded
+                    spotify.Error.maybe_raise(
+                        track.error, ignores=[spotify.ErrorType.IS_LOADING])
+                    if track.is_loaded:
+                        self.add_latency(now - start_time)
+                        finished.append((idx, track, None))
+                    elif now - start_time > self.timeout:
+                        with self.lock:
+                            self.timeouts += 1
+                        finished.append(
+                            (idx, track, "Timeout while loading track"))
+                except spotify.Error as e:
+                    finished.append((idx, track, str(e)))
+
+            for idx, track, error in finished:
+                del pending[idx]
+                yield idx, track, error
+
+            if not finished:
+                time.sleep(self.poll_interval)
+
+    def add_latency(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def percentile(self, pct):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0
+        rank = int(round(pct / 100.0 * (len(latencies) - 1)))
+        return latencies[rank]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+import json
+import threading
+
+
+def approx_size(value):
+    """rough number of bytes a JSON-like value holds"""
+    try:
+        return len(json.dumps(value)) + 64
+    except (TypeError, ValueError):
+        return 1024
+
+
+class LRUCache(object):
+    """In-memory cache bounded by the approximate size of its values,
+    the least recently used values are evicted first"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            # most recently used at the end
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = approx_size(value)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size > self.max_size:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
@@ -5,11 +5,15 @@ from __future__ import unicode_literals
 
 from colorama import init, Fore, AnsiToWin32
 from spotify_ripper.ripper import Ripper
+from spotify_ripper.encoders import get_encoder
+from spotify_ripper.sessions import SessionPool
+from spotify_ripper.template import PathTemplate
 from spotify_ripper.utils import *
 import os
 import sys
 import codecs
 import argparse
+import copy
 import pkg_resources
 import schedule
 import signal
@@ -92,6 +96,132 @@ def patch_bug_in_mutagen():
         MP4Tags._MP4Tags__parse_cover, MP4Tags.__fixed_render_cover)
 
 
+def set_output_type(args, output_type):
+    """set the output type and its default quality settings"""
+    args.output_type = output_type
+    if output_type == "flac":
+        if args.comp == "10":
+            args.comp = "8"
+    elif output_type == "ogg":
+        if args.vbr == "0":
+            args.vbr = "10"
+    elif output_type == "opus":
+        if args.vbr == "0":
+            args.vbr = "320"
+    elif output_type == "aac":
+        if args.vbr == "0":
+            args.vbr = "500"
+    elif output_type == "m4a":
+        if args.vbr == "0":
+            args.vbr = "5"
+
+
+def parse_outputs(args):
+    """build a copy of args for each --outputs entry (e.g. mp3:V0,flac:8),
+    or a list with just args if --outputs isn't used"""
+    if args.outputs is None:
+        return [args]
+
+    output_types = {
+        "mp3": "mp3",
+        "flac": "flac",
+        "alac": "alac.m4a",
+        "ogg": "ogg",
+        "vorbis": "ogg",
+        "opus": "opus",
+        "aac": "aac",
+        "m4a": "m4a",
+        "mp4": "m4a",
+        "wav": "wav",
+        "pcm": "pcm",
+    }
+
+    output_args = []
+    for idx, spec in enumerate(args.outputs.split(",")):
+        tokens = spec.strip().split(":", 1)
+        output_type = output_types.get(tokens[0].lower())
+        if output_type is None:
+            print(Fore.RED + "Unknown output type '" + tokens[0] +
+                  "' in --outputs, valid types are: " +
+                  ", ".join(sorted(output_types.keys())) + Fore.RESET)
+            sys.exit(1)
+
+        _args = copy.copy(args)
+        set_output_type(_args, output_type)
+
+        # V<n> is a VBR quality, anything else is the compression
+        # level for FLAC, the target bitrate for Opus and a CBR
+        # bitrate for the other encoders
+        if len(tokens) > 1 and tokens[1]:
+            quality = tokens[1]
+            if quality[0] in "vV":
+                _args.cbr = False
+                _args.vbr = quality[1:]
+            elif output_type == "flac":
+                _args.comp = quality
+            elif output_type == "opus":
+                _args.cbr = False
+                _args.vbr = quality
+            else:
+                _args.cbr = True
+                _args.bitrate = quality
+
+        # each output can have its own format string
+        if idx < len(args.format):
+            _args.format = [args.format[idx]]
+        else:
+            _args.format = [args.format[0]]
+
+        output_args.append(_args)
+
+    return output_args
+
+
+def rip(args):
+    ripper = Ripper(args)
+    ripper.start()
+
+    # try to listen for terminal resize events
+    # (needs to be called on main thread)
+    if not args.has_log:
+        ripper.progress.handle_resize()
+        signal.signal(signal.SIGWINCH, ripper.progress.handle_resize)
+
+    def abort(set_logged_in=False):
+        ripper.abort_rip()
+        if set_logged_in:
+            ripper.ripper_continue.set()
+        ripper.join()
+        sys.exit(1)
+
+    # login on main thread to catch any KeyboardInterrupt
+    try:
+        if not ripper.login():
+            print(
+                Fore.RED + "Encountered issue while logging into "
+                           "Spotify, aborting..." + Fore.RESET)
+            abort(set_logged_in=True)
+        else:
+            ripper.ripper_continue.set()
+
+    except (KeyboardInterrupt, Exception) as e:
+        if not isinstance(e, KeyboardInterrupt):
+            print(str(e))
+        print("\n" + Fore.RED + "Aborting..." + Fore.RESET)
+        abort(set_logged_in=True)
+
+    # wait for ripping thread to finish
+    try:
+        while ripper.isAlive():
+            schedule.run_pending()
+            ripper.join(0.1)
+    except (KeyboardInterrupt, Exception) as e:
+        if not isinstance(e, KeyboardInterrupt):
+            print(str(e))
+        print("\n" + Fore.RED + "Aborting..." + Fore.RESET)
+        abort()
+
+
 def main(prog_args=sys.argv[1:]):
     # in case we changed the location of the settings directory where the
     # config file lives, we need to parse this argument before we parse
@@ -111,9 +241,30 @@ def main(prog_args=sys.argv[1:]):
         "quality": "320",
         "comp": "10",
         "vbr": "0",
+        "buffer_size": "8",
+        "write_size": "256",
+        "pipeline": "0",
+        "tag_workers": "1",
+        "prefetch": "2",
+        "sessions": "1",
+        "load_window": "100",
+        "load_timeout": "10",
+        "metadata_ttl": "168",
+        "web_api_url": "https://api.spotify.com/v1/",
+        "charts_url": "https://spotifycharts.com/api/",
+        "web_cache_size": "100",
+        "web_memory_size": "16",
+        "web_rate": "10",
+        "web_retries": "5",
+        "web_timeout": "10",
+        "web_workers": "4",
     }
     defaults = load_config(defaults)
 
+    # --format can be given more than once, so a format string from the
+    # config file is only used if there is none on the command line
+    config_format = defaults.pop("format", None)
+
     parser = argparse.ArgumentParser(
         prog='spotify-ripper',
         description='Rips Spotify URIs to MP3s with ID3 tags and album covers',
@@ -162,8 +313,17 @@ def main(prog_args=sys.argv[1:]):
              'encoding [Default=utf-8]')
     parser.add_argument(
         '-b', '--bitrate', help='CBR bitrate [Default=320]')
+    parser.add_argument(
+        '--buffer-size',
+        help='Size in MB of the audio buffer between Spotify and the '
+             'encoder. When full, Spotify is asked to deliver the audio '
+             'again later [Default=8]')
     parser.add_argument(
         '-c', '--cbr', action='store_true', help='CBR encoding [Default=VBR]')
+    parser.add_argument(
+        '--charts-url',
+        help='Base URL of the Spotify charts API, e.g. a local test server '
+             '[Default=https://spotifycharts.com/api/]')
     parser.add_argument(
         '--comp', default="10",
         help='compression complexity for FLAC and Opus [Default=Max]')
@@ -175,18 +335,32 @@ def main(prog_args=sys.argv[1:]):
         '--cover-file', nargs=1,
         help='Save album cover image to file name (e.g "cover.jpg") '
              '[Default=embed]')
+    parser.add_argument(
+        '--cover-quality',
+        help='Recompress cover images to this JPEG quality (1-95) before '
+             'they are embedded, needs Pillow [Default=original]')
+    parser.add_argument(
+        '--cover-size',
+        help='Downscale cover images to at most this many pixels wide and '
+             'high before they are embedded, needs Pillow '
+             '[Default=original]')
     parser.add_argument(
         '-d', '--directory', nargs=1,
         help='Base directory where ripped MP3s are saved [Default=cwd]')
     parser.add_argument(
         '--fail-log', nargs=1,
         help="Logs the list of track URIs that failed to rip")
+    parser.add_argument(
+        '--encode-workers',
+        help='Number of tracks encoded in parallel from the spool '
+             '[Default=number of CPUs]')
     encoding_group.add_argument(
         '--flac', action='store_true',
         help='Rip songs to lossless FLAC encoding instead of MP3')
     parser.add_argument(
-        '-f', '--format', nargs=1,
-        help='Save songs using this path and filename structure (see README)')
+        '-f', '--format', action='append',
+        help='Save songs using this path and filename structure (see README). '
+             'Can be given once per --outputs entry')
     parser.add_argument(
         '--flat', action='store_true',
         help='Save all songs to a single directory '
@@ -216,12 +390,29 @@ def main(prog_args=sys.argv[1:]):
     group.add_argument(
         '-l', '--last', action='store_true',
         help='Use last login credentials')
+    parser.add_argument(
+        '--load-timeout',
+        help='Seconds to wait for a track to load before skipping it '
+             '[Default=10]')
+    parser.add_argument(
+        '--load-window',
+        help='Number of tracks loaded from Spotify at the same time '
+             '[Default=100]')
     parser.add_argument(
         '-L', '--log', nargs=1,
         help='Log in a log-friendly format to a file (use - to log to stdout)')
     encoding_group.add_argument(
         '--pcm', action='store_true',
         help='Saves a .pcm file with the raw PCM data instead of MP3')
+    parser.add_argument(
+        '--mirror-charts', action='store_true',
+        help='Fetch all the given charts URIs at once, compare each with '
+             'its last snapshot and rip every track only once (implies '
+             '--playlist-m3u)')
+    parser.add_argument(
+        '--metadata-ttl',
+        help='Hours track metadata (including unavailable tracks) is '
+             'reused from the local metadata store [Default=168]')
     encoding_group.add_argument(
         '--mp4', action='store_true',
         help='Rip songs to MP4/M4A format with Fraunhofer FDK AAC codec '
@@ -239,6 +430,16 @@ def main(prog_args=sys.argv[1:]):
     encoding_group.add_argument(
         '--opus', action='store_true',
         help='Rip songs to Opus encoding instead of MP3')
+    encoding_group.add_argument(
+        '--outputs',
+        help='Rip each song to several formats at once from a single '
+             'stream, as a comma separated list of type[:quality] '
+             '(e.g. mp3:V0,flac:8,opus:160)')
+    parser.add_argument(
+        '--pipeline',
+        help='Start ripping the next track while up to this many finished '
+             'tracks are still being encoded, tagged and post-processed in '
+             'the background [Default=0]')
     parser.add_argument(
         '--playlist-m3u', action='store_true',
         help='create a m3u file when ripping a playlist')
@@ -248,6 +449,11 @@ def main(prog_args=sys.argv[1:]):
     parser.add_argument(
         '--playlist-sync', action='store_true',
         help='Sync playlist songs (rename and remove old songs)')
+    parser.add_argument(
+        '--prefetch',
+        help='Number of upcoming tracks whose metadata and cover art are '
+             'fetched while the current track is ripping, 0 to disable '
+             '[Default=2]')
     parser.add_argument(
         '-q', '--vbr',
         help='VBR quality setting or target bitrate for Opus [Default=0]')
@@ -260,6 +466,10 @@ def main(prog_args=sys.argv[1:]):
              'after stopping (e.g. 1h30m). Alternatively, accepts a specific '
              'time in 24hr format to start after (e.g 03:30, 16:15). '
              'Requires --stop-after option to be set')
+    parser.add_argument(
+        '--refresh-metadata', action='store_true',
+        help='Load all track metadata from Spotify again instead of using '
+             'the local metadata store')
     parser.add_argument(
         '-R', '--replace', nargs="+", required=False,
         help='pattern to replace the output filename separated by "/". '
@@ -269,6 +479,20 @@ def main(prog_args=sys.argv[1:]):
     parser.add_argument(
         '-s', '--strip-colors', action='store_true',
         help='Strip coloring from output [Default=colors]')
+    parser.add_argument(
+        '--sessions',
+        help='Number of Spotify sessions ripping at the same time, each in '
+             'its own process with its own settings directory '
+             '[Default=1]')
+    parser.add_argument(
+        '--session-users', nargs="+",
+        help='Spotify usernames for the --sessions, one per session '
+             '[Default=the --user account for every session]')
+    parser.add_argument(
+        '--spool', nargs=1,
+        help='Rip songs to raw PCM in this directory first and encode them '
+             'to the output format in the background. Songs left in the '
+             'spool by an interrupted run are encoded on the next run')
     parser.add_argument(
         '--stereo-mode', choices=['j', 's', 'f', 'd', 'm', 'l', 'r'],
         help='Advanced stereo settings for Lame MP3 encoder only')
@@ -279,6 +503,50 @@ def main(prog_args=sys.argv[1:]):
              'format to stop after (e.g 03:30, 16:15)')
     parser.add_argument(
         '-V', '--version', action='version', version=prog_version)
+    parser.add_argument(
+        '--verify-ledger', action='store_true',
+        help='Only skip songs the rip ledger has as done if their files '
+             'still exist [Default=trust the ledger]')
+    parser.add_argument(
+        '--tag-workers',
+        help='Number of background threads that tag finished files '
+             '(0 tags each file before ripping the next track) [Default=1]')
+    parser.add_argument(
+        '--write-size',
+        help='Amount of audio in KB collected before it is written to the '
+             'encoder in a single batch [Default=256]')
+    parser.add_argument(
+        '--web-api-url',
+        help='Base URL of the Spotify Web API, e.g. a local test server '
+             '[Default=https://api.spotify.com/v1/]')
+    parser.add_argument(
+        '--web-cache-size',
+        help='Maximum size in MB of the on-disk cache of Web API responses '
+             '(0 disables it) [Default=100]')
+    parser.add_argument(
+        '--web-memory-size',
+        help='Maximum size in MB of the in-memory cache of Web API results '
+             '[Default=16]')
+    parser.add_argument(
+        '--web-offline', action='store_true',
+        help='Only use Web API responses from the on-disk cache, no matter '
+             'how old, and never contact the Web API')
+    parser.add_argument(
+        '--web-rate',
+        help='Maximum number of Web API requests per second, 0 for no '
+             'limit [Default=10]')
+    parser.add_argument(
+        '--web-retries',
+        help='Number of times a throttled or failed Web API request is '
+             'retried [Default=5]')
+    parser.add_argument(
+        '--web-timeout',
+        help='Seconds to wait for the Web API before giving up on a '
+             'request [Default=10]')
+    parser.add_argument(
+        '--web-workers',
+        help='Number of Web API requests made in parallel, e.g. for the '
+             'pages of an artist\'s albums [Default=4]')
     encoding_group.add_argument(
         '--wav', action='store_true',
         help='Rip songs to uncompressed WAV file instead of MP3')
@@ -336,57 +604,31 @@ def main(prog_args=sys.argv[1:]):
         sys.exit(1)
 
     if args.wav:
-        args.output_type = "wav"
+        set_output_type(args, "wav")
     elif args.pcm:
-        args.output_type = "pcm"
+        set_output_type(args, "pcm")
     elif args.flac:
-        args.output_type = "flac"
-        if args.comp == "10":
-            args.comp = "8"
+        set_output_type(args, "flac")
     elif args.vorbis:
-        args.output_type = "ogg"
-        if args.vbr == "0":
-            args.vbr = "10"
+        set_output_type(args, "ogg")
     elif args.opus:
-        args.output_type = "opus"
-        if args.vbr == "0":
-            args.vbr = "320"
+        set_output_type(args, "opus")
     elif args.aac:
-        args.output_type = "aac"
-        if args.vbr == "0":
-            args.vbr = "500"
+        set_output_type(args, "aac")
     elif args.mp4:
-        args.output_type = "m4a"
-        if args.vbr == "0":
-            args.vbr = "5"
+        set_output_type(args, "m4a")
     elif args.alac:
-        args.output_type = "alac.m4a"
+        set_output_type(args, "alac.m4a")
     else:
-        args.output_type = "mp3"
+        set_output_type(args, "mp3")
 
-    # check that encoder tool is available
-    encoders = {
-        "flac": ("flac", "flac"),
-        "aac": ("faac", "faac"),
-        "ogg": ("oggenc", "vorbis-tools"),
-        "opus": ("opusenc", "opus-tools"),
-        "mp3": ("lame", "lame"),
-        "m4a": ("fdkaac", "fdk-aac-encoder"),
-        "alac.m4a": ("avconv", "libav-tools"),
-    }
-    if args.output_type in encoders.keys():
-        encoder = encoders[args.output_type][0]
-        if which(encoder) is None:
-            print(Fore.RED + "Missing dependency '" + encoder +
-                  "'.  Please install and add to path..." + Fore.RESET)
-            # assumes OS X or Ubuntu/Debian
-            command_help = ("brew install " if sys.platform == "darwin"
-                            else "sudo apt-get install ")
-            print("...try " + Fore.YELLOW + command_help +
-                  encoders[args.output_type][1] + Fore.RESET)
-            sys.exit(1)
+    # a mirrored chart is a m3u of the (shared) chart tracks
+    if args.mirror_charts:
+        args.playlist_m3u = True
 
     # format string
+    if args.format is None:
+        args.format = config_format
     if args.flat:
         args.format = ["{artist} - {track_name}.{ext}"]
     elif args.flat_with_index:
@@ -394,10 +636,33 @@ def main(prog_args=sys.argv[1:]):
     elif args.format is None:
         args.format = ["{album_artist}/{album}/{artist} - {track_name}.{ext}"]
 
+    # one set of encoder settings per output file
+    args.output_args = parse_outputs(args)
+    if args.outputs is not None:
+        args.output_type = args.output_args[0].output_type
+
+    # parse the format strings and --replace rules once
+    for output_args in args.output_args:
+        output_args.path_template = PathTemplate(
+            output_args.format[0].strip(), output_args.replace)
+
+    # check that encoder tool is available
+    for output_args in args.output_args:
+        encoder = get_encoder(output_args.output_type)
+        if not encoder.is_available():
+            print(Fore.RED + "Missing dependency '" + encoder.command +
+                  "'.  Please install and add to path..." + Fore.RESET)
+            # assumes OS X or Ubuntu/Debian
+            command_help = ("brew install " if sys.platform == "darwin"
+                            else "sudo apt-get install ")
+            print("...try " + Fore.YELLOW + command_help +
+                  encoder.package + Fore.RESET)
+            sys.exit(1)
+
     # print some settings
     print(Fore.GREEN + "Spotify Ripper - v" + prog_version + Fore.RESET)
 
-    def encoding_output_str():
+    def encoding_output_str(args):
         if args.output_type == "wav":
             return "WAV, Stereo 16bit 44100Hz"
         elif args.output_type == "pcm":
@@ -425,8 +690,9 @@ def main(prog_args=sys.argv[1:]):
             else:
                 return codec + ", VBR " + args.vbr
 
-    print(Fore.YELLOW + "  Encoding output:\t" +
-          Fore.RESET + encoding_output_str())
+    for output_args in args.output_args:
+        print(Fore.YELLOW + "  Encoding output:\t" +
+              Fore.RESET + encoding_output_str(output_args))
     print(Fore.YELLOW + "  Spotify bitrate:\t" +
           Fore.RESET + args.quality + " kbps")
 
@@ -455,56 +721,22 @@ def main(prog_args=sys.argv[1:]):
     print(Fore.YELLOW + "  Settings directory:\t" + Fore.RESET +
           settings_dir())
 
-    print(Fore.YELLOW + "  Format String:\t" + Fore.RESET + args.format[0])
+    for output_args in args.output_args:
+        print(Fore.YELLOW + "  Format String:\t" + Fore.RESET +
+              output_args.format[0])
     print(Fore.YELLOW + "  Overwrite files:\t" +
           Fore.RESET + ("Yes" if args.overwrite else "No"))
 
     # patch a bug when Python 3/MP4
-    if sys.version_info >= (3, 0) and args.output_type == "m4a":
+    if sys.version_info >= (3, 0) and \
+            "m4a" in [_args.output_type for _args in args.output_args]:
         patch_bug_in_mutagen()
 
-    ripper = Ripper(args)
-    ripper.start()
-
-    # try to listen for terminal resize events
-    # (needs to be called on main thread)
-    if not args.has_log:
-        ripper.progress.handle_resize()
-        signal.signal(signal.SIGWINCH, ripper.progress.handle_resize)
-
-    def abort(set_logged_in=False):
-        ripper.abort_rip()
-        if set_logged_in:
-            ripper.ripper_continue.set()
-        ripper.join()
-        sys.exit(1)
-
-    # login on main thread to catch any KeyboardInterrupt
-    try:
-        if not ripper.login():
-            print(
-                Fore.RED + "Encountered issue while logging into "
-                           "Spotify, aborting..." + Fore.RESET)
-            abort(set_logged_in=True)
-        else:
-            ripper.ripper_continue.set()
-
-    except (KeyboardInterrupt, Exception) as e:
-        if not isinstance(e, KeyboardInterrupt):
-            print(str(e))
-        print("\n" + Fore.RED + "Aborting..." + Fore.RESET)
-        abort(set_logged_in=True)
-
-    # wait for ripping thread to finish
-    try:
-        while ripper.isAlive():
-            schedule.run_pending()
-            ripper.join(0.1)
-    except (KeyboardInterrupt, Exception) as e:
-        if not isinstance(e, KeyboardInterrupt):
-            print(str(e))
-        print("\n" + Fore.RED + "Aborting..." + Fore.RESET)
-        abort()
+    args.session_worker = None
+    if int(args.sessions) > 1:
+        SessionPool(args, int(args.sessions), rip).run()
+    else:
+        rip(args)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from colorama import Fore
+from spotify_ripper.utils import *
+import os
+import time
+import json
+import sqlite3
+import threading
+
+
+class TrackInfo(object):
+    """The track metadata planning and path formatting need, either read
+    from a loaded track or from the :class:`MetadataStore`"""
+
+    __slots__ = ("uri", "name", "artists", "album", "album_year", "disc",
+                 "index", "duration", "availability", "artist_uri",
+                 "album_uri")
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.name = None
+        self.artists = []
+        self.album = None
+        self.album_year = 0
+        self.disc = 0
+        self.index = 0
+        self.duration = 0
+        self.availability = 0
+        self.artist_uri = None
+        self.album_uri = None
+
+    @classmethod
+    def from_track(cls, track):
+        info = cls(track.link.uri)
+        info.availability = track.availability
+        if info.availability != 1:
+            return info
+
+        info.name = track.name
+        info.artists = [artist.name for artist in track.artists]
+        info.album = track.album.name
+        info.album_year = track.album.year
+        info.disc = track.disc
+        info.index = track.index
+        info.duration = track.duration
+        if track.artists:
+            info.artist_uri = track.artists[0].link.uri
+        info.album_uri = track.album.link.uri
+        return info
+
+    @property
+    def available(self):
+        return self.availability == 1
+
+
+class AlbumInfo(object):
+    """What tagging, paths and playlist names need from an album, read
+    from a loaded album browser or from the :class:`MetadataStore`"""
+
+    __slots__ = ("uri", "name", "artist", "year", "num_discs",
+                 "disc_tracks", "cover_uri")
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.name = None
+        self.artist = None
+        self.year = 0
+        self.num_discs = 0
+        self.disc_tracks = {}
+        self.cover_uri = None
+
+    @classmethod
+    def from_browser(cls, album_browser):
+        album = album_browser.album
+        info = cls(album.link.uri)
+        info.name = album.name
+        info.artist = album.artist.name if album.artist is not None \
+            else None
+        info.year = album.year
+
+        # number of tracks of each disc and number of discs
+        for track in album_browser.tracks:
+            info.disc_tracks[track.disc] = max(
+                info.disc_tracks.get(track.disc, 0), track.index)
+            info.num_discs = max(info.num_discs, track.disc)
+
+        cover_link = album.cover_link()
+        if cover_link is not None:
+            info.cover_uri = cover_link.uri
+        return info
+
+    def num_tracks(self, disc):
+        return self.disc_tracks.get(disc, 0)
+
+
+class MetadataStore(object):
+    """Persistent cache of :class:`TrackInfo` records in an SQLite
+    database in the settings directory.
+
+    Records are kept for ``ttl`` seconds, including the ones of
+    unavailable tracks, so repeated runs over the same playlists don't
+    have to load the tracks from Spotify again.  ``refresh`` ignores the
+    stored records (and replaces them as tracks load).
+
+    :class:`AlbumInfo` records are kept the same way, so an album is
+    only browsed once for all of its tracks.
+    """
+
+    columns = ("uri", "name", "artists", "album", "album_year", "disc",
+               "idx", "duration", "availability", "updated", "artist_uri",
+               "album_uri")
+
+    def __init__(self, db_file, ttl, refresh=False, batch_size=100):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.refresh = refresh
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pending = []
+        self.hits = 0
+        self.misses = 0
+        # albums of this run, they are looked up for every track
+        self.albums = {}
+        self.album_hits = 0
+        self.album_misses = 0
+
+        db_dir = os.path.dirname(db_file)
+        if not path_exists(db_dir):
+            os.makedirs(enc_str(db_dir))
+
+        self.conn = sqlite3.connect(db_file, timeout=60,
+                                    check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "uri TEXT PRIMARY KEY, name TEXT, artists TEXT, album TEXT, "
+                "album_year INTEGER, disc INTEGER, idx INTEGER, "
+                "duration INTEGER, availability INTEGER, updated REAL, "
+                "artist_uri TEXT, album_uri TEXT)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS albums ("
+                "uri TEXT PRIMARY KEY, name TEXT, artist TEXT, "
+                "year INTEGER, num_discs INTEGER, disc_tracks TEXT, "
+                "cover_uri TEXT, updated REAL)")
+            # stores created before the artist/album URIs were kept
+            existing = set(row[1] for row in self.conn.execute(
+                "PRAGMA table_info(tracks)"))
+            for column in ("artist_uri", "album_uri"):
+                if column not in existing:
+                    self.conn.execute(
+                        "ALTER TABLE tracks ADD COLUMN " + column + " TEXT")
+
+    def get(self, uri, ignore_ttl=False):
+        """the stored record of the track, None if there is none or it is
+        older than the TTL"""
+        if self.refresh and not ignore_ttl:
+            return None
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT " + ", ".join(self.columns) +
+                " FROM tracks WHERE uri = ?", (uri, )).fetchone()
+            if row is None or (not ignore_ttl and
+                               row[9] < time.time() - self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        info = TrackInfo(row[0])
+        info.name = row[1]
+        info.artists = json.loads(row[2]) if row[2] else []
+        info.album = row[3]
+        info.album_year = row[4]
+        info.disc = row[5]
+        info.index = row[6]
+        info.duration = row[7]
+        info.availability = row[8]
+        info.artist_uri = row[10]
+        info.album_uri = row[11]
+        return info
+
+    def put(self, info):
+        with self.lock:
+            self.pending.append(
+                (info.uri, info.name, json.dumps(info.artists), info.album,
+                 info.album_year, info.disc, info.index, info.duration,
+                 int(info.availability), time.time(), info.artist_uri,
+                 info.album_uri))
+            if len(self.pending) >= self.batch_size:
+                self.commit()
+
+    def get_album(self, uri):
+        """the album record, None if there is none or it is older than
+        the TTL"""
+        with self.lock:
+            info = self.albums.get(uri)
+            if info is not None:
+                self.album_hits += 1
+                return info
+            if self.refresh:
+                self.album_misses += 1
+                return None
+
+            row = self.conn.execute(
+                "SELECT uri, name, artist, year, num_discs, disc_tracks, "
+                "cover_uri, updated FROM albums WHERE uri = ?",
+                (uri, )).fetchone()
+            if row is None or row[7] < time.time() - self.ttl:
+                self.album_misses += 1
+                return None
+            self.album_hits += 1
+
+            info = AlbumInfo(row[0])
+            info.name = row[1]
+            info.artist = row[2]
+            info.year = row[3]
+            info.num_discs = row[4]
+            # json keys are strings
+            info.disc_tracks = dict(
+                (int(disc), num)
+                for disc, num in json.loads(row[5] or "{}").items())
+            info.cover_uri = row[6]
+            self.albums[uri] = info
+            return info
+
+    def put_album(self, info):
+        with self.lock:
+            self.albums[info.uri] = info
+            try:
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO albums VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?)",
+                        (info.uri, info.name, info.artist, info.year,
+                         info.num_discs, json.dumps(info.disc_tracks),
+                         info.cover_uri, time.time()))
+            except sqlite3.Error as e:
+                print(Fore.YELLOW + "Warning: could not update the metadata "
+                                    "store " + self.db_file + Fore.RESET)
+                print(str(e))
+
+    def flush(self):
+        with self.lock:
+            self.commit()
+
+    def commit(self):
+        if not self.pending:
+            return
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO tracks VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self.pending)
+        except sqlite3.Error as e:
+            print(Fore.YELLOW + "Warning: could not update the metadata "
+                                "store " + self.db_file + Fore.RESET)
+            print(str(e))
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from colorama import Fore
+import threading
+
+
+class RipJob(object):
+    """Everything needed to finish a track once its audio has been
+    handed to the encoder"""
+
+    def __init__(self, idx, track, metadata, encoders, audio_files):
+        self.idx = idx
+        self.track = track
+        self.metadata = metadata
+        self.encoders = encoders
+        self.audio_files = audio_files
+
+    def close(self):
+        """close the encoders' input and wait for the output to be
+        written"""
+        for encoder in self.encoders:
+            encoder.close()
+        print(Fore.GREEN + 'Rip complete' + Fore.RESET)
+
+
+class TrackFinisher(object):
+    """Runs ``finish_func`` for finished tracks.
+
+    With ``max_in_flight`` of 0, jobs are finished synchronously.
+    Otherwise each job gets its own thread so the next track can start
+    streaming right away, and :meth:`submit` blocks while
+    ``max_in_flight`` jobs are still running.
+    """
+
+    def __init__(self, max_in_flight, finish_func):
+        self.max_in_flight = max_in_flight
+        self.finish_func = finish_func
+        self.slots = threading.BoundedSemaphore(max(max_in_flight, 1))
+        self.threads = []
+
+    def submit(self, job):
+        if self.max_in_flight <= 0:
+            self.finish_func(job)
+            return
+
+        self.slots.acquire()
+        thread = threading.Thread(target=self._run, args=(job, ))
+        thread.name = 'SpotifyFinisherThread'
+        thread.start()
+        self.threads = [t for t in self.threads if t.is_alive()]
+        self.threads.append(thread)
+
+    def _run(self, job):
+        try:
+            self.finish_func(job)
+        finally:
+            self.slots.release()
+
+    def in_flight(self):
+        return len([t for t in self.threads if t.is_alive()])
+
+    def wait(self):
+        """block until all submitted jobs are finished"""
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
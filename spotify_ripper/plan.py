@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.metadata import TrackInfo
+import spotify
+
+
+class TrackPlan(object):
+    """What we know about a track after planning.
+
+    Filled in once per track so the later stages (totals, ripping, sync,
+    playlist files) read these fields instead of going back to
+    libspotify or formatting the output paths again.  ``track`` is only
+    kept for playback and tagging.
+    """
+
+    __slots__ = ("idx", "uri", "track", "title", "artist", "album", "disc",
+                 "index", "duration", "available", "error", "audio_files",
+                 "skip")
+
+    def __init__(self, idx, track):
+        self.idx = idx
+        self.uri = None
+        self.track = track
+        self.title = None
+        self.artist = None
+        self.album = None
+        self.disc = 0
+        self.index = 0
+        self.duration = 0
+        self.available = False
+        self.error = None
+        self.audio_files = None
+        self.skip = False
+
+    @property
+    def audio_file(self):
+        return self.audio_files[0] if self.audio_files else None
+
+    def files_exist(self, output_index):
+        return bool(self.audio_files) and \
+            all(output_index.exists(f) for f in self.audio_files)
+
+
+class UriPlan(object):
+    """The tracks of one input URI and the playlist, album or chart they
+    came from"""
+
+    __slots__ = ("uri", "playlist", "album", "chart", "tracks")
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.playlist = None
+        self.album = None
+        self.chart = None
+        self.tracks = []
+
+
+class Planner(object):
+    """Resolves the input URIs into :class:`UriPlan` records, loading each
+    track and formatting its output paths exactly once.  Tracks are
+    loaded by the ripper's :class:`BatchLoader` and planned in the order
+    they finish loading"""
+
+    def __init__(self, args, ripper):
+        self.args = args
+        self.ripper = ripper
+        self.genre_uris = set()
+        # chart entries already planned for an earlier chart
+        self.chart_plans = {}
+
+    def plan(self, uris):
+        uri_plans = [self.plan_uri(uri) for uri in uris]
+
+        # genres of all the tracks to rip in a few batched requests
+        if self.genre_uris:
+            self.ripper.web.prefetch_genres(self.args.genres[0],
+                                            self.genre_uris)
+        return uri_plans
+
+    def plan_uri(self, uri):
+        ripper = self.ripper
+        uri_plan = UriPlan(uri if not isinstance(uri, list) else None)
+
+        tracks = list(ripper.get_tracks_from_uri(uri))
+
+        # output paths depend on the playlist/album the track came from
+        uri_plan.playlist = ripper.current_playlist
+        uri_plan.album = ripper.current_album
+        uri_plan.chart = ripper.current_chart
+
+        # tracks the ledger has as done or the metadata store knows
+        # about don't need to be loaded
+        plans = [None] * len(tracks)
+        to_load = []
+        for idx, track in enumerate(tracks):
+            plans[idx] = self.plan_from_store(idx, track)
+            if plans[idx] is None:
+                to_load.append(idx)
+
+        for load_idx, track, error in ripper.loader.load(
+                [tracks[idx] for idx in to_load]):
+            idx = to_load[load_idx]
+            plans[idx] = self.plan_track(idx, track, error)
+        ripper.metadata.flush()
+
+        # when mirroring charts a track is only ripped for the first
+        # chart it is in
+        if self.args.mirror_charts and uri_plan.chart is not None:
+            for plan in plans:
+                if plan.uri is not None and plan.available:
+                    self.chart_plans.setdefault(plan.uri, plan)
+
+        uri_plan.tracks = plans
+        return uri_plan
+
+    def plan_from_store(self, idx, track):
+        try:
+            uri = track.link.uri
+        except spotify.Error:
+            return None
+
+        first = self.chart_plans.get(uri)
+        if first is not None:
+            return self.plan_from_plan(idx, track, first)
+
+        plan = self.plan_from_ledger(idx, track, uri)
+        if plan is None:
+            info = self.ripper.metadata.get(uri)
+            if info is not None:
+                plan = self.plan_info(idx, track, info)
+        return plan
+
+    def plan_from_ledger(self, idx, track, uri):
+        args = self.args
+        # a playlist sync needs the paths for the current --format to
+        # move files that were ripped under another one, the ledger only
+        # knows where they were written
+        if args.overwrite or args.playlist_sync:
+            return None
+
+        audio_files = self.ripper.ledger.done_files(uri, args.output_args)
+        if audio_files is None:
+            return None
+
+        plan = TrackPlan(idx, track)
+        plan.uri = uri
+        plan.available = True
+        plan.audio_files = audio_files
+        if args.verify_ledger and \
+                not plan.files_exist(self.ripper.output_index):
+            return None
+
+        plan.skip = True
+        return plan
+
+    def plan_from_plan(self, idx, track, first):
+        plan = TrackPlan(idx, track)
+        for field in ("uri", "title", "artist", "album", "disc", "index",
+                      "duration", "available", "audio_files"):
+            setattr(plan, field, getattr(first, field))
+        plan.skip = True
+        return plan
+
+    def plan_track(self, idx, track, error=None):
+        plan = TrackPlan(idx, track)
+        if error is not None:
+            plan.error = error
+            return plan
+
+        try:
+            info = TrackInfo.from_track(track)
+        except spotify.Error as e:
+            plan.error = str(e)
+            return plan
+
+        self.ripper.metadata.put(info)
+        return self.plan_info(idx, track, info)
+
+    def plan_info(self, idx, track, info):
+        plan = TrackPlan(idx, track)
+        plan.uri = info.uri
+        plan.available = info.available
+        if not plan.available:
+            return plan
+
+        plan.title = info.name
+        plan.artist = info.artists[0] if info.artists else None
+        plan.album = info.album
+        plan.disc = info.disc
+        plan.index = info.index
+        plan.duration = info.duration
+        try:
+            plan.audio_files = self.ripper.format_track_paths(idx, info)
+        except spotify.Error as e:
+            plan.available = False
+            plan.error = str(e)
+            return plan
+        plan.skip = not self.args.overwrite and \
+            plan.files_exist(self.ripper.output_index)
+
+        if self.args.genres is not None and not plan.skip:
+            genre_uri = info.artist_uri if self.args.genres[0] == "artist" \
+                else info.album_uri
+            if genre_uri is not None:
+                self.genre_uris.add(genre_uri)
+        return plan
@@ -4,21 +4,25 @@ from __future__ import unicode_literals
 
 from colorama import Fore
 from spotify_ripper.utils import *
+from spotify_ripper.metadata import TrackInfo
 import os
 import time
 import spotify
 import codecs
+import threading
 
 
 class PostActions(object):
-    tracks_to_remove = []
     fail_log_file = None
-    success_tracks = []
-    failure_tracks = []
 
     def __init__(self, args, ripper):
         self.args = args
         self.ripper = ripper
+        self.lock = threading.Lock()
+        self.tracks_to_remove = []
+        self.success_tracks = []
+        self.failure_tracks = []
+        self.tag_failures = []
 
         # create a log file for rip failures
         if args.fail_log is not None:
@@ -32,11 +36,23 @@ class PostActions(object):
 
     def log_success(self, track):
         self.success_tracks.append(track)
+        if self.ripper.session_worker is not None:
+            self.ripper.session_worker.log_result(True)
 
     def log_failure(self, track):
-        self.failure_tracks.append(track)
-        if self.fail_log_file is not None:
-            self.fail_log_file.write(track.link.uri + "\n")
+        with self.lock:
+            self.failure_tracks.append(track)
+            if self.fail_log_file is not None:
+                self.fail_log_file.write(track.link.uri + "\n")
+        self.ripper.ledger.add_failure(track.link.uri)
+        if self.ripper.session_worker is not None:
+            self.ripper.session_worker.log_result(False)
+
+    def log_tag_failure(self, metadata, audio_file, error):
+        print(Fore.RED + "Could not tag " + audio_file + Fore.RESET)
+        print(str(error))
+        with self.lock:
+            self.tag_failures.append((metadata, audio_file, str(error)))
 
     def end_failure_log(self):
         if self.fail_log_file is not None:
@@ -62,11 +78,15 @@ class PostActions(object):
         def log_tracks(tracks):
             for track in tracks:
                 try:
-                    track.load()
-                    if (len(track.artists) > 0 and track.artists[0].name
-                            is not None and track.name is not None):
-                        print_with_bullet(track.artists[0].name + " - " +
-                                          track.name)
+                    # names from the metadata store, even if outdated
+                    info = self.ripper.metadata.get(track.link.uri,
+                                                    ignore_ttl=True)
+                    if info is None:
+                        info = TrackInfo.from_track(track.load())
+                    if (len(info.artists) > 0 and info.artists[0]
+                            is not None and info.name is not None):
+                        print_with_bullet(info.artists[0] + " - " +
+                                          info.name)
                     else:
                         print_with_bullet(track.link.uri)
                 except spotify.Error as e:
@@ -83,6 +103,116 @@ class PostActions(object):
                   str(len(self.failure_tracks)) +
                   ")\n" + ("-" * 79) + Fore.RESET)
             log_tracks(self.failure_tracks)
+        if len(self.tag_failures) > 0:
+            print(Fore.RED + "\nTagging Failure Summary (" +
+                  str(len(self.tag_failures)) +
+                  ")\n" + ("-" * 79) + Fore.RESET)
+            for metadata, audio_file, error in self.tag_failures:
+                print_with_bullet(metadata.artist + " - " + metadata.title +
+                                  ": " + error)
+            print("")
+
+    def print_stats(self):
+        rip_buffer = self.ripper.rip_buffer
+        if rip_buffer is None or rip_buffer.total_bytes == 0:
+            return
+
+        def print_stat(name, value):
+            print(Fore.YELLOW + "  " + name + ":\t" + Fore.RESET + value)
+
+        print(Fore.GREEN + "\nRip Statistics\n" + ("-" * 79) + Fore.RESET)
+        print_stat("Audio data ripped", format_size(rip_buffer.total_bytes))
+        print_stat("Buffer high-water mark",
+                   format_size(rip_buffer.high_water) + " / " +
+                   format_size(rip_buffer.capacity))
+        print_stat("Buffer stalls", str(rip_buffer.stalls) + " (" +
+                   str(rip_buffer.stalled_frames) + " frames re-delivered)")
+
+        writer_stats = self.ripper.writer_stats
+        if writer_stats is not None and writer_stats.writes > 0:
+            print_stat("Encoder writes", str(writer_stats.writes) + " (" +
+                       "%.1f writes/sec, " % writer_stats.writes_per_sec() +
+                       format_size(writer_stats.bytes // writer_stats.writes) +
+                       " avg)")
+
+        spawners = self.ripper.spawners or []
+        spare_hits = sum(spawner.spare_hits for spawner in spawners)
+        spare_misses = sum(spawner.spare_misses for spawner in spawners)
+        if spare_hits + spare_misses > 0:
+            print_stat("Spare encoder hits",
+                       str(spare_hits) + " / " +
+                       str(spare_hits + spare_misses))
+
+        loader = self.ripper.loader
+        if loader is not None and loader.latencies:
+            print_stat("Track load latency",
+                       "p50 %.2fs, p90 %.2fs, p99 %.2fs, max %.2fs" % (
+                           loader.percentile(50), loader.percentile(90),
+                           loader.percentile(99), loader.percentile(100)) +
+                       " (" + str(len(loader.latencies)) + " tracks, " +
+                       str(loader.timeouts) + " timeouts)")
+
+        http_cache = self.ripper.web.http_cache
+        if http_cache is not None and \
+                http_cache.hits + http_cache.revalidated + \
+                http_cache.misses > 0:
+            print_stat("Web API cache",
+                       str(http_cache.hits) + " hits, " +
+                       str(http_cache.revalidated) + " revalidated, " +
+                       str(http_cache.misses) + " downloaded")
+
+        cache = self.ripper.web.cache
+        if cache.hits + cache.misses > 0:
+            print_stat("Web API memory cache",
+                       "%.0f%% hits, " % (100.0 * cache.hits /
+                                         (cache.hits + cache.misses)) +
+                       format_size(cache.size) + " held (" +
+                       str(len(cache)) + " entries, " +
+                       str(cache.evictions) + " evicted)")
+
+        client = self.ripper.web.client
+        if client.requests > 0:
+            print_stat("Web API requests",
+                       str(client.requests) + " (" + str(client.coalesced) +
+                       " coalesced, " + str(client.retries) + " retries, " +
+                       "%.1fs backoff)" % client.backoff)
+
+        limiter = self.ripper.web.limiter
+        if limiter.waited > 0:
+            print_stat("Web API rate limit",
+                       "%.1fs waited" % limiter.waited + " (" +
+                       str(limiter.throttled) + " times throttled)")
+
+        prefetcher = self.ripper.prefetcher
+        if prefetcher is not None and \
+                prefetcher.hits + prefetcher.misses > 0:
+            print_stat("Prefetched metadata hits",
+                       str(prefetcher.hits) + " / " +
+                       str(prefetcher.hits + prefetcher.misses))
+
+        metadata = self.ripper.metadata
+        if metadata is not None and metadata.hits + metadata.misses > 0:
+            print_stat("Metadata store hits",
+                       str(metadata.hits) + " / " +
+                       str(metadata.hits + metadata.misses))
+        if metadata is not None and \
+                metadata.album_hits + metadata.album_misses > 0:
+            print_stat("Album info hits",
+                       str(metadata.album_hits) + " / " +
+                       str(metadata.album_hits + metadata.album_misses))
+
+        covers = self.ripper.covers
+        if covers is not None and covers.hits + covers.downloads > 0:
+            print_stat("Cover images",
+                       str(covers.downloads) + " downloaded, " +
+                       str(covers.hits) + " from cache, " +
+                       format_size(covers.bytes_saved) +
+                       " saved by resizing")
+
+        spool = self.ripper.spool
+        if spool is not None:
+            print_stat("Spooled tracks encoded", str(spool.encoded_tracks))
+        print("")
 
     def get_playlist_name(self):
         ripper = self.ripper
@@ -90,6 +220,10 @@ class PostActions(object):
         if ripper.current_playlist is not None:
             return ripper.current_playlist.name
         elif ripper.current_album is not None:
+            album_info = ripper.metadata.get_album(
+                ripper.current_album.link.uri)
+            if album_info is not None and album_info.artist is not None:
+                return album_info.artist + " - " + album_info.name
             return (ripper.current_album.artist.name + " - " + ripper.current_album.name)
         elif ripper.current_chart is not None:
             return ripper.current_chart["name"]
@@ -98,7 +232,6 @@ class PostActions(object):
 
     def create_playlist_m3u(self, tracks):
         args = self.args
-        ripper = self.ripper
 
         name = to_ascii(self.get_playlist_name())
         if name is not None and args.playlist_m3u:
@@ -111,9 +244,10 @@ class PostActions(object):
 
             encoding = "ascii" if args.ascii else "utf-8"
             with codecs.open(playlist_path, 'w', encoding) as playlist:
-                for idx, track in enumerate(tracks):
-                    _file = ripper.format_track_path(idx, track)
-                    if path_exists(_file):
+                for plan in tracks:
+                    _file = plan.audio_file
+                    if _file is not None and \
+                            self.ripper.output_index.exists(_file):
                         playlist.write(os.path.relpath(_file, _base_dir) +
                                        "\n")
 
@@ -133,10 +267,9 @@ class PostActions(object):
             encoding = "ascii" if args.ascii else "utf-8"
             with codecs.open(playlist_path, 'w', encoding) as playlist:
                 # to get an accurate track count
-                track_paths = [_file for _file in
-                               [ripper.format_track_path(idx, track)
-                                for idx, track in enumerate(tracks)]
-                               if path_exists(_file)]
+                track_paths = [plan.audio_file for plan in tracks
+                               if plan.audio_file is not None and
+                               ripper.output_index.exists(plan.audio_file)]
 
                 playlist.write('<?wpl version="1.0"?>\n')
                 playlist.write('<smil>\n')
@@ -163,16 +296,33 @@ class PostActions(object):
                 playlist.write('\t</body>\n')
                 playlist.write('</smil>\n')
 
-    def clean_up_partial(self):
+    def clean_up_partial(self, encoders=None):
         ripper = self.ripper
 
-        if ripper.audio_file is not None and path_exists(ripper.audio_file):
+        if encoders is None:
+            encoders = ripper.encoders
+            ripper.encoders = None
+
+        if encoders:
             print(Fore.YELLOW + "Deleting partially ripped file" + Fore.RESET)
-            rm_file(ripper.audio_file)
+            for encoder in encoders:
+                encoder.abort()
+                ripper.output_index.discard(encoder.audio_file)
 
     def queue_remove_from_playlist(self, idx):
         ripper = self.ripper
 
+        # in a session pool the primary session removes the tracks
+        # ripped by all sessions, see add_track_to_remove
+        if self.args.remove_from_playlist and \
+                ripper.session_worker is not None:
+            ripper.session_worker.queue_remove(ripper.current_uri_idx, idx)
+        else:
+            self.add_track_to_remove(idx)
+
+    def add_track_to_remove(self, idx):
+        ripper = self.ripper
+
         if self.args.remove_from_playlist:
             if ripper.current_playlist:
                 if ripper.current_playlist.owner.canonical_name == \
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from colorama import Fore
+from spotify_ripper.tags import TrackMetadata
+import threading
+import spotify
+
+try:
+    # Python 3
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+
+class Prefetcher(object):
+    """Loads the next ``depth`` tracks to rip and resolves their tagging
+    metadata (album browse, cover, Web API genres) on a background
+    thread while the current track streams.
+
+    :meth:`metadata` hands out the prefetched snapshot once the track
+    finishes, so tagging doesn't have to wait for it.  With ``depth`` 0
+    nothing is prefetched.
+    """
+
+    def __init__(self, args, ripper, depth):
+        self.args = args
+        self.ripper = ripper
+        self.depth = depth
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.thread = None
+        self.scheduled = set()
+        self.snapshots = {}
+        self.hits = 0
+        self.misses = 0
+
+    def upcoming(self, order, pos):
+        """the next ``depth`` tracks to rip after ``order[pos]``, ``order``
+        holds the ``(plan, playlist)`` of every track of every URI, so
+        the next URI's first tracks are looked at too"""
+        count = 0
+        for next_pos in range(pos + 1, len(order)):
+            if count >= self.depth:
+                break
+            plan, playlist = order[next_pos]
+            if not plan.available or plan.skip or plan.uri is None:
+                continue
+            count += 1
+            yield plan, playlist
+
+    def ahead(self, order, pos):
+        """schedule the tracks to rip after ``order[pos]``"""
+        for plan, playlist in self.upcoming(order, pos):
+            with self.lock:
+                if plan.uri in self.scheduled:
+                    continue
+                self.scheduled.add(plan.uri)
+            self.start()
+            self.queue.put((plan.uri, plan.track, playlist))
+
+    def metadata(self, track, playlist):
+        """the prefetched snapshot of the track, or a new one"""
+        with self.lock:
+            metadata = self.snapshots.pop(track.link.uri, None)
+            if metadata is not None and metadata.resolved:
+                self.hits += 1
+            else:
+                self.misses += 1
+        # still resolving, the tagging worker waits for it
+        if metadata is not None:
+            return metadata
+        return TrackMetadata(track, playlist)
+
+    def peek(self, uri):
+        """the prefetched snapshot of the track if it is resolved
+        already, it is still handed out by :meth:`metadata`"""
+        with self.lock:
+            metadata = self.snapshots.get(uri)
+        if metadata is not None and metadata.resolved:
+            return metadata
+        return None
+
+    def forget(self, plans, order, pos):
+        """forget the snapshots of the finished URI's tracks that weren't
+        ripped, e.g. because another session took them, but not the
+        ones still coming up after ``order[pos]``"""
+        upcoming = set(plan.uri for plan, _ in self.upcoming(order, pos))
+        with self.lock:
+            for plan in plans:
+                if plan.uri is not None and plan.uri not in upcoming:
+                    self.scheduled.discard(plan.uri)
+                    self.snapshots.pop(plan.uri, None)
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.worker)
+                self.thread.name = 'SpotifyPrefetchThread'
+                self.thread.daemon = True
+                self.thread.start()
+
+    def worker(self):
+        while True:
+            uri, track, playlist = self.queue.get()
+            try:
+                track.load()
+                metadata = TrackMetadata(track, playlist)
+                with self.lock:
+                    if uri not in self.scheduled:
+                        continue
+                    self.snapshots[uri] = metadata
+                metadata.resolve(self.args, self.ripper)
+            except (spotify.Error, Exception) as e:
+                # the track will be resolved when it is tagged instead
+                print(Fore.YELLOW + "Could not prefetch " + uri +
+                      Fore.RESET)
+                print(str(e))
@@ -8,7 +8,6 @@ import os
 import sys
 import time
 import schedule
-import spotify
 
 try:
     from fcntl import ioctl
@@ -19,25 +18,6 @@ except ImportError:
 
 
 class Progress(object):
-    # song progress
-    current_track = None
-    song_position = 0
-    song_duration = 0
-
-    # total progress
-    show_total = False
-    skipped_tracks = 0
-    total_tracks = 0
-    total_position = 0
-    total_duration = 0
-    total_size = 0
-
-    # eta calculations
-    ema_rate = None
-    stat_prev = None
-    song_eta = None
-    total_eta = None
-
     # flag for moving cursor
     move_cursor = False
     term_width = 120
@@ -45,11 +25,31 @@ class Progress(object):
     def __init__(self, args, ripper):
         self.args = args
         self.ripper = ripper
+
+        # song progress
+        self.current_track = None
+        self.song_position = 0
+        self.song_duration = 0
+
+        # total progress
+        self.show_total = False
+        self.skipped_tracks = 0
+        self.total_tracks = 0
+        self.total_position = 0
+        self.total_duration = 0
+        self.total_size = 0
+
+        # eta calculations
+        self.ema_rate = None
+        self.stat_prev = None
+        self.song_eta = None
+        self.total_eta = None
+
         if not self.args.has_log:
             schedule.every(2).seconds.do(self.eta_calc)
 
-    def calc_total(self, tracks):
-        if len(tracks) <= 1:
+    def calc_total(self, plans):
+        if len(plans) <= 1:
             return
 
         self.show_total = True
@@ -57,23 +57,15 @@ class Progress(object):
         self.total_duration = 0
         self.total_size = 0
 
-        # some duplicate work here, maybe cache this info beforehand?
-        for idx, track in enumerate(tracks):
-            try:
-                track.load()
-                if track.availability != 1:
-                    self.skipped_tracks += 1
-                    continue
-                audio_file = self.ripper.format_track_path(idx, track)
-                if not self.args.overwrite and path_exists(audio_file):
-                    self.skipped_tracks += 1
-                    continue
-                self.total_tracks += 1
-                self.total_duration += track.duration
-                file_size = calc_file_size(track)
-                self.total_size += file_size
-            except spotify.Error as e:
+        for plan in plans:
+            if plan.error is not None:
                 continue
+            if not plan.available or plan.skip:
+                self.skipped_tracks += 1
+                continue
+            self.total_tracks += 1
+            self.total_duration += plan.duration
+            self.total_size += calc_file_size(plan)
 
     def eta_calc(self):
         # exponential moving average
@@ -144,6 +136,10 @@ class Progress(object):
         self.current_track = None
 
     def update_progress(self, num_frames, sample_rate):
+        # song position is also needed for a session pool's total
+        if num_frames > 0 and sample_rate > 0:
+            self.song_position += (num_frames * 1000) / sample_rate
+
         if self.args.has_log:
             return
 
@@ -168,8 +164,6 @@ class Progress(object):
             prog_width = 40
 
         # song position/progress calculations
-        if num_frames > 0 and sample_rate > 0:
-            self.song_position += (num_frames * 1000) / sample_rate
         pos_seconds = self.song_position // 1000
         dur_seconds = self.song_duration // 1000
         pct = int(self.song_position * 100 // self.song_duration) \
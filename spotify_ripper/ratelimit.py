@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from email.utils import parsedate_tz, mktime_tz
+import time
+import random
+import threading
+
+
+def retry_after(response):
+    """seconds the server asked us to wait, or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(mktime_tz(date) - time.time(), 0.0)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """exponential backoff with jitter for the n-th retry (from 0)"""
+    delay = min(base * (2 ** attempt), cap)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RateLimiter(object):
+    """Token bucket shared by every Web API request.
+
+    Tokens are added at ``rate`` per second up to ``burst``; a request
+    only sleeps when the bucket is empty, or while the limiter is paused
+    because the server answered 429.  ``rate`` 0 disables the limit (but
+    not the pauses).
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(burst if burst is not None else rate, 1)
+        self.tokens = self.burst
+        self.last = time.time()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+        self.waited = 0.0
+        self.throttled = 0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.rate <= 0:
+                    return
+                else:
+                    self.tokens = min(self.tokens +
+                                      (now - self.last) * self.rate,
+                                      self.burst)
+                    self.last = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        """the server is throttling us, hold back all requests"""
+        with self.lock:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until,
+                                    time.time() + seconds)
+            # start refilling once the pause is over
+            self.tokens = 0
+            self.last = self.paused_until
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.waited += seconds
+        time.sleep(seconds)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import threading
+import time
+
+
+class RingBuffer(object):
+    """Preallocated, byte-bounded FIFO for PCM data.
+
+    The libspotify thread writes into the buffer from
+    ``on_music_delivery`` and the ripping thread reads from it.  Reads
+    hand out :class:`memoryview` slices of the underlying ``bytearray``
+    so the data is only copied once (from libspotify into the buffer).
+    Readable views stay valid until :meth:`consume` is called.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._read_pos = 0
+        self._used = 0
+        self._flushing = False
+        self._cond = threading.Condition()
+
+        # format of the last delivery
+        self.sample_rate = 44100
+        self.frame_size = 4
+
+        # stats
+        self.high_water = 0
+        self.stalls = 0
+        self.stalled_frames = 0
+        self.total_bytes = 0
+
+    @property
+    def used(self):
+        return self._used
+
+    def empty(self):
+        return self._used == 0
+
+    def write(self, data, num_frames, frame_size, sample_rate):
+        """copy as many whole frames as fit, returns number of frames
+        accepted (0 means libspotify should deliver them again)"""
+        if num_frames <= 0:
+            return 0
+
+        with self._cond:
+            self.frame_size = frame_size
+            self.sample_rate = sample_rate
+
+            free = self.capacity - self._used
+            frames = min(num_frames, free // frame_size)
+            if frames < num_frames:
+                self.stalls += 1
+                self.stalled_frames += num_frames - frames
+            if frames == 0:
+                return 0
+
+            size = frames * frame_size
+            src = memoryview(data)
+            write_pos = (self._read_pos + self._used) % self.capacity
+            first = min(size, self.capacity - write_pos)
+            self._view[write_pos:write_pos + first] = src[:first]
+            if first < size:
+                self._view[:size - first] = src[first:size]
+
+            self._used += size
+            self.total_bytes += size
+            if self._used > self.high_water:
+                self.high_water = self._used
+            self._cond.notify_all()
+            return frames
+
+    def peek(self, min_bytes=1, timeout=None):
+        """wait for at least ``min_bytes`` (or a flush) and return a list
+        of views covering all readable data, empty list on timeout"""
+        min_bytes = min(min_bytes, self.capacity)
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._used < min_bytes and not self._flushing:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            if self._used == 0:
+                return []
+
+            first = min(self._used, self.capacity - self._read_pos)
+            views = [self._view[self._read_pos:self._read_pos + first]]
+            if first < self._used:
+                views.append(self._view[:self._used - first])
+            return views
+
+    def consume(self, size):
+        with self._cond:
+            size = min(size, self._used)
+            self._read_pos = (self._read_pos + size) % self.capacity
+            self._used -= size
+            if self._used == 0:
+                self._read_pos = 0
+            self._cond.notify_all()
+
+    def flush(self, flushing=True):
+        """while flushing, readers are woken up regardless of how much
+        data is available"""
+        with self._cond:
+            self._flushing = flushing
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self._read_pos = 0
+            self._used = 0
+            self._flushing = False
+            self._cond.notify_all()
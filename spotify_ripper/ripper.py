@@ -2,15 +2,28 @@
 
 from __future__ import unicode_literals
 
-from subprocess import Popen, PIPE
 from colorama import Fore
 from spotify_ripper.utils import *
-from spotify_ripper.tags import set_metadata_tags
+from spotify_ripper.tags import TaggingPool
+from spotify_ripper.prefetch import Prefetcher
+from spotify_ripper.charts import ChartMirror
+from spotify_ripper.covers import CoverCache
 from spotify_ripper.progress import Progress
 from spotify_ripper.post_actions import PostActions
 from spotify_ripper.web import WebAPI
 from spotify_ripper.sync import Sync
 from spotify_ripper.eventloop import EventLoop
+from spotify_ripper.ringbuffer import RingBuffer
+from spotify_ripper.writer import EncoderWriter, WriterStats
+from spotify_ripper.pipeline import RipJob, TrackFinisher
+from spotify_ripper.encoders import EncoderSpawner
+from spotify_ripper.spool import Spool
+from spotify_ripper.plan import Planner
+from spotify_ripper.loader import BatchLoader
+from spotify_ripper.template import TrackFields
+from spotify_ripper.index import OutputIndex
+from spotify_ripper.ledger import RipLedger
+from spotify_ripper.metadata import MetadataStore, AlbumInfo
 from datetime import datetime
 import os
 import sys
@@ -19,16 +32,10 @@ import threading
 import spotify
 import getpass
 import itertools
-import wave
+import copy
+import multiprocessing
 import re
 
-try:
-    # Python 3
-    import queue
-except ImportError:
-    # Python 2
-    import Queue as queue
-
 
 class BitRate(spotify.utils.IntEnum):
     BITRATE_160K = 0
@@ -40,10 +47,12 @@ class Ripper(threading.Thread):
     name = 'SpotifyRipperThread'
 
     audio_file = None
-    pcm_file = None
-    wav_file = None
-    rip_proc = None
-    pipe = None
+    audio_files = None
+    encoders = None
+    spawners = None
+    spool = None
+    session_worker = None
+    current_uri_idx = None
     current_playlist = None
     current_album = None
     current_chart = None
@@ -54,23 +63,36 @@ class Ripper(threading.Thread):
     sync = None
     post = None
     web = None
-    dev_null = None
     stop_time = None
-
-    rip_queue = queue.Queue()
-
-    # threading events
-    logged_in = threading.Event()
-    logged_out = threading.Event()
-    ripper_continue = threading.Event()
-    ripping = threading.Event()
-    end_of_track = threading.Event()
-    finished = threading.Event()
-    abort = threading.Event()
+    rip_buffer = None
+    writer = None
+    writer_stats = None
+    finisher = None
+    tagging = None
+    prefetcher = None
+    loader = None
+    output_index = None
+    ledger = None
+    metadata = None
+    covers = None
+    spooled = None
+    progress_bytes = 0
 
     def __init__(self, args):
         threading.Thread.__init__(self)
 
+        # threading events
+        self.logged_in = threading.Event()
+        self.logged_out = threading.Event()
+        self.ripper_continue = threading.Event()
+        self.ripping = threading.Event()
+        self.end_of_track = threading.Event()
+        self.finished = threading.Event()
+        self.abort = threading.Event()
+
+        # set when running as one session of a SessionPool
+        self.session_worker = getattr(args, "session_worker", None)
+
         # initialize progress meter
         self.progress = Progress(args, self)
 
@@ -84,6 +106,42 @@ class Ripper(threading.Thread):
 
         self.post = PostActions(args, self)
         self.web = WebAPI(args, self)
+        self.loader = BatchLoader(int(args.load_window),
+                                  float(args.load_timeout))
+        self.output_index = OutputIndex(base_dir())
+        self.ledger = RipLedger(os.path.join(settings_dir(), "ledger.db"))
+        self.metadata = MetadataStore(
+            os.path.join(settings_dir(), "metadata.db"),
+            float(args.metadata_ttl) * 3600, args.refresh_metadata)
+        self.covers = CoverCache(
+            os.path.join(settings_dir(), "covers"),
+            int(args.cover_size) if args.cover_size is not None else None,
+            int(args.cover_quality)
+            if args.cover_quality is not None else None)
+
+        # bounded buffer between libspotify and the encoder
+        self.rip_buffer = RingBuffer(int(args.buffer_size) * MB_BYTES)
+        self.writer_stats = WriterStats()
+
+        # encoder drain, tagging and post actions of finished tracks
+        self.finisher = TrackFinisher(int(args.pipeline), self.complete_rip)
+        self.tagging = TaggingPool(args, self, int(args.tag_workers))
+        self.prefetcher = Prefetcher(args, self, int(args.prefetch))
+        # in spool mode the stream is only written to the spool as raw
+        # PCM, the spool encodes it to the outputs in the background
+        if args.spool is not None:
+            encode_workers = int(args.encode_workers) \
+                if args.encode_workers is not None \
+                else multiprocessing.cpu_count()
+            self.spool = Spool(args, self, args.spool[0], encode_workers)
+            self.spooled = []
+
+            spool_args = copy.copy(args)
+            spool_args.output_type = "pcm"
+            self.spawners = [EncoderSpawner(spool_args)]
+        else:
+            self.spawners = [EncoderSpawner(output_args)
+                             for output_args in args.output_args]
 
         # application key location
         if args.key is not None:
@@ -103,10 +161,13 @@ class Ripper(threading.Thread):
             config.load_application_key_file(app_key_path)
 
         # settings directory
-        if args.settings is not None:
-            settings_dir = norm_path(args.settings[0])
-            config.settings_location = settings_dir
-            config.cache_location = settings_dir
+        if self.session_worker is not None:
+            config.settings_location = self.session_worker.session_dir
+            config.cache_location = self.session_worker.session_dir
+        elif args.settings is not None:
+            _settings_dir = norm_path(args.settings[0])
+            config.settings_location = _settings_dir
+            config.cache_location = _settings_dir
         else:
             config.settings_location = default_dir
             config.cache_location = default_dir
@@ -184,128 +245,163 @@ class Ripper(threading.Thread):
         else:
             uris = args.uri
 
-        def get_tracks_from_uri(uri):
-            current_playlist = None
-            current_album = None
-            current_chart = None
+        # in a session pool the primary session does the work that is
+        # only needed once
+        is_primary = self.session_worker is None or \
+            self.session_worker.is_primary
 
-            if isinstance(uri, list):
-                return uri
-            else:
-                if (args.exclude_appears_on and
-                        uri.startswith("spotify:artist:")):
-                    album_uris = self.web.get_non_appears_on_albums(uri)
-                    return itertools.chain(
-                        *[self.load_link(album_uri) for
-                          album_uri in album_uris])
-                elif uri.startswith("spotify:charts:"):
-                    charts = self.web.get_charts(uri)
-                    if charts is not None:
-                        self.current_chart = charts
-                        chart_uris = [t["track"]["uri"] for t in charts["entries"]["items"]]
-                        return itertools.chain(
-                            *[self.load_link(chart_uri) for
-                              chart_uri in chart_uris])
-                    else:
-                        return iter([])
-                else:
-                    return self.load_link(uri)
+        # encode whatever an earlier run left in the spool
+        if self.spool is not None and is_primary:
+            self.spool.resume()
+
+        # fetch all the charts at once and see what changed
+        if args.mirror_charts:
+            mirror = ChartMirror(args, self)
+            charts = mirror.fetch(uris)
+            if is_primary:
+                mirror.diff(charts)
+
+        # load every track and work out its output paths once
+        uri_plans = Planner(args, self).plan(uris)
 
         # calculate total size and time
-        all_tracks = []
-        for uri in uris:
-            tracks = get_tracks_from_uri(uri)
-            all_tracks += list(tracks)
+        if is_primary:
+            self.progress.calc_total(
+                [plan for uri_plan in uri_plans for plan in uri_plan.tracks])
+            if self.session_worker is not None:
+                self.session_worker.set_total(self.progress.total_duration)
 
-        self.progress.calc_total(all_tracks)
+            if self.progress.total_size > 0:
+                print(
+                    "Total Download Size: " +
+                    format_size(self.progress.total_size))
 
-        if self.progress.total_size > 0:
-            print(
-                "Total Download Size: " +
-                format_size(self.progress.total_size))
+        # every track in the order it is ripped, so the prefetcher and
+        # the spare encoders can look ahead into the next URI
+        rip_order = [(plan, uri_plan.playlist) for uri_plan in uri_plans
+                     for plan in uri_plan.tracks]
+        uri_offset = 0
 
         # create track iterator
-        for uri in uris:
+        for uri_idx, uri_plan in enumerate(uri_plans):
             if self.abort.is_set():
                 break
 
-            tracks = list(get_tracks_from_uri(uri))
+            self.current_uri_idx = uri_idx
+            self.current_playlist = uri_plan.playlist
+            self.current_album = uri_plan.album
+            self.current_chart = uri_plan.chart
+            tracks = uri_plan.tracks
 
             if args.flat_with_index and self.current_playlist:
                 self.idx_digits = len(str(len(self.current_playlist.tracks)))
 
-            if args.playlist_sync and self.current_playlist:
+            if args.playlist_sync and self.current_playlist and is_primary:
                 self.sync = Sync(args, self)
-                self.sync.sync_playlist(self.current_playlist)
+                self.sync.sync_playlist(self.current_playlist, tracks)
 
             # ripping loop
-            for idx, track in enumerate(tracks):
+            for pos, plan in enumerate(tracks):
+                idx, track = plan.idx, plan.track
+
+                # another session is already ripping it
+                if self.session_worker is not None and \
+                        not self.session_worker.claim(uri_idx, idx):
+                    continue
+
                 try:
                     self.check_stop_time()
 
                     if self.abort.is_set():
                         break
 
-                    print('Loading track...')
-                    track.load()
-                    if track.availability != 1:
+                    if not plan.available:
+                        if plan.error is not None:
+                            print(plan.error)
                         print(
                             Fore.RED + 'Track is not available, '
                                        'skipping...' + Fore.RESET)
                         self.post.log_failure(track)
                         continue
 
-                    self.audio_file = self.format_track_path(idx, track)
+                    if self.spool is not None and \
+                            self.spool.has_track(plan.uri):
+                        print(
+                            Fore.YELLOW + "Skipping " + plan.uri +
+                            ", already in the spool" + Fore.RESET)
+                        continue
+
+                    self.audio_files = plan.audio_files
+                    self.audio_file = plan.audio_file
 
-                    if not args.overwrite and path_exists(self.audio_file):
+                    # the files can also show up after planning, e.g. by
+                    # a playlist sync or a track listed twice
+                    if plan.skip or \
+                            (not args.overwrite and
+                             plan.files_exist(self.output_index)):
                         print(
                             Fore.YELLOW + "Skipping " +
-                            track.link.uri + Fore.RESET)
+                            plan.uri + Fore.RESET)
                         print(Fore.CYAN + self.audio_file + Fore.RESET)
                         self.post.queue_remove_from_playlist(idx)
                         continue
 
+                    # planned from the metadata store, the track
+                    # itself may not be loaded yet
+                    track.load()
                     self.session.player.load(track)
                     self.prepare_rip(idx, track)
                     self.session.player.play()
 
-                    timeout_count = 0
-                    while not self.end_of_track.is_set() or \
-                            not self.rip_queue.empty():
-                        try:
-                            if self.abort.is_set():
-                                break
-
-                            rip_item = self.rip_queue.get(timeout=1)
-
-                            if self.abort.is_set():
-                                break
-
-                            self.rip(self.session, rip_item[0],
-                                     rip_item[1], rip_item[2])
-                        except queue.Empty:
-                            timeout_count += 1
-                            if timeout_count > 60:
+                    # warm up the next tracks' metadata while this one
+                    # is streaming
+                    self.prefetcher.ahead(rip_order, uri_offset + pos)
+
+                    # get the next track's encoders ready while this one
+                    # is streaming
+                    self.prespawn_next(rip_order, uri_offset + pos)
+
+                    # the writer thread feeds the encoder, we only keep
+                    # track of progress until the track has been delivered
+                    stall_count = 0
+                    while not self.end_of_track.is_set():
+                        if self.abort.is_set() or not self.writer.is_alive():
+                            break
+
+                        self.end_of_track.wait(0.25)
+                        self.prespawn_next(rip_order, uri_offset + pos)
+                        if self.update_rip_progress():
+                            stall_count = 0
+                        else:
+                            stall_count += 1
+                            if stall_count > 240:
                                 raise spotify.Error("Timeout while "
                                                     "ripping track")
 
                     if self.abort.is_set():
                         self.session.player.play(False)
+                        self.stop_writer()
+                        self.rip_buffer.clear()
                         self.end_of_track.set()
                         self.post.clean_up_partial()
                         self.post.log_failure(track)
                         break
 
+                    # write out whatever is still buffered
+                    self.writer.finish()
+                    self.update_rip_progress()
+                    if self.writer.error is not None:
+                        raise self.writer.error
+                    if not self.writer.finished:
+                        raise spotify.Error("Encoder writer stopped before "
+                                            "the end of the track")
+
                     self.end_of_track.clear()
 
+                    # all audio has been handed to the encoder, the rest
+                    # can happen while the next track is streaming
                     self.finish_rip(track)
-
-                    # update id3v2 with metadata and embed front cover image
-                    set_metadata_tags(args, self.audio_file, track, self)
-
-                    # make a note of the index and remove all the
-                    # tracks from the playlist when everything is done
-                    self.post.queue_remove_from_playlist(idx)
+                    self.finisher.submit(self.detach_rip_job(idx, track))
 
                 except (spotify.Error, Exception) as e:
                     if isinstance(e, Exception):
@@ -313,10 +409,42 @@ class Ripper(threading.Thread):
                     print(str(e))
                     print("Skipping to next track...")
                     self.session.player.play(False)
+                    self.stop_writer()
+                    self.rip_buffer.clear()
                     self.post.clean_up_partial()
                     self.post.log_failure(track)
                     continue
 
+            # wait for the tracks still being finished in the background
+            self.finisher.wait()
+            uri_offset += len(tracks)
+            self.prefetcher.forget(tracks, rip_order, uri_offset - 1)
+
+            # in spool mode the tracks are only in place once they are
+            # encoded, the ones that failed stay in the spool
+            if self.spool is not None:
+                self.spool.wait_tracks(uri for _, uri in self.spooled)
+                for idx, uri in self.spooled:
+                    if not self.spool.has_track(uri):
+                        self.post.queue_remove_from_playlist(idx)
+                self.spooled = []
+
+            if self.session_worker is not None:
+                self.session_worker.finish_uri(uri_idx)
+                if not is_primary:
+                    continue
+
+                # the playlist files need the tracks of all sessions
+                for remove_idx in self.session_worker.wait_uri(
+                        uri_idx, len(tracks), self.abort):
+                    self.post.add_track_to_remove(remove_idx)
+
+                # the index hasn't seen the files the other sessions
+                # wrote
+                self.output_index.refresh(
+                    audio_file for plan in tracks if plan.audio_files
+                    for audio_file in plan.audio_files)
+
             # create playlist m3u file if needed
             self.post.create_playlist_m3u(tracks)
 
@@ -326,13 +454,49 @@ class Ripper(threading.Thread):
             # actually removing the tracks from playlist
             self.post.remove_tracks_from_playlist()
 
+        # tagging still needs the session
+        self.tagging.wait()
+        if self.spool is not None:
+            self.spool.wait()
+        self.ledger.close()
+        for spawner in self.spawners:
+            spawner.close()
+
         # logout, we are done
         self.post.end_failure_log()
+        # the summary reads the track names from the metadata store
         self.post.print_summary()
+        self.post.print_stats()
+        self.metadata.close()
         self.logout()
         self.stop_event_loop()
         self.finished.set()
 
+    def get_tracks_from_uri(self, uri):
+        args = self.args
+
+        if isinstance(uri, list):
+            return uri
+        else:
+            if (args.exclude_appears_on and
+                    uri.startswith("spotify:artist:")):
+                album_uris = self.web.get_non_appears_on_albums(uri)
+                return itertools.chain(
+                    *[self.load_link(album_uri) for
+                      album_uri in album_uris])
+            elif uri.startswith("spotify:charts:"):
+                charts = self.web.get_charts(uri)
+                if charts is not None:
+                    self.current_chart = charts
+                    chart_uris = [t["track"]["uri"] for t in charts["entries"]["items"]]
+                    return itertools.chain(
+                        *[self.load_link(chart_uri) for
+                          chart_uri in chart_uris])
+                else:
+                    return iter([])
+            else:
+                return self.load_link(uri)
+
     def check_stop_time(self):
         args = self.args
 
@@ -419,6 +583,8 @@ class Ripper(threading.Thread):
             print('Loading album browser...')
             album_browser.load()
             self.current_album = album
+            # tagging and paths use this instead of browsing again
+            self.metadata.put_album(AlbumInfo.from_browser(album_browser))
             return iter(album_browser.tracks)
         elif link.type == spotify.LinkType.ARTIST:
             artist = link.as_artist()
@@ -482,13 +648,15 @@ class Ripper(threading.Thread):
 
     def on_music_delivery(self, session, audio_format,
                           frame_bytes, num_frames):
-        try:
-            self.rip_queue.put_nowait((audio_format.sample_rate,
-                                       frame_bytes, num_frames))
-        except queue.Full:
-            print(Fore.RED + "rip_queue is full. dropped music data" +
-                  Fore.RESET)
-        return num_frames
+        # nobody is going to read the data anymore
+        if self.abort.is_set():
+            return num_frames
+
+        # if the buffer is full we accept fewer frames than delivered,
+        # libspotify will then deliver the rest again on a later callback
+        return self.rip_buffer.write(frame_bytes, num_frames,
+                                     audio_format.frame_size(),
+                                     audio_format.sample_rate)
 
     def on_connection_state_changed(self, session):
         if session.connection.state is spotify.ConnectionState.LOGGED_IN:
@@ -548,122 +716,16 @@ class Ripper(threading.Thread):
             self.session.logout()
             self.logged_out.wait()
 
-    def format_track_path(self, idx, track):
-        args = self.args
+    def format_track_paths(self, idx, info):
+        """output path of the track for each output format"""
+        return [self.format_track_path(idx, info, output_args)
+                for output_args in self.args.output_args]
+
+    def format_track_path(self, idx, info, output_args=None):
+        args = self.args if output_args is None else output_args
         _base_dir = base_dir()
-        audio_file = args.format[0].strip()
-
-        track_artist = to_ascii(
-            escape_filename_part(track.artists[0].name))
-        track_artists = to_ascii(", ".join(
-            [artist.name for artist in track.artists]))
-        if len(track.artists) > 1:
-            featuring_artists = to_ascii(", ".join(
-                [artist.name for artist in track.artists[1:]]))
-        else:
-            featuring_artists = ""
-
-        album_artist = to_ascii(
-            self.current_album.artist.name
-            if self.current_album is not None else track_artist)
-        album_artists_web = track_artists
-
-        # only retrieve album_artist_web if it exists in the format string
-        if (self.current_album is not None and
-                audio_file.find("{album_artists_web}") >= 0):
-            artist_array = \
-                self.web.get_artists_on_album(self.current_album.link.uri)
-            if artist_array is not None:
-                album_artists_web = to_ascii(", ".join(artist_array))
-
-        album = to_ascii(escape_filename_part(track.album.name))
-        track_name = to_ascii(escape_filename_part(track.name))
-        year = str(track.album.year)
-        extension = args.output_type
-        idx_str = str(idx + 1)
-        track_num = str(track.index)
-        disc_num = str(track.disc)
-        if self.current_playlist is not None:
-            playlist_name = to_ascii(self.current_playlist.name)
-            playlist_owner = to_ascii(
-                self.current_playlist.owner.display_name)
-        else:
-            playlist_name = "No Playlist"
-            playlist_owner = "No Playlist Owner"
-        user = self.session.user.display_name
-
-        tags = {
-            "track_artist": track_artist,
-            "track_artists": track_artists,
-            "album_artist": album_artist,
-            "album_artists_web": album_artists_web,
-            "artist": track_artist,
-            "artists": track_artists,
-            "album": album,
-            "track_name": track_name,
-            "track": track_name,
-            "year": year,
-            "ext": extension,
-            "extension": extension,
-            "idx": idx_str,
-            "index": idx_str,
-            "track_num": track_num,
-            "track_idx": track_num,
-            "track_index": track_num,
-            "disc_num": disc_num,
-            "disc_idx": disc_num,
-            "disc_index": disc_num,
-            "playlist": playlist_name,
-            "playlist_name": playlist_name,
-            "playlist_owner": playlist_owner,
-            "playlist_user": playlist_owner,
-            "playlist_username": playlist_owner,
-            "user": user,
-            "username": user,
-            "feat_artists": featuring_artists,
-            "featuring_artists": featuring_artists
-        }
-        fill_tags = {"idx", "index", "track_num", "track_idx",
-                     "track_index", "disc_num", "disc_idx", "disc_index"}
-        prefix_tags = {"feat_artists", "featuring_artists"}
-        paren_tags = {"track_name", "track"}
-        for tag in tags.keys():
-            audio_file = audio_file.replace("{" + tag + "}", tags[tag])
-            if tag in fill_tags:
-                match = re.search(r"\{" + tag + r":\d+\}", audio_file)
-                if match:
-                    tokens = audio_file[match.start():match.end()]\
-                        .strip("{}").split(":")
-                    tag_filled = tags[tag].zfill(int(tokens[1]))
-                    audio_file = audio_file[:match.start()] + tag_filled + \
-                        audio_file[match.end():]
-            if tag in prefix_tags:
-                # don't print prefix if there are no values
-                if len(tags[tag]) > 0:
-                    match = re.search(r"\{" + tag + r":[^\}]+\}", audio_file)
-                    if match:
-                        tokens = audio_file[match.start():match.end()]\
-                            .strip("{}").split(":")
-                        audio_file = audio_file[:match.start()] + tokens[1] + \
-                            " " + tags[tag] + audio_file[match.end():]
-                else:
-                    match = re.search(r"\s*\{" + tag +
-                                      r":[^\}]+\}", audio_file)
-                    if match:
-                        audio_file = audio_file[:match.start()] + \
-                                     audio_file[match.end():]
-            if tag in paren_tags:
-                match = re.search(r"\{" + tag + r":paren\}", audio_file)
-                if match:
-                    match_tag = re.search(r"(.*)\s+-\s+([^-]+)", tags[tag])
-                    if match_tag:
-                        audio_file = audio_file[:match.start()] + \
-                                     match_tag.group(1) + " (" + \
-                                     match_tag.group(2) + ")" + \
-                                     audio_file[match.end():]
-                    else:
-                        audio_file = audio_file[:match.start()] + tags[tag] + \
-                                     audio_file[match.end():]
+        template = args.path_template
+        audio_file = template.render(TrackFields(self, args, idx, info))
 
         # in case the file name is too long
         def truncate(_str, max_size):
@@ -691,8 +753,7 @@ class Ripper(threading.Thread):
             audio_file = truncate_file_name(tokens[0])
 
         # replace filename
-        if args.replace is not None:
-            audio_file = self.replace_filename(audio_file, args.replace)
+        audio_file = template.replace(audio_file)
 
         # remove not allowed characters in filename and encode utf-8
         audio_file = audio_file.replace('*."/\[]:;|=,', '')
@@ -704,18 +765,10 @@ class Ripper(threading.Thread):
             audio_file = to_normalized_ascii(audio_file)
 
         # create directory if it doesn't exist
-        audio_path = os.path.dirname(audio_file)
-        if not path_exists(audio_path):
-            os.makedirs(enc_str(audio_path))
+        self.output_index.makedirs(os.path.dirname(audio_file))
 
         return audio_file
 
-    def replace_filename(self, filename, pattern_list):
-        for pattern in pattern_list:
-            repl = pattern.split('/')
-            filename = re.sub(repl[0], repl[1], filename)
-        return filename
-
     def prepare_rip(self, idx, track):
         args = self.args
 
@@ -729,131 +782,112 @@ class Ripper(threading.Thread):
                   track.link.uri + Fore.RESET)
         else:
             print(Fore.GREEN + "Ripping " + track.link.uri + Fore.RESET)
-        print(Fore.CYAN + self.audio_file + Fore.RESET)
+        for audio_file in self.audio_files:
+            print(Fore.CYAN + audio_file + Fore.RESET)
 
         file_size = calc_file_size(track)
         print("Track Download Size: " + format_size(file_size))
 
-        audio_file_enc = enc_str(self.audio_file)
-
-        if args.output_type == "wav":
-            self.wav_file = wave.open(audio_file_enc, "wb")
-            self.wav_file.setparams((2, 2, 44100, 0, 'NONE', 'not compressed'))
-        elif args.output_type == "pcm":
-            self.pcm_file = open(audio_file_enc, 'wb')
-        elif args.output_type == "flac":
-            self.rip_proc = Popen(
-                ["flac", "-f", ("-" + str(args.comp)), "--silent", "--endian",
-                 "little", "--channels", "2", "--bps", "16", "--sample-rate",
-                 "44100", "--sign", "signed", "-o", audio_file_enc, "-"],
-                stdin=PIPE)
-        elif args.output_type == "alac.m4a":
-            self.rip_proc = Popen(
-                ["avconv", "-nostats", "-loglevel", "0", "-f", "s16le", "-ar",
-                 "44100", "-ac", "2", "-channel_layout", "stereo", "-i", "-",
-                 "-acodec", "alac", audio_file_enc],
-                stdin=PIPE)
-        elif args.output_type == "ogg":
-            if args.cbr:
-                self.rip_proc = Popen(
-                    ["oggenc", "--quiet", "--raw", "-b", args.bitrate, "-o",
-                     audio_file_enc, "-"], stdin=PIPE)
-            else:
-                self.rip_proc = Popen(
-                    ["oggenc", "--quiet", "--raw", "-q", args.vbr, "-o",
-                     audio_file_enc, "-"], stdin=PIPE)
-        elif args.output_type == "opus":
-            if args.cbr:
-                self.rip_proc = Popen(
-                    ["opusenc", "--quiet", "--comp", args.comp, "--cvbr",
-                     "--bitrate", str(int(args.bitrate) / 2), "--raw",
-                     "--raw-rate", "44100", "-", audio_file_enc], stdin=PIPE)
-            else:
-                self.rip_proc = Popen(
-                    ["opusenc", "--quiet", "--comp", args.comp, "--vbr",
-                     "--bitrate", args.vbr, "--raw", "--raw-rate", "44100",
-                     "-", audio_file_enc], stdin=PIPE)
-        elif args.output_type == "aac":
-            if self.dev_null is None:
-                self.dev_null = open(os.devnull, 'wb')
-            if args.cbr:
-                self.rip_proc = Popen(
-                    ["faac", "-P", "-X", "-b", args.bitrate, "-o",
-                     audio_file_enc, "-"], stdin=PIPE,
-                    stdout=self.dev_null, stderr=self.dev_null)
-            else:
-                self.rip_proc = Popen(
-                    ["faac", "-P", "-X", "-q", args.vbr, "-o",
-                     audio_file_enc, "-"], stdin=PIPE,
-                    stdout=self.dev_null, stderr=self.dev_null)
-        elif args.output_type == "m4a":
-            if args.cbr:
-                self.rip_proc = Popen(
-                    ["fdkaac", "-S", "-R", "-b",
-                     args.bitrate, "-o", audio_file_enc, "-"], stdin=PIPE)
-            else:
-                self.rip_proc = Popen(
-                    ["fdkaac", "-S", "-R", "-m", args.vbr,
-                     "-o", audio_file_enc, "-"], stdin=PIPE)
-        elif args.output_type == "mp3":
-            lame_args = ["lame", "--silent"]
-
-            if args.stereo_mode is not None:
-                lame_args.extend(["-m", args.stereo_mode])
-
-            if args.cbr:
-                lame_args.extend(["-cbr", "-b", args.bitrate])
-            else:
-                lame_args.extend(["-V", args.vbr])
-
-            lame_args.extend(["-h", "-r", "-", audio_file_enc])
-            self.rip_proc = Popen(lame_args, stdin=PIPE)
-
-        if self.rip_proc is not None:
-            self.pipe = self.rip_proc.stdin
+        # if the prefetcher already resolved the metadata, the encoders
+        # can tag the files themselves
+        self.rip_metadata = self.prefetcher.metadata(
+            track, self.current_playlist)
+        if self.spool is not None:
+            rip_files = [self.spool.entry(track.link.uri).pcm_file]
+            encode_metadata = None
+        else:
+            rip_files = self.audio_files
+            encode_metadata = self.rip_metadata
+        self.encoders = [spawner.acquire(rip_file, encode_metadata)
+                         for spawner, rip_file
+                         in zip(self.spawners, rip_files)]
+
+        self.progress_bytes = 0
+        self.writer = EncoderWriter(
+            self.rip_buffer, self.writer_stats,
+            int(args.write_size) * KB_BYTES, self.encoders)
+        self.writer.start()
 
         self.ripping.set()
 
+    def prespawn_next(self, rip_order, pos):
+        """start the spare encoders for the next track, again with its
+        tags once the prefetcher has resolved them"""
+        metadata = None
+        if self.spool is None:
+            for next_pos in range(pos + 1, len(rip_order)):
+                plan = rip_order[next_pos][0]
+                if plan.available and not plan.skip and plan.uri is not None:
+                    metadata = self.prefetcher.peek(plan.uri)
+                    break
+        for spawner in self.spawners:
+            spawner.prespawn(metadata)
+
     def finish_rip(self, track):
         self.progress.end_track()
-        if self.pipe is not None:
-            print(Fore.GREEN + 'Rip complete' + Fore.RESET)
-            self.pipe.flush()
-            self.pipe.close()
-
-            # wait for process to end before continuing
-            ret_code = self.rip_proc.wait()
-            if ret_code != 0:
-                print(
-                    Fore.YELLOW + "Warning: encoder returned non-zero "
-                                  "error code " + str(ret_code) + Fore.RESET)
-            self.rip_proc = None
-            self.pipe = None
-
-        if self.wav_file is not None:
-            self.wav_file.close()
-            self.wav_file = None
-
-        if self.pcm_file is not None:
-            self.pcm_file.flush()
-            os.fsync(self.pcm_file.fileno())
-            self.pcm_file.close()
-            self.pcm_file = None
-
         self.ripping.clear()
-        self.post.log_success(track)
-
-    def rip(self, session, sample_rate, frame_bytes, num_frames):
-        if self.ripping.is_set():
-            self.progress.update_progress(num_frames, sample_rate)
-            if self.pipe is not None:
-                self.pipe.write(frame_bytes)
-
-            if self.wav_file is not None:
-                self.wav_file.writeframes(frame_bytes)
-
-            if self.pcm_file is not None:
-                self.pcm_file.write(frame_bytes)
+        if self.session_worker is not None:
+            self.session_worker.report_progress(self.progress.total_position)
+
+    def detach_rip_job(self, idx, track):
+        """hand the current track's encoders over to a RipJob so the
+        next track can be prepared"""
+        job = RipJob(idx, track, self.rip_metadata, self.encoders,
+                     self.audio_files)
+        self.audio_file = None
+        self.audio_files = None
+        self.encoders = None
+        self.rip_metadata = None
+        return job
+
+    def complete_rip(self, job):
+        try:
+            job.close()
+            for encoder in job.encoders:
+                self.output_index.add(encoder.audio_file)
+            # the ledger is updated once the files are tagged
+            self.post.log_success(job.track)
+
+            if self.spool is not None:
+                self.spool.add(job.track, job.metadata, job.audio_files)
+                # removed from the playlist once the spool has encoded it
+                self.spooled.append((job.idx, job.track.link.uri))
+            else:
+                # update id3v2 with metadata and embed front cover image,
+                # once per output format
+                for encoder in job.encoders:
+                    self.tagging.submit(encoder.audio_file, job.metadata,
+                                        encoder.encoder.args, encoder.tagged)
+
+                # make a note of the index and remove all the
+                # tracks from the playlist when everything is done
+                self.post.queue_remove_from_playlist(job.idx)
+        except (spotify.Error, Exception) as e:
+            print(Fore.RED + "Error while finishing " +
+                  job.track.link.uri + Fore.RESET)
+            print(str(e))
+            self.post.clean_up_partial(job.encoders)
+            self.post.log_failure(job.track)
+
+    def update_rip_progress(self):
+        """returns False if nothing was written since the last call"""
+        written = self.writer.bytes_written
+        if written == self.progress_bytes:
+            return False
+
+        frame_size = self.rip_buffer.frame_size
+        num_frames = (written - self.progress_bytes) // frame_size
+        self.progress_bytes += num_frames * frame_size
+        self.progress.update_progress(num_frames,
+                                      self.rip_buffer.sample_rate)
+        if self.session_worker is not None:
+            self.session_worker.report_progress(
+                self.progress.total_position + self.progress.song_position)
+        return True
+
+    def stop_writer(self):
+        if self.writer is not None:
+            self.writer.stop()
 
     def abort_rip(self):
         self.ripping.clear()
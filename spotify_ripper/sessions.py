@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from colorama import Fore, AnsiToWin32
+from spotify_ripper.utils import *
+import os
+import sys
+import copy
+import time
+import getpass
+import multiprocessing
+
+
+class SessionState(object):
+    """State shared by all sessions of a pool.
+
+    ``claims`` maps a track key (``"<uri index>:<track index>"``) to the
+    session ripping it, ``done`` holds the keys that are finished and
+    ``removals`` the ones that can be removed from their playlist.
+    """
+
+    def __init__(self, context, manager, num_sessions):
+        self.num_sessions = num_sessions
+        self.lock = context.Lock()
+        self.claims = manager.dict()
+        self.done = manager.dict()
+        self.removals = manager.dict()
+        self.positions = context.Array('d', num_sessions)
+        self.exited = context.Array('b', num_sessions)
+        self.successes = context.Value('i', 0)
+        self.failures = context.Value('i', 0)
+        self.total_duration = context.Value('d', 0.0)
+
+
+class SessionWorker(object):
+    """The view a single session has of the pool.
+
+    Every session walks the same list of tracks and claims them one at a
+    time, so together they work through it like a single queue.  The
+    first session is the primary: it calculates the totals and, once the
+    other sessions are done with a URI, creates the playlist files and
+    removes ripped tracks from the playlist.
+    """
+
+    def __init__(self, state, session_idx, session_dir):
+        self.state = state
+        self.session_idx = session_idx
+        self.session_dir = session_dir
+        self.claimed = {}
+
+    @property
+    def is_primary(self):
+        return self.session_idx == 0
+
+    def track_key(self, uri_idx, idx):
+        return str(uri_idx) + ":" + str(idx)
+
+    def claim(self, uri_idx, idx):
+        """True if this session should rip the track"""
+        key = self.track_key(uri_idx, idx)
+        with self.state.lock:
+            if key in self.state.claims:
+                return False
+            self.state.claims[key] = self.session_idx
+        self.claimed.setdefault(uri_idx, []).append(key)
+        return True
+
+    def finish_uri(self, uri_idx):
+        """mark every track of the URI claimed by this session as done"""
+        for key in self.claimed.pop(uri_idx, []):
+            self.state.done[key] = True
+
+    def queue_remove(self, uri_idx, idx):
+        self.state.removals[self.track_key(uri_idx, idx)] = True
+
+    def wait_uri(self, uri_idx, num_tracks, abort):
+        """wait until the other sessions are done with the URI's tracks
+        and return the indexes to remove from the playlist"""
+        keys = [self.track_key(uri_idx, idx) for idx in range(num_tracks)]
+        while not abort.is_set():
+            pending = [key for key in keys if key in self.state.claims and
+                       key not in self.state.done and
+                       not self.state.exited[self.state.claims[key]]]
+            if not pending:
+                break
+            time.sleep(0.5)
+
+        return [idx for idx, key in enumerate(keys)
+                if key in self.state.removals]
+
+    def log_result(self, success):
+        counter = self.state.successes if success else self.state.failures
+        with counter.get_lock():
+            counter.value += 1
+
+    def set_total(self, total_duration):
+        self.state.total_duration.value = total_duration
+
+    def report_progress(self, position):
+        self.state.positions[self.session_idx] = position
+
+    def exit(self):
+        self.state.exited[self.session_idx] = True
+
+
+def run_session(rip_func, args, state, session_idx):
+    """entry point of a session process"""
+    init_util_globals(args)
+    session_dir = os.path.join(settings_dir(), "sessions", str(session_idx))
+    if not path_exists(session_dir):
+        os.makedirs(enc_str(session_dir))
+
+    # the parent owns the terminal, each session logs to its own file
+    log_file = open(os.path.join(session_dir, "spotify-ripper.log"), 'a')
+    wrapper = AnsiToWin32(log_file, strip=True)
+    sys.stdout = wrapper.stream if wrapper.should_wrap() else log_file
+    args.has_log = True
+
+    # keep the failure logs of the sessions apart
+    if args.fail_log is not None and session_idx > 0:
+        name, ext = os.path.splitext(args.fail_log[0])
+        args.fail_log = [name + "." + str(session_idx) + ext]
+
+    worker = SessionWorker(state, session_idx, session_dir)
+    args.session_worker = worker
+    try:
+        rip_func(args)
+    finally:
+        worker.exit()
+        sys.stdout.flush()
+
+
+class SessionPool(object):
+    """Rips with several Spotify sessions at the same time.
+
+    libspotify only allows a single session per process, so each session
+    runs in a process of its own with its own settings and cache
+    directory (``<settings>/sessions/<n>``) and, if ``--session-users``
+    is used, its own account.  The sessions share one work queue and
+    report their progress back here, where it is shown as a single total
+    and ETA.
+    """
+
+    def __init__(self, args, num_sessions, rip_func):
+        self.args = args
+        self.num_sessions = num_sessions
+        self.rip_func = rip_func
+
+        # the sessions inherit the parent's setup (e.g. the mutagen
+        # patch), which is only the case for forked processes
+        try:
+            self.context = multiprocessing.get_context("fork")
+        except (AttributeError, ValueError):
+            self.context = multiprocessing
+        self.manager = self.context.Manager()
+        self.state = SessionState(self.context, self.manager, num_sessions)
+        self.procs = []
+        self.ema_rate = None
+        self.stat_prev = None
+
+    def session_accounts(self):
+        """one (user, password) per session, passwords are asked for
+        here since the sessions don't have a terminal"""
+        args = self.args
+        users = args.session_users if args.session_users is not None \
+            else (args.user if args.user is not None else [None])
+
+        passwords = {}
+        accounts = []
+        for i in range(self.num_sessions):
+            user = users[i % len(users)]
+            if user is not None and user not in passwords:
+                if args.password is not None and args.user is not None and \
+                        user == args.user[0]:
+                    passwords[user] = args.password[0]
+                elif not args.last:
+                    passwords[user] = getpass.getpass(
+                        "Password for " + user + ": ")
+                else:
+                    passwords[user] = None
+            accounts.append((user, passwords.get(user)))
+
+        if len(set(users)) < self.num_sessions:
+            print(Fore.YELLOW + "Warning: Spotify only plays on one session "
+                                "per account at a time, sessions sharing an "
+                                "account will lose their play token" +
+                  Fore.RESET)
+        return accounts
+
+    def session_args(self, user, password):
+        args = copy.copy(self.args)
+        args.user = [user] if user is not None else None
+        args.password = [password] if password is not None else None
+        return args
+
+    def run(self):
+        accounts = self.session_accounts()
+
+        for session_idx, (user, password) in enumerate(accounts):
+            proc = self.context.Process(
+                target=run_session,
+                args=(self.rip_func, self.session_args(user, password),
+                      self.state, session_idx))
+            proc.name = 'SpotifySession-' + str(session_idx)
+            proc.start()
+            self.procs.append(proc)
+
+        print("Started " + str(self.num_sessions) + " sessions, logging to " +
+              os.path.join(settings_dir(), "sessions"))
+
+        try:
+            while any(proc.is_alive() for proc in self.procs):
+                self.update_progress()
+                for proc in self.procs:
+                    proc.join(1.0 / self.num_sessions)
+        except KeyboardInterrupt:
+            # the sessions got the interrupt as well and abort themselves
+            print("\n" + Fore.RED + "Aborting..." + Fore.RESET)
+            for proc in self.procs:
+                proc.join(30)
+                if proc.is_alive():
+                    proc.terminate()
+            sys.exit(1)
+
+        self.update_progress()
+        print_str("\n")
+        self.print_summary()
+        self.manager.shutdown()
+
+        if any(proc.exitcode != 0 for proc in self.procs):
+            sys.exit(1)
+
+    def update_progress(self):
+        if self.args.has_log:
+            return
+
+        position = sum(self.state.positions)
+        duration = self.state.total_duration.value
+        active = sum(1 for proc in self.procs if proc.is_alive())
+
+        # exponential moving average of the combined rate
+        now = time.time()
+        if self.stat_prev is not None and now > self.stat_prev[1]:
+            rate = (position - self.stat_prev[0]) / (now - self.stat_prev[1])
+            self.ema_rate = rate if self.ema_rate is None else \
+                0.05 * rate + 0.95 * self.ema_rate
+        self.stat_prev = (position, now)
+
+        output = "Sessions: " + str(active) + "/" + \
+            str(self.num_sessions) + "  Total: " + \
+            format_time(position // 1000, duration // 1000)
+        if duration > 0:
+            prog_width = 40
+            x = min(int(position * prog_width // duration), prog_width)
+            output += " [" + ("=" * x) + (" " * (prog_width - x)) + "]"
+            if self.ema_rate is not None and self.ema_rate > 0.00000001:
+                eta = max(duration - position, 0) / self.ema_rate
+                output += " (~" + format_time(eta, short=True) + \
+                    " remaining)"
+        print_str("\r\033[2K" + output)
+
+    def print_summary(self):
+        print(Fore.GREEN + "Ripped " + str(self.state.successes.value) +
+              " tracks with " + str(self.num_sessions) + " sessions" +
+              Fore.RESET)
+        if self.state.failures.value > 0:
+            print(Fore.RED + str(self.state.failures.value) +
+                  " tracks failed, see the session logs in " +
+                  os.path.join(settings_dir(), "sessions") + Fore.RESET)
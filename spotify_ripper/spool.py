@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from colorama import Fore
+from spotify_ripper.utils import *
+from spotify_ripper.encoders import get_encoder
+from spotify_ripper.ledger import output_quality
+from spotify_ripper.tags import TrackMetadata, set_metadata_tags
+import os
+import json
+import codecs
+import shutil
+import threading
+import spotify
+
+try:
+    # Python 3
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+
+class SpoolEntry(object):
+    """A track in the spool: its raw PCM plus a json sidecar with the
+    metadata and the output files it still has to be encoded to"""
+
+    def __init__(self, spool_dir, uri):
+        self.uri = uri
+        base_name = os.path.join(spool_dir, uri.replace(":", "_"))
+        self.pcm_file = base_name + ".pcm"
+        self.sidecar_file = base_name + ".json"
+        self.metadata = None
+        self.outputs = []
+
+    def save(self):
+        """the sidecar is only written once the PCM is complete, so its
+        presence marks a complete entry"""
+        obj = {
+            "metadata": self.metadata.to_dict(),
+            "outputs": [{"output_type": output_type,
+                         "quality": quality,
+                         "audio_file": audio_file}
+                        for output_type, quality, audio_file
+                        in self.outputs]
+        }
+        tmp_file = self.sidecar_file + ".tmp"
+        with codecs.open(enc_str(tmp_file), 'w', "utf-8") as sidecar:
+            sidecar.write(json.dumps(obj, indent=4, separators=(',', ': ')))
+        shutil.move(enc_str(tmp_file), enc_str(self.sidecar_file))
+
+    def load(self):
+        with codecs.open(enc_str(self.sidecar_file), 'r', "utf-8") as sidecar:
+            obj = json.loads(sidecar.read())
+        self.metadata = TrackMetadata.from_dict(obj["metadata"])
+        # entries spooled before the quality was recorded have none
+        self.outputs = [(output["output_type"], output.get("quality"),
+                         output["audio_file"])
+                        for output in obj["outputs"]]
+
+    def remove(self):
+        rm_file(enc_str(self.pcm_file))
+        rm_file(enc_str(self.sidecar_file))
+
+
+class Spool(object):
+    """Rip now, encode later.
+
+    While ripping, tracks are only written to the spool directory as raw
+    PCM.  A pool of ``num_workers`` threads, each driving one encoder
+    process reading straight from the spooled file, encodes and tags
+    them in the background and deletes the PCM once all outputs are
+    done.  Complete entries left over by an interrupted run are picked
+    up again by :meth:`resume`.
+    """
+
+    def __init__(self, args, ripper, spool_dir, num_workers):
+        self.args = args
+        self.ripper = ripper
+        self.spool_dir = norm_path(spool_dir)
+        self.num_workers = max(num_workers, 1)
+        self.queue = queue.Queue()
+        self.queued = set()
+        self.lock = threading.Lock()
+        self.encoded = threading.Condition(self.lock)
+        self.encoded_tracks = 0
+
+        if not path_exists(self.spool_dir):
+            os.makedirs(enc_str(self.spool_dir))
+
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self.worker)
+            thread.name = 'SpotifySpoolThread'
+            thread.daemon = True
+            thread.start()
+
+    def entry(self, uri):
+        return SpoolEntry(self.spool_dir, uri)
+
+    def has_track(self, uri):
+        """True if the track is already spooled and waiting to be
+        encoded"""
+        return uri in self.queued or \
+            path_exists(self.entry(uri).sidecar_file)
+
+    def resume(self):
+        """queue entries left over by a previous run and delete PCM of
+        tracks that were interrupted while streaming"""
+        sidecar_uris = set()
+        for file_name in os.listdir(enc_str(self.spool_dir)):
+            file_name = to_ascii(file_name)
+            base_name, ext = os.path.splitext(file_name)
+            uri = base_name.replace("_", ":")
+            if ext == ".json":
+                sidecar_uris.add(uri)
+
+        for file_name in os.listdir(enc_str(self.spool_dir)):
+            file_name = to_ascii(file_name)
+            base_name, ext = os.path.splitext(file_name)
+            uri = base_name.replace("_", ":")
+            if ext == ".pcm" and uri not in sidecar_uris:
+                rm_file(enc_str(os.path.join(self.spool_dir, file_name)))
+
+        if sidecar_uris:
+            print(Fore.YELLOW + "Resuming encoding of " +
+                  str(len(sidecar_uris)) + " spooled tracks" + Fore.RESET)
+        for uri in sorted(sidecar_uris):
+            entry = self.entry(uri)
+            try:
+                entry.load()
+            except (IOError, OSError, ValueError, KeyError) as e:
+                print(Fore.RED + "Could not read spool entry " +
+                      entry.sidecar_file + Fore.RESET)
+                print(str(e))
+                continue
+            self.submit(entry)
+
+    def add(self, track, metadata, audio_files):
+        """called once the track's PCM is in the spool"""
+        entry = self.entry(track.link.uri)
+        entry.metadata = metadata
+        entry.outputs = [
+            (output_args.output_type, output_quality(output_args),
+             audio_file) for output_args, audio_file
+            in zip(self.args.output_args, audio_files)]
+        entry.save()
+        self.submit(entry)
+
+    def submit(self, entry):
+        with self.lock:
+            self.queued.add(entry.uri)
+        self.queue.put(entry)
+
+    def worker(self):
+        while True:
+            entry = self.queue.get()
+            try:
+                self.encode(entry)
+            except (spotify.Error, Exception) as e:
+                print(Fore.RED + "Could not encode spooled track " +
+                      entry.uri + ", keeping it for the next run" +
+                      Fore.RESET)
+                print(str(e))
+            finally:
+                with self.lock:
+                    self.queued.discard(entry.uri)
+                    self.encoded.notify_all()
+                self.queue.task_done()
+
+    def encode(self, entry):
+        metadata = entry.metadata
+
+        # resolve once and remember it, so a resumed entry doesn't need
+        # another round-trip
+        if not metadata.resolved:
+            if metadata.track is None:
+                link = self.ripper.session.get_link(metadata.uri)
+                metadata.track = link.as_track()
+            metadata.resolve(self.args, self.ripper)
+            entry.save()
+
+        for pos, (output_type, quality, audio_file) in \
+                enumerate(entry.outputs):
+            _args = self.output_args(pos, output_type, quality)
+            if _args is None:
+                print(Fore.YELLOW + "Skipping " + output_type + " output of " +
+                      entry.uri + ", it is no longer configured" + Fore.RESET)
+                continue
+
+            tagged = self.encode_output(entry, _args, audio_file, metadata)
+            try:
+                set_metadata_tags(_args, audio_file, metadata,
+                                  self.ripper.output_index, tagged)
+            except Exception as e:
+                self.ripper.post.log_tag_failure(metadata, audio_file, e)
+                continue
+
+            # raw PCM is 44.1kHz 16bit stereo
+            duration = os.path.getsize(enc_str(entry.pcm_file)) * 1000 // \
+                (44100 * 4)
+            self.ripper.ledger.add_rip(entry.uri, _args, audio_file,
+                                       duration)
+
+        entry.remove()
+        with self.lock:
+            self.encoded_tracks += 1
+
+    def output_args(self, pos, output_type, quality):
+        """the configured output a spooled output is encoded with, there
+        can be several outputs of the same type"""
+        output_args = self.args.output_args
+        if quality is None:
+            if pos < len(output_args) and \
+                    output_args[pos].output_type == output_type:
+                return output_args[pos]
+            return None
+
+        for _args in output_args:
+            if _args.output_type == output_type and \
+                    output_quality(_args) == quality:
+                return _args
+        return None
+
+    def encode_output(self, entry, args, audio_file, metadata):
+        """encode the spooled track, returns the tag fields the encoder
+        wrote itself"""
+        encoder = get_encoder(args.output_type)(args)
+        with open(enc_str(entry.pcm_file), 'rb') as pcm_file:
+            proc = encoder.spawn(stdin=pcm_file, metadata=metadata)
+            proc.bind(audio_file)
+            try:
+                # wav and pcm outputs are written here, everything else
+                # reads the spooled file directly
+                if proc.rip_proc is None:
+                    while True:
+                        data = pcm_file.read(MB_BYTES)
+                        if not data:
+                            break
+                        if proc.wav_file is not None:
+                            proc.wav_file.writeframes(data)
+                        else:
+                            proc.pcm_file.write(data)
+                proc.close()
+                self.ripper.output_index.add(audio_file)
+            except (IOError, OSError):
+                proc.abort()
+                raise
+        return proc.tagged
+
+    def wait_tracks(self, uris):
+        """block until the tracks are encoded (or failed to), a track
+        that failed is still in the spool afterwards"""
+        uris = set(uris)
+        with self.lock:
+            while not self.queued.isdisjoint(uris):
+                self.encoded.wait()
+
+    def wait(self):
+        """block until everything in the spool is encoded"""
+        self.queue.join()
@@ -57,8 +57,8 @@ class Sync(object):
         else:
             return {}
 
-    def sync_playlist(self, playlist):
-        args = self.args
+    def sync_playlist(self, playlist, plans):
+        output_index = self.ripper.output_index
         lib = self.load_sync_library(playlist)
         new_lib = {}
 
@@ -66,34 +66,27 @@ class Sync(object):
 
         # remove any missing files from the lib or playlist
         uris = set([t.link.uri for t in playlist.tracks])
-        for uri, file_path in lib.items():
-            encoding = "ascii" if args.ascii else "utf-8"
-            file_path = file_path.encode(encoding)
-            if not path_exists(file_path):
+        for uri, file_path in list(lib.items()):
+            if not output_index.exists(file_path):
                 del lib[uri]
             elif uri not in uris:
-                os.remove(file_path)
+                output_index.remove(file_path)
                 del lib[uri]
 
         # check if we need to rename any songs already ripped
-        for idx, track in enumerate(playlist.tracks):
-            try:
-                track.load()
-                if track.availability != 1:
-                    continue
-
-                audio_file = self.ripper.format_track_path(idx, track)
+        for plan in plans:
+            if not plan.available:
+                continue
 
-                # rename the ripped file if needed
-                if track.link.uri in lib:
-                    if lib[track.link.uri] != audio_file:
-                        os.rename(lib[track.link.uri], audio_file)
+            audio_file = plan.audio_file
 
-                # add file to new lib
-                new_lib[track.link.uri] = audio_file
+            # rename the ripped file if needed
+            if plan.uri in lib:
+                if lib[plan.uri] != audio_file:
+                    output_index.move(lib[plan.uri], audio_file)
 
-            except spotify.Error as e:
-                continue
+            # add file to new lib
+            new_lib[plan.uri] = audio_file
 
         # save new lib
         self.save_sync_library(playlist, new_lib)
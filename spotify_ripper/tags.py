@@ -6,60 +6,106 @@ from colorama import Fore, Style
 from mutagen import mp3, id3, flac, oggvorbis, oggopus, aac
 from stat import ST_SIZE
 from spotify_ripper.utils import *
+from spotify_ripper.metadata import AlbumInfo
 from datetime import datetime
+from collections import OrderedDict
 import os
 import sys
 import base64
-
-
-def set_metadata_tags(args, audio_file, track, ripper):
-    # log completed file
-    print(Fore.GREEN + Style.BRIGHT + os.path.basename(audio_file) +
-          Style.NORMAL + "\t[ " + format_size(os.stat(audio_file)[ST_SIZE]) +
-          " ]" + Fore.RESET)
-
-    if args.output_type == "wav" or args.output_type == "pcm":
-        print(Fore.YELLOW + "Skipping metadata tagging for " +
-              args.output_type + " encoding...")
-        return
-
-    # ensure everything is loaded still
-    if not track.is_loaded:
-        track.load()
-    if not track.album.is_loaded:
-        track.album.load()
-    album_browser = track.album.browse()
-    album_browser.load()
-
-    # calculate num of tracks on disc and num of dics
-    num_discs = 0
-    num_tracks = 0
-    for track_browse in album_browser.tracks:
-        if (track_browse.disc == track.disc and
-                track_browse.index > track.index):
-            num_tracks = track_browse.index
-        if track_browse.disc > num_discs:
-            num_discs = track_browse.disc
-
-    # try to get genres from Spotify's Web API
-    genres = None
-    if args.genres is not None:
-        genres = ripper.web.get_genres(args.genres[0], track)
-
-    # use mutagen to update id3v2 tags and vorbis comments
-    try:
-        audio = None
-        on_error = 'replace' if args.ascii_path_only else 'ignore'
-        album = to_ascii(track.album.name, on_error)
-        artist = to_ascii(track.artists[0].name, on_error)
-        title = to_ascii(track.name, on_error)
+import threading
+
+try:
+    # Python 3
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+
+class TrackMetadata(object):
+    """Snapshot of a track's metadata used for tagging.
+
+    Created on the ripping thread from a loaded track.  Anything that
+    needs a round-trip (album info, Web API genres, cover image) is
+    only fetched by :meth:`resolve`, which runs on a tagging worker.
+    """
+
+    fields = ["uri", "title", "artist", "album", "year", "disc", "index",
+              "num_tracks", "num_discs", "genres", "comment", "resolved"]
+
+    def __init__(self, track=None, playlist=None):
+        self.num_tracks = 0
+        self.num_discs = 0
+        self.genres = None
+        self.comment = None
+        self.cover = None
+        self.resolved = False
+
+        self.track = track
+        self.playlist = playlist
+        self.lock = threading.Lock()
+
+        if track is not None:
+            self.uri = track.link.uri
+            self.title = track.name
+            self.artist = track.artists[0].name
+            self.album = track.album.name
+            self.year = track.album.year
+            self.disc = track.disc
+            self.index = track.index
+
+    def to_dict(self):
+        obj = dict((field, getattr(self, field)) for field in self.fields)
+        if self.cover is not None:
+            obj["cover"] = base64.b64encode(self.cover).decode("ascii")
+        return obj
+
+    @classmethod
+    def from_dict(cls, obj):
+        metadata = cls()
+        for field in cls.fields:
+            setattr(metadata, field, obj.get(field))
+        if obj.get("cover") is not None:
+            metadata.cover = base64.b64decode(obj["cover"])
+        return metadata
+
+    def resolve(self, args, ripper):
+        # several outputs of the same track share the snapshot
+        with self.lock:
+            if not self.resolved:
+                self._resolve(args, ripper)
+
+    def _resolve(self, args, ripper):
+        track = self.track
+
+        # ensure everything is loaded still
+        if not track.is_loaded:
+            track.load()
+
+        # the album is only browsed for the first of its tracks
+        album_info = ripper.metadata.get_album(track.album.link.uri)
+        if album_info is None:
+            if not track.album.is_loaded:
+                track.album.load()
+            album_browser = track.album.browse()
+            album_browser.load()
+            album_info = AlbumInfo.from_browser(album_browser)
+            ripper.metadata.put_album(album_info)
+
+        # num of tracks on disc and num of dics
+        self.num_tracks = album_info.num_tracks(self.disc)
+        self.num_discs = album_info.num_discs
+
+        # try to get genres from Spotify's Web API
+        if args.genres is not None:
+            self.genres = ripper.web.get_genres(args.genres[0], track)
 
         # the comment can include playlist create time and/or creator
         if args.comment is not None:
             comment = args.comment[0]
             if comment.find("{create_time}") >= 0 or \
                     comment.find("{creator}") >= 0:
-                pl_track = get_playlist_track(track, ripper.current_playlist)
+                pl_track = get_playlist_track(track, self.playlist)
                 if pl_track is not None:
                     if comment.find("{create_time}") >= 0:
                         create_time = datetime.fromtimestamp(
@@ -69,396 +115,532 @@ def set_metadata_tags(args, audio_file, track, ripper):
                         comment = comment.replace(
                                 "{creator}",
                                 to_ascii(pl_track.creator.display_name))
-            comment_ascii = to_ascii(comment, on_error)
-
-        if genres is not None and genres:
-            genres_ascii = [to_ascii(genre) for genre in genres]
+            self.comment = comment
 
-        # cover art image
-        image = track.album.cover()
+        # cover art image, only loaded once per image
+        if album_info.cover_uri is not None:
+            def load_image():
+                image = ripper.session.get_image(album_info.cover_uri)
+                image.load()
+                return image.data
+            self.cover = ripper.covers.get(album_info.cover_uri, load_image)
+
+        # drop the pyspotify objects, everything we need is resolved
+        self.track = None
+        self.playlist = None
+        self.resolved = True
+
+
+class TaggingPool(object):
+    """Tags finished files on worker threads.
+
+    With ``num_workers`` of 0, files are tagged synchronously on the
+    calling thread.
+    """
+
+    def __init__(self, args, ripper, num_workers):
+        self.args = args
+        self.ripper = ripper
+        self.num_workers = num_workers
+        self.queue = queue.Queue()
+
+        for i in range(num_workers):
+            thread = threading.Thread(target=self.worker)
+            thread.name = 'SpotifyTaggingThread'
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, audio_file, metadata, args=None, tagged=None):
+        """tag ``audio_file`` using the output settings in ``args``,
+        except for the ``tagged`` fields the encoder already wrote"""
+        if args is None:
+            args = self.args
+
+        if self.num_workers <= 0:
+            self.tag(audio_file, metadata, args, tagged)
+        else:
+            self.queue.put((audio_file, metadata, args, tagged))
+
+    def worker(self):
+        while True:
+            audio_file, metadata, args, tagged = self.queue.get()
+            try:
+                self.tag(audio_file, metadata, args, tagged)
+            finally:
+                self.queue.task_done()
+
+    def tag(self, audio_file, metadata, args, tagged=None):
+        try:
+            if args.output_type not in ("wav", "pcm"):
+                metadata.resolve(args, self.ripper)
+            set_metadata_tags(args, audio_file, metadata,
+                              self.ripper.output_index, tagged)
+        except Exception as e:
+            self.ripper.post.log_tag_failure(metadata, audio_file, e)
+            return
+
+        # only a tagged file counts as done
+        self.ripper.ledger.add_rip(metadata.uri, args, audio_file,
+                                   metadata.track.duration)
+
+    def wait(self):
+        """block until all submitted files are tagged"""
+        self.queue.join()
+
+
+def tag_fields(args, meta):
+    """the text tags of a track as Vorbis comment fields, the encoders
+    that can tag at encode time use the same values"""
+    on_error = 'replace' if args.ascii_path_only else 'ignore'
+
+    def tag_str(_str, _on_error=on_error):
+        return _str if args.ascii_path_only else to_ascii(_str, _on_error)
+
+    fields = OrderedDict()
+    if meta.album is not None:
+        fields["ALBUM"] = tag_str(meta.album)
+    fields["TITLE"] = tag_str(meta.title)
+    fields["ARTIST"] = tag_str(meta.artist)
+    fields["YEAR"] = str(meta.year)
+    fields["DISCNUMBER"] = str(meta.disc)
+    fields["DISCTOTAL"] = str(meta.num_discs)
+    fields["TRACKNUMBER"] = str(meta.index)
+    fields["TRACKTOTAL"] = str(meta.num_tracks)
+    if meta.comment is not None:
+        fields["COMMENT"] = tag_str(meta.comment)
+    if meta.genres:
+        fields["GENRE"] = ", ".join(
+            [tag_str(genre, 'ignore') for genre in meta.genres])
+    return fields
+
+
+def set_metadata_tags(args, audio_file, meta, output_index=None,
+                      tagged=None):
+    """``tagged`` are the fields (and "COVER") the encoder already wrote,
+    the file is only saved again for the others"""
+    # log completed file
+    print(Fore.GREEN + Style.BRIGHT + os.path.basename(audio_file) +
+          Style.NORMAL + "\t[ " + format_size(os.stat(audio_file)[ST_SIZE]) +
+          " ]" + Fore.RESET)
 
-        def tag_to_ascii(_str, _str_ascii):
-            return _str if args.ascii_path_only else _str_ascii
+    if args.output_type == "wav" or args.output_type == "pcm":
+        print(Fore.YELLOW + "Skipping metadata tagging for " +
+              args.output_type + " encoding...")
+        return
 
-        def idx_of_total_str(_idx, _total):
-            if _total > 0:
-                return "%d/%d" % (_idx, _total)
-            else:
-                return "%d" % (_idx)
+    genres = meta.genres
+    num_tracks = meta.num_tracks
+    num_discs = meta.num_discs
 
-        def save_cover_image(embed_image_func):
-            if image is not None:
-                image.load()
-                if args.cover_file is not None:
-                    cover_path = os.path.dirname(audio_file)
-                    cover_file = os.path.join(cover_path, args.cover_file[0])
-                    if not path_exists(cover_file):
-                        with open(cover_file, "wb") as f:
-                            f.write(image.data)
+    # use mutagen to update id3v2 tags and vorbis comments
+    # errors go to the caller, which logs them as tag failures
+    audio = None
+    on_error = 'replace' if args.ascii_path_only else 'ignore'
+    album = to_ascii(meta.album, on_error)
+    artist = to_ascii(meta.artist, on_error)
+    title = to_ascii(meta.title, on_error)
+
+    if meta.comment is not None:
+        comment = meta.comment
+        comment_ascii = to_ascii(comment, on_error)
+
+    if genres is not None and genres:
+        genres_ascii = [to_ascii(genre) for genre in genres]
+
+    # cover art image
+    image = meta.cover
+    tagged = tagged or set()
+
+    def tag_to_ascii(_str, _str_ascii):
+        return _str if args.ascii_path_only else _str_ascii
+
+    def idx_of_total_str(_idx, _total):
+        if _total > 0:
+            return "%d/%d" % (_idx, _total)
+        else:
+            return "%d" % (_idx)
+
+    def save_cover_image(embed_image_func):
+        if image is not None and "COVER" not in tagged:
+            if args.cover_file is not None:
+                cover_path = os.path.dirname(audio_file)
+                cover_file = os.path.join(cover_path, args.cover_file[0])
+                if output_index is None:
+                    cover_exists = path_exists(cover_file)
                 else:
-                    embed_image_func()
+                    cover_exists = output_index.exists(cover_file)
+                if not cover_exists:
+                    with open(cover_file, "wb") as f:
+                        f.write(image)
+                    if output_index is not None:
+                        output_index.add(cover_file)
+            else:
+                embed_image_func()
 
-        def set_id3_tags(audio):
-            # add ID3 tag if it doesn't exist
+    def set_id3_tags(audio):
+        # add ID3 tag if it doesn't exist (lame may have written one)
+        if audio.tags is None:
             audio.add_tags()
+        embedded = []
 
-            def embed_image():
-                audio.tags.add(
-                    id3.APIC(
-                        encoding=3,
-                        mime='image/jpeg',
-                        type=3,
-                        desc='Front Cover',
-                        data=image.data
-                    )
+        def embed_image():
+            audio.tags.add(
+                id3.APIC(
+                    encoding=3,
+                    mime='image/jpeg',
+                    type=3,
+                    desc='Front Cover',
+                    data=image
                 )
+            )
+            embedded.append(True)
 
-            save_cover_image(embed_image)
+        save_cover_image(embed_image)
 
-            if album is not None:
-                audio.tags.add(
-                    id3.TALB(text=[tag_to_ascii(track.album.name, album)],
-                             encoding=3))
+        if album is not None and "ALBUM" not in tagged:
+            audio.tags.add(
+                id3.TALB(text=[tag_to_ascii(meta.album, album)],
+                         encoding=3))
+        if "TITLE" not in tagged:
             audio.tags.add(
-                id3.TIT2(text=[tag_to_ascii(track.name, title)],
+                id3.TIT2(text=[tag_to_ascii(meta.title, title)],
                          encoding=3))
+        if "ARTIST" not in tagged:
             audio.tags.add(
-                id3.TPE1(text=[tag_to_ascii(track.artists[0].name, artist)],
+                id3.TPE1(text=[tag_to_ascii(meta.artist, artist)],
                          encoding=3))
-            audio.tags.add(id3.TDRC(text=[str(track.album.year)],
+        if "YEAR" not in tagged:
+            audio.tags.add(id3.TDRC(text=[str(meta.year)],
                                     encoding=3))
+        if "DISCNUMBER" not in tagged:
+            audio.tags.add(
+                id3.TPOS(text=[idx_of_total_str(meta.disc, num_discs)],
+                         encoding=3))
+        if "TRACKNUMBER" not in tagged:
             audio.tags.add(
-                id3.TPOS(text=[idx_of_total_str(track.disc, num_discs)],
+                id3.TRCK(text=[idx_of_total_str(meta.index,
+                                                num_tracks)],
                          encoding=3))
+        if meta.comment is not None and "COMMENT" not in tagged:
             audio.tags.add(
-                id3.TRCK(text=[idx_of_total_str(track.index, num_tracks)],
+                id3.COMM(text=[tag_to_ascii(comment, comment_ascii)],
                          encoding=3))
-            if args.comment is not None:
-                audio.tags.add(
-                    id3.COMM(text=[tag_to_ascii(comment, comment_ascii)],
-                             encoding=3))
-            if genres is not None and genres:
-                tcon_tag = id3.TCON(encoding=3)
-                tcon_tag.genres = genres if args.ascii_path_only \
-                    else genres_ascii
-                audio.tags.add(tcon_tag)
-
-            if args.id3_v23:
+        if genres is not None and genres and "GENRE" not in tagged:
+            tcon_tag = id3.TCON(encoding=3)
+            tcon_tag.genres = genres if args.ascii_path_only \
+                else genres_ascii
+            audio.tags.add(tcon_tag)
+
+        # lame writes ID3v2.3 and leaves padding, so this is only
+        # needed for the missing frames or a v2.4 tag and is done in
+        # place
+        if args.id3_v23:
+            if set(tag_fields(args, meta)) - tagged or embedded:
                 audio.tags.update_to_v23()
                 audio.save(v2_version=3, v23_sep='/')
-            else:
-                audio.save()
+        else:
+            audio.save()
 
-        # aac is not well supported
-        def set_id3_tags_raw(audio, audio_file):
-            try:
-                id3_dict = id3.ID3(audio_file)
-            except id3.ID3NoHeaderError:
-                id3_dict = id3.ID3()
-
-            def embed_image():
-                id3_dict.add(
-                    id3.APIC(
-                        encoding=3,
-                        mime='image/jpeg',
-                        type=3,
-                        desc='Front Cover',
-                        data=image.data
-                    )
+    # aac is not well supported
+    def set_id3_tags_raw(audio, audio_file):
+        try:
+            id3_dict = id3.ID3(audio_file)
+        except id3.ID3NoHeaderError:
+            id3_dict = id3.ID3()
+
+        def embed_image():
+            id3_dict.add(
+                id3.APIC(
+                    encoding=3,
+                    mime='image/jpeg',
+                    type=3,
+                    desc='Front Cover',
+                    data=image
                 )
+            )
 
-            save_cover_image(embed_image)
+        save_cover_image(embed_image)
 
-            if album is not None:
-                id3_dict.add(
-                    id3.TALB(text=[tag_to_ascii(track.album.name, album)],
-                             encoding=3))
-            id3_dict.add(
-                id3.TIT2(text=[tag_to_ascii(track.name, title)],
-                         encoding=3))
-            id3_dict.add(
-                id3.TPE1(text=[tag_to_ascii(track.artists[0].name, artist)],
-                         encoding=3))
-            id3_dict.add(id3.TDRC(text=[str(track.album.year)],
-                                  encoding=3))
+        if album is not None:
             id3_dict.add(
-                id3.TPOS(text=[idx_of_total_str(track.disc, num_discs)],
+                id3.TALB(text=[tag_to_ascii(meta.album, album)],
                          encoding=3))
+        id3_dict.add(
+            id3.TIT2(text=[tag_to_ascii(meta.title, title)],
+                     encoding=3))
+        id3_dict.add(
+            id3.TPE1(text=[tag_to_ascii(meta.artist, artist)],
+                     encoding=3))
+        id3_dict.add(id3.TDRC(text=[str(meta.year)],
+                              encoding=3))
+        id3_dict.add(
+            id3.TPOS(text=[idx_of_total_str(meta.disc, num_discs)],
+                     encoding=3))
+        id3_dict.add(
+            id3.TRCK(text=[idx_of_total_str(meta.index, num_tracks)],
+                     encoding=3))
+        if meta.comment is not None:
             id3_dict.add(
-                id3.TRCK(text=[idx_of_total_str(track.index, num_tracks)],
+                id3.COMM(text=[tag_to_ascii(comment, comment_ascii)],
                          encoding=3))
-            if args.comment is not None:
-                id3_dict.add(
-                    id3.COMM(text=[tag_to_ascii(comment, comment_ascii)],
-                             encoding=3))
-            if genres is not None and genres:
-                tcon_tag = id3.TCON(encoding=3)
-                tcon_tag.genres = genres if args.ascii_path_only \
-                    else genres_ascii
-                id3_dict.add(tcon_tag)
-
-            if args.id3_v23:
-                id3_dict.update_to_v23()
-                id3_dict.save(audio_file, v2_version=3, v23_sep='/')
+        if genres is not None and genres:
+            tcon_tag = id3.TCON(encoding=3)
+            tcon_tag.genres = genres if args.ascii_path_only \
+                else genres_ascii
+            id3_dict.add(tcon_tag)
+
+        if args.id3_v23:
+            id3_dict.update_to_v23()
+            id3_dict.save(audio_file, v2_version=3, v23_sep='/')
+        else:
+            id3_dict.save(audio_file)
+        audio.tags = id3_dict
+
+    def set_vorbis_comments(audio):
+        # add Vorbis comment block if it doesn't exist
+        if audio.tags is None:
+            audio.add_tags()
+        embedded = []
+
+        def embed_image():
+            pic = flac.Picture()
+            pic.type = 3
+            pic.mime = "image/jpeg"
+            pic.desc = "Front Cover"
+            pic.data = image
+            if args.output_type == "flac":
+                audio.add_picture(pic)
             else:
-                id3_dict.save(audio_file)
-            audio.tags = id3_dict
-
-        def set_vorbis_comments(audio):
-            # add Vorbis comment block if it doesn't exist
-            if audio.tags is None:
-                audio.add_tags()
-
-            def embed_image():
-                pic = flac.Picture()
-                pic.type = 3
-                pic.mime = "image/jpeg"
-                pic.desc = "Front Cover"
-                pic.data = image.data
-                if args.output_type == "flac":
-                    audio.add_picture(pic)
-                else:
-                    data = base64.b64encode(pic.write())
-                    audio["METADATA_BLOCK_PICTURE"] = [data.decode("ascii")]
-
-            save_cover_image(embed_image)
-
-            if album is not None:
-                audio.tags["ALBUM"] = tag_to_ascii(track.album.name, album)
-            audio.tags["TITLE"] = tag_to_ascii(track.name, title)
-            audio.tags["ARTIST"] = tag_to_ascii(track.artists[0].name, artist)
-            audio.tags["YEAR"] = str(track.album.year)
-            audio.tags["DISCNUMBER"] = str(track.disc)
-            audio.tags["DISCTOTAL"] = str(num_discs)
-            audio.tags["TRACKNUMBER"] = str(track.index)
-            audio.tags["TRACKTOTAL"] = str(num_tracks)
-            if args.comment is not None:
-                audio.tags["COMMENT"] = tag_to_ascii(comment, comment_ascii)
-
-            if genres is not None and genres:
-                _genres = genres if args.ascii_path_only else genres_ascii
-                audio.tags["GENRE"] = ", ".join(_genres)
-
-            audio.save()
-
-        # only called by Python 3
-        def set_mp4_tags(audio):
-            # add MP4 tags if it doesn't exist
-            if audio.tags is None:
-                audio.add_tags()
-
-            def embed_image():
-                audio.tags["covr"] = mp4.MP4Cover(image.data)
+                data = base64.b64encode(pic.write())
+                audio["METADATA_BLOCK_PICTURE"] = [data.decode("ascii")]
+            embedded.append(True)
 
-            save_cover_image(embed_image)
+        save_cover_image(embed_image)
 
-            if album is not None:
-                audio.tags["\xa9alb"] = tag_to_ascii(track.album.name, album)
-            audio["\xa9nam"] = tag_to_ascii(track.name, title)
-            audio.tags["\xa9ART"] = tag_to_ascii(track.artists[0].name, artist)
-            audio.tags["\xa9day"] = str(track.album.year)
-            audio.tags["disk"] = [(track.disc, num_discs)]
-            audio.tags["trkn"] = [(track.index, num_tracks)]
-            if args.comment is not None:
-                audio.tags["\xa9cmt"] = tag_to_ascii(comment, comment_ascii)
-
-            if genres is not None and genres:
-                _genres = genres if args.ascii_path_only else genres_ascii
-                audio.tags["\xa9gen"] = ", ".join(_genres)
+        # only the fields the encoder couldn't write
+        fields = [(key, value)
+                  for key, value in tag_fields(args, meta).items()
+                  if key not in tagged]
+        for key, value in fields:
+            audio.tags[key] = value
 
+        if fields or embedded:
             audio.save()
 
-        def set_m4a_tags(audio):
-            # add M4A tags if it doesn't exist
+    # only called by Python 3
+    def set_mp4_tags(audio):
+        # add MP4 tags if it doesn't exist
+        if audio.tags is None:
             audio.add_tags()
 
-            def embed_image():
-                audio.tags[str("covr")] = m4a.M4ACover(image.data)
+        def embed_image():
+            audio.tags["covr"] = mp4.MP4Cover(image)
 
-            save_cover_image(embed_image)
+        save_cover_image(embed_image)
 
-            if album is not None:
-                audio.tags[b"\xa9alb"] = tag_to_ascii(track.album.name, album)
-            audio[b"\xa9nam"] = tag_to_ascii(track.name, title)
-            audio.tags[b"\xa9ART"] = tag_to_ascii(
-                track.artists[0].name, artist)
-            audio.tags[b"\xa9day"] = str(track.album.year)
-            audio.tags[str("disk")] = (track.disc, num_discs)
-            audio.tags[str("trkn")] = (track.index, num_tracks)
-            if args.comment is not None:
-                audio.tags[b"\xa9cmt"] = tag_to_ascii(comment, comment_ascii)
+        if album is not None:
+            audio.tags["\xa9alb"] = tag_to_ascii(meta.album, album)
+        audio["\xa9nam"] = tag_to_ascii(meta.title, title)
+        audio.tags["\xa9ART"] = tag_to_ascii(meta.artist, artist)
+        audio.tags["\xa9day"] = str(meta.year)
+        audio.tags["disk"] = [(meta.disc, num_discs)]
+        audio.tags["trkn"] = [(meta.index, num_tracks)]
+        if meta.comment is not None:
+            audio.tags["\xa9cmt"] = tag_to_ascii(comment, comment_ascii)
 
-            if genres is not None and genres:
-                _genres = genres if args.ascii_path_only else genres_ascii
-                audio.tags[b"\xa9gen"] = ", ".join(_genres)
+        if genres is not None and genres:
+            _genres = genres if args.ascii_path_only else genres_ascii
+            audio.tags["\xa9gen"] = ", ".join(_genres)
 
-            audio.save()
+        audio.save()
 
-        if args.output_type == "flac":
-            audio = flac.FLAC(audio_file)
-            set_vorbis_comments(audio)
-        elif args.output_type == "ogg":
-            audio = oggvorbis.OggVorbis(audio_file)
-            set_vorbis_comments(audio)
-        elif args.output_type == "opus":
-            audio = oggopus.OggOpus(audio_file)
-            set_vorbis_comments(audio)
-        elif args.output_type == "aac":
-            audio = aac.AAC(audio_file)
-            set_id3_tags_raw(audio, audio_file)
-        elif args.output_type == "m4a":
-            if sys.version_info >= (3, 0):
-                from mutagen import mp4
-
-                audio = mp4.MP4(audio_file)
-                set_mp4_tags(audio)
-            else:
-                from mutagen import m4a, mp4
+    def set_m4a_tags(audio):
+        # add M4A tags if it doesn't exist
+        audio.add_tags()
 
-                audio = m4a.M4A(audio_file)
-                set_m4a_tags(audio)
-                audio = mp4.MP4(audio_file)
-        elif args.output_type == "alac.m4a":
-            if sys.version_info >= (3, 0):
-                from mutagen import mp4
+        def embed_image():
+            audio.tags[str("covr")] = m4a.M4ACover(image)
 
-                audio = mp4.MP4(audio_file)
-                set_mp4_tags(audio)
-            else:
-                from mutagen import m4a, mp4
-
-                audio = m4a.M4A(audio_file)
-                set_m4a_tags(audio)
-                audio = mp4.MP4(audio_file)
-        elif args.output_type == "mp3":
-            audio = mp3.MP3(audio_file, ID3=id3.ID3)
-            set_id3_tags(audio)
-
-        def bit_rate_str(bit_rate):
-            brs = "%d kb/s" % bit_rate
-            if not args.cbr:
-                brs = "~" + brs
-            return brs
-
-        def mode_str(mode):
-            modes = ["Stereo", "Joint Stereo", "Dual Channel", "Mono"]
-            if mode < len(modes):
-                return modes[mode]
-            else:
-                return ""
+        save_cover_image(embed_image)
 
-        def channel_str(num):
-            channels = ["", "Mono", "Stereo"]
-            if num < len(channels):
-                return channels[num]
-            else:
-                return ""
-
-        # log id3 tags
-        print("-" * 79)
-        print(Fore.YELLOW + "Setting artist: " + artist + Fore.RESET)
         if album is not None:
-            print(Fore.YELLOW + "Setting album: " + album + Fore.RESET)
-        print(Fore.YELLOW + "Setting title: " + title + Fore.RESET)
-        print(Fore.YELLOW + "Setting track info: (" +
-              str(track.index) + ", " + str(num_tracks) + ")" + Fore.RESET)
-        print(Fore.YELLOW + "Setting disc info: (" + str(track.disc) +
-              ", " + str(num_discs) + ")" + Fore.RESET)
-        print(Fore.YELLOW + "Setting release year: " +
-              str(track.album.year) + Fore.RESET)
+            audio.tags[b"\xa9alb"] = tag_to_ascii(meta.album, album)
+        audio[b"\xa9nam"] = tag_to_ascii(meta.title, title)
+        audio.tags[b"\xa9ART"] = tag_to_ascii(
+            meta.artist, artist)
+        audio.tags[b"\xa9day"] = str(meta.year)
+        audio.tags[str("disk")] = (meta.disc, num_discs)
+        audio.tags[str("trkn")] = (meta.index, num_tracks)
+        if meta.comment is not None:
+            audio.tags[b"\xa9cmt"] = tag_to_ascii(comment, comment_ascii)
+
         if genres is not None and genres:
-            print(Fore.YELLOW + "Setting genres: " +
-                  " / ".join(genres_ascii) + Fore.RESET)
-        if image is not None:
-            print(Fore.YELLOW + "Adding cover image" + Fore.RESET)
-        if args.comment is not None:
-            print(Fore.YELLOW + "Adding comment: " + comment_ascii +
-                  Fore.RESET)
-        if args.output_type == "flac":
-            bit_rate = ((audio.info.bits_per_sample * audio.info.sample_rate) *
-                        audio.info.channels)
-            print("Time: " + format_time(audio.info.length) +
-                  "\tFree Lossless Audio Codec" +
-                  "\t[ " + bit_rate_str(bit_rate / 1000) + " @ " +
-                  str(audio.info.sample_rate) +
-                  " Hz - " + channel_str(audio.info.channels) + " ]")
-            print("-" * 79)
-            print(Fore.YELLOW + "Writing Vorbis comments - " +
-                  audio.tags.vendor + Fore.RESET)
-            print("-" * 79)
-        if args.output_type == "alac.m4a":
-            bit_rate = ((audio.info.bits_per_sample * audio.info.sample_rate) *
-                        audio.info.channels)
-            print("Time: " + format_time(audio.info.length) +
-                  "\tApple Lossless" +
-                  "\t[ " + bit_rate_str(bit_rate / 1000) + " @ " +
-                  str(audio.info.sample_rate) +
-                  " Hz - " + channel_str(audio.info.channels) + " ]")
-            print("-" * 79)
-            print(Fore.YELLOW + "Writing Apple iTunes metadata - " +
-                  Fore.RESET)
-            print("-" * 79)
-        elif args.output_type == "ogg":
-            print("Time: " + format_time(audio.info.length) +
-                  "\tOgg Vorbis Codec" +
-                  "\t[ " + bit_rate_str(audio.info.bitrate / 1000) + " @ " +
-                  str(audio.info.sample_rate) +
-                  " Hz - " + channel_str(audio.info.channels) + " ]")
-            print("-" * 79)
-            print(Fore.YELLOW + "Writing Vorbis comments - " +
-                  audio.tags.vendor + Fore.RESET)
-            print("-" * 79)
-        elif args.output_type == "opus":
-            print("Time: " + format_time(audio.info.length) + "\tOpus Codec" +
-                  "\t[ " + channel_str(audio.info.channels) + " ]")
-            print("-" * 79)
-            print(Fore.YELLOW + "Writing Vorbis comments - " +
-                  audio.tags.vendor + Fore.RESET)
-            print("-" * 79)
-        elif args.output_type == "mp3":
-            print("Time: " + format_time(audio.info.length) + "\tMPEG" +
-                  str(audio.info.version) +
-                  ", Layer " + ("I" * audio.info.layer) + "\t[ " +
-                  bit_rate_str(audio.info.bitrate / 1000) +
-                  " @ " + str(audio.info.sample_rate) + " Hz - " +
-                  mode_str(audio.info.mode) + " ]")
-            print("-" * 79)
-            id3_version = "v%d.%d" % (
-                audio.tags.version[0], audio.tags.version[1])
-            print("ID3 " + id3_version + ": " +
-                  str(len(audio.tags.values())) + " frames")
-            print(
-                Fore.YELLOW + "Writing ID3 version " +
-                id3_version + Fore.RESET)
-            print("-" * 79)
-        elif args.output_type == "aac":
-            print("Time: " + format_time(audio.info.length) +
-                  "\tAdvanced Audio Coding" +
-                  "\t[ " + bit_rate_str(audio.info.bitrate / 1000) +
-                  " @ " + str(audio.info.sample_rate) + " Hz - " +
-                  channel_str(audio.info.channels) + " ]")
-            print("-" * 79)
-            id3_version = "v%d.%d" % (
-                audio.tags.version[0], audio.tags.version[1])
-            print("ID3 " + id3_version + ": " +
-                  str(len(audio.tags.values())) + " frames")
-            print(
-                Fore.YELLOW + "Writing ID3 version " +
-                id3_version + Fore.RESET)
-            print("-" * 79)
-        elif args.output_type == "m4a":
-            bit_rate = ((audio.info.bits_per_sample * audio.info.sample_rate) *
-                        audio.info.channels)
-            print("Time: " + format_time(audio.info.length) +
-                  "\tMPEG-4 Part 14 Audio" +
-                  "\t[ " + bit_rate_str(bit_rate / 1000) +
-                  " @ " + str(audio.info.sample_rate) + " Hz - " +
-                  channel_str(audio.info.channels) + " ]")
-            print("-" * 79)
-            print(Fore.YELLOW + "Writing Apple iTunes metadata - " +
-                  str(audio.info.codec) + Fore.RESET)
-            print("-" * 79)
-
-    except id3.error:
-        print(Fore.YELLOW + "Warning: exception while saving id3 tag: " +
-              str(id3.error) + Fore.RESET)
+            _genres = genres if args.ascii_path_only else genres_ascii
+            audio.tags[b"\xa9gen"] = ", ".join(_genres)
+
+        audio.save()
+
+    if args.output_type == "flac":
+        audio = flac.FLAC(audio_file)
+        set_vorbis_comments(audio)
+    elif args.output_type == "ogg":
+        audio = oggvorbis.OggVorbis(audio_file)
+        set_vorbis_comments(audio)
+    elif args.output_type == "opus":
+        audio = oggopus.OggOpus(audio_file)
+        set_vorbis_comments(audio)
+    elif args.output_type == "aac":
+        audio = aac.AAC(audio_file)
+        set_id3_tags_raw(audio, audio_file)
+    elif args.output_type == "m4a":
+        if sys.version_info >= (3, 0):
+            from mutagen import mp4
+
+            audio = mp4.MP4(audio_file)
+            set_mp4_tags(audio)
+        else:
+            from mutagen import m4a, mp4
+
+            audio = m4a.M4A(audio_file)
+            set_m4a_tags(audio)
+            audio = mp4.MP4(audio_file)
+    elif args.output_type == "alac.m4a":
+        if sys.version_info >= (3, 0):
+            from mutagen import mp4
+
+            audio = mp4.MP4(audio_file)
+            set_mp4_tags(audio)
+        else:
+            from mutagen import m4a, mp4
+
+            audio = m4a.M4A(audio_file)
+            set_m4a_tags(audio)
+            audio = mp4.MP4(audio_file)
+    elif args.output_type == "mp3":
+        audio = mp3.MP3(audio_file, ID3=id3.ID3)
+        set_id3_tags(audio)
+
+    def bit_rate_str(bit_rate):
+        brs = "%d kb/s" % bit_rate
+        if not args.cbr:
+            brs = "~" + brs
+        return brs
+
+    def mode_str(mode):
+        modes = ["Stereo", "Joint Stereo", "Dual Channel", "Mono"]
+        if mode < len(modes):
+            return modes[mode]
+        else:
+            return ""
+
+    def channel_str(num):
+        channels = ["", "Mono", "Stereo"]
+        if num < len(channels):
+            return channels[num]
+        else:
+            return ""
+
+    # log id3 tags
+    print("-" * 79)
+    print(Fore.YELLOW + "Setting artist: " + artist + Fore.RESET)
+    if album is not None:
+        print(Fore.YELLOW + "Setting album: " + album + Fore.RESET)
+    print(Fore.YELLOW + "Setting title: " + title + Fore.RESET)
+    print(Fore.YELLOW + "Setting track info: (" +
+          str(meta.index) + ", " + str(num_tracks) + ")" + Fore.RESET)
+    print(Fore.YELLOW + "Setting disc info: (" + str(meta.disc) +
+          ", " + str(num_discs) + ")" + Fore.RESET)
+    print(Fore.YELLOW + "Setting release year: " +
+          str(meta.year) + Fore.RESET)
+    if genres is not None and genres:
+        print(Fore.YELLOW + "Setting genres: " +
+              " / ".join(genres_ascii) + Fore.RESET)
+    if image is not None:
+        print(Fore.YELLOW + "Adding cover image" + Fore.RESET)
+    if meta.comment is not None:
+        print(Fore.YELLOW + "Adding comment: " + comment_ascii +
+              Fore.RESET)
+    if args.output_type == "flac":
+        bit_rate = ((audio.info.bits_per_sample * audio.info.sample_rate) *
+                    audio.info.channels)
+        print("Time: " + format_time(audio.info.length) +
+              "\tFree Lossless Audio Codec" +
+              "\t[ " + bit_rate_str(bit_rate / 1000) + " @ " +
+              str(audio.info.sample_rate) +
+              " Hz - " + channel_str(audio.info.channels) + " ]")
+        print("-" * 79)
+        print(Fore.YELLOW + "Writing Vorbis comments - " +
+              audio.tags.vendor + Fore.RESET)
+        print("-" * 79)
+    if args.output_type == "alac.m4a":
+        bit_rate = ((audio.info.bits_per_sample * audio.info.sample_rate) *
+                    audio.info.channels)
+        print("Time: " + format_time(audio.info.length) +
+              "\tApple Lossless" +
+              "\t[ " + bit_rate_str(bit_rate / 1000) + " @ " +
+              str(audio.info.sample_rate) +
+              " Hz - " + channel_str(audio.info.channels) + " ]")
+        print("-" * 79)
+        print(Fore.YELLOW + "Writing Apple iTunes metadata - " +
+              Fore.RESET)
+        print("-" * 79)
+    elif args.output_type == "ogg":
+        print("Time: " + format_time(audio.info.length) +
+              "\tOgg Vorbis Codec" +
+              "\t[ " + bit_rate_str(audio.info.bitrate / 1000) + " @ " +
+              str(audio.info.sample_rate) +
+              " Hz - " + channel_str(audio.info.channels) + " ]")
+        print("-" * 79)
+        print(Fore.YELLOW + "Writing Vorbis comments - " +
+              audio.tags.vendor + Fore.RESET)
+        print("-" * 79)
+    elif args.output_type == "opus":
+        print("Time: " + format_time(audio.info.length) + "\tOpus Codec" +
+              "\t[ " + channel_str(audio.info.channels) + " ]")
+        print("-" * 79)
+        print(Fore.YELLOW + "Writing Vorbis comments - " +
+              audio.tags.vendor + Fore.RESET)
+        print("-" * 79)
+    elif args.output_type == "mp3":
+        print("Time: " + format_time(audio.info.length) + "\tMPEG" +
+              str(audio.info.version) +
+              ", Layer " + ("I" * audio.info.layer) + "\t[ " +
+              bit_rate_str(audio.info.bitrate / 1000) +
+              " @ " + str(audio.info.sample_rate) + " Hz - " +
+              mode_str(audio.info.mode) + " ]")
+        print("-" * 79)
+        id3_version = "v%d.%d" % (
+            audio.tags.version[0], audio.tags.version[1])
+        print("ID3 " + id3_version + ": " +
+              str(len(audio.tags.values())) + " frames")
+        print(
+            Fore.YELLOW + "Writing ID3 version " +
+            id3_version + Fore.RESET)
+        print("-" * 79)
+    elif args.output_type == "aac":
+        print("Time: " + format_time(audio.info.length) +
+              "\tAdvanced Audio Coding" +
+              "\t[ " + bit_rate_str(audio.info.bitrate / 1000) +
+              " @ " + str(audio.info.sample_rate) + " Hz - " +
+              channel_str(audio.info.channels) + " ]")
+        print("-" * 79)
+        id3_version = "v%d.%d" % (
+            audio.tags.version[0], audio.tags.version[1])
+        print("ID3 " + id3_version + ": " +
+              str(len(audio.tags.values())) + " frames")
+        print(
+            Fore.YELLOW + "Writing ID3 version " +
+            id3_version + Fore.RESET)
+        print("-" * 79)
+    elif args.output_type == "m4a":
+        bit_rate = ((audio.info.bits_per_sample * audio.info.sample_rate) *
+                    audio.info.channels)
+        print("Time: " + format_time(audio.info.length) +
+              "\tMPEG-4 Part 14 Audio" +
+              "\t[ " + bit_rate_str(bit_rate / 1000) +
+              " @ " + str(audio.info.sample_rate) + " Hz - " +
+              channel_str(audio.info.channels) + " ]")
+        print("-" * 79)
+        print(Fore.YELLOW + "Writing Apple iTunes metadata - " +
+              str(audio.info.codec) + Fore.RESET)
+        print("-" * 79)
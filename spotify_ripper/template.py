@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.utils import *
+import re
+
+# format string tag -> field it is rendered from
+field_aliases = {
+    "track_artist": "artist",
+    "artist": "artist",
+    "track_artists": "artists",
+    "artists": "artists",
+    "album_artist": "album_artist",
+    "album_artists_web": "album_artists_web",
+    "album": "album",
+    "track_name": "track_name",
+    "track": "track_name",
+    "year": "year",
+    "ext": "ext",
+    "extension": "ext",
+    "idx": "idx",
+    "index": "idx",
+    "track_num": "track_num",
+    "track_idx": "track_num",
+    "track_index": "track_num",
+    "disc_num": "disc_num",
+    "disc_idx": "disc_num",
+    "disc_index": "disc_num",
+    "playlist": "playlist_name",
+    "playlist_name": "playlist_name",
+    "playlist_owner": "playlist_owner",
+    "playlist_user": "playlist_owner",
+    "playlist_username": "playlist_owner",
+    "user": "user",
+    "username": "user",
+    "feat_artists": "feat_artists",
+    "featuring_artists": "feat_artists",
+}
+
+# {idx:3} zero-fills, {feat_artists:feat.} adds a prefix if there are any
+# featuring artists, {track_name:paren} turns "Song - Remix" into
+# "Song (Remix)"
+fill_fields = {"idx", "track_num", "disc_num"}
+prefix_fields = {"feat_artists"}
+paren_fields = {"track_name"}
+
+field_re = re.compile(r"\{(\w+)(?::([^\}]+))?\}")
+paren_re = re.compile(r"(.*)\s+-\s+([^-]+)")
+trailing_space_re = re.compile(r"\s*$")
+
+
+class PathTemplate(object):
+    """A --format string parsed once into literal text and fields, plus
+    the precompiled --replace rules.  Rendering is a single pass over the
+    parts and only computes the fields the format actually uses."""
+
+    def __init__(self, format_str, replace=None):
+        self.parts = []
+        self.fields = set()
+
+        pos = 0
+        for match in field_re.finditer(format_str):
+            if match.start() > pos:
+                self.parts.append(format_str[pos:match.start()])
+
+            name, option = match.group(1), match.group(2)
+            field = field_aliases.get(name)
+            if field is None or not self.valid_option(field, option):
+                # not one of ours, keep it as it is
+                self.parts.append(match.group(0))
+            else:
+                self.parts.append((field, option))
+                self.fields.add(field)
+            pos = match.end()
+        if pos < len(format_str):
+            self.parts.append(format_str[pos:])
+
+        self.replace_rules = []
+        if replace is not None:
+            for pattern in replace:
+                repl = pattern.split('/')
+                self.replace_rules.append((re.compile(repl[0]), repl[1]))
+
+    def valid_option(self, field, option):
+        if option is None:
+            return True
+        elif field in fill_fields:
+            return option.isdigit()
+        elif field in prefix_fields:
+            return True
+        elif field in paren_fields:
+            return option == "paren"
+        return False
+
+    def render(self, track_fields):
+        values = {}
+        output = []
+        for part in self.parts:
+            if not isinstance(part, tuple):
+                output.append(part)
+                continue
+
+            field, option = part
+            value = values.get(field)
+            if value is None:
+                value = getattr(track_fields, field)()
+                values[field] = value
+
+            if option is None:
+                output.append(value)
+            elif field in fill_fields:
+                output.append(value.zfill(int(option)))
+            elif field in prefix_fields:
+                if len(value) > 0:
+                    output.append(option + " " + value)
+                elif output:
+                    # don't leave the space in front of the prefix behind
+                    output[-1] = trailing_space_re.sub("", output[-1])
+            elif field in paren_fields:
+                match = paren_re.search(value)
+                if match:
+                    output.append(
+                        match.group(1) + " (" + match.group(2) + ")")
+                else:
+                    output.append(value)
+        return "".join(output)
+
+    def replace(self, file_name):
+        for regex, repl in self.replace_rules:
+            file_name = regex.sub(repl, file_name)
+        return file_name
+
+
+class TrackFields(object):
+    """The values of the format string fields for one track (a
+    :class:`TrackInfo`), one method per field so only the fields used are
+    looked up"""
+
+    def __init__(self, ripper, args, idx, info):
+        self.ripper = ripper
+        self.args = args
+        self.list_idx = idx
+        self.info = info
+
+    def artist(self):
+        return to_ascii(escape_filename_part(self.info.artists[0]))
+
+    def artists(self):
+        return to_ascii(", ".join(self.info.artists))
+
+    def feat_artists(self):
+        if len(self.info.artists) > 1:
+            return to_ascii(", ".join(self.info.artists[1:]))
+        return ""
+
+    def album_artist(self):
+        current_album = self.ripper.current_album
+        if current_album is None:
+            return self.artist()
+        album_info = self.ripper.metadata.get_album(current_album.link.uri)
+        return to_ascii(album_info.artist if album_info is not None and
+                        album_info.artist is not None
+                        else current_album.artist.name)
+
+    def album_artists_web(self):
+        current_album = self.ripper.current_album
+        if current_album is not None:
+            artist_array = self.ripper.web.get_artists_on_album(
+                current_album.link.uri)
+            if artist_array is not None:
+                return to_ascii(", ".join(artist_array))
+        return self.artists()
+
+    def album(self):
+        return to_ascii(escape_filename_part(self.info.album))
+
+    def track_name(self):
+        return to_ascii(escape_filename_part(self.info.name))
+
+    def year(self):
+        return str(self.info.album_year)
+
+    def ext(self):
+        return self.args.output_type
+
+    def idx(self):
+        return str(self.list_idx + 1)
+
+    def track_num(self):
+        return str(self.info.index)
+
+    def disc_num(self):
+        return str(self.info.disc)
+
+    def playlist_name(self):
+        current_playlist = self.ripper.current_playlist
+        if current_playlist is not None:
+            return to_ascii(current_playlist.name)
+        return "No Playlist"
+
+    def playlist_owner(self):
+        current_playlist = self.ripper.current_playlist
+        if current_playlist is not None:
+            return to_ascii(current_playlist.owner.display_name)
+        return "No Playlist Owner"
+
+    def user(self):
+        return self.ripper.session.user.display_name
@@ -4,43 +4,94 @@ from __future__ import unicode_literals
 
 from colorama import Fore
 from spotify_ripper.utils import *
+from spotify_ripper.httpcache import HTTPCache
+from spotify_ripper.httpclient import HTTPClient
+from spotify_ripper.ratelimit import RateLimiter
+from spotify_ripper.lru import LRUCache
 import os
-import time
-import spotify
 import requests
 import re
 
 
 class WebAPI(object):
 
+    # how long responses are served from the disk cache without asking
+    # the server again, in seconds
+    ttls = {
+        "albums": 24 * 3600,
+        "album": 30 * 24 * 3600,
+        "genres": 7 * 24 * 3600,
+        "charts": 3600,
+        "dated charts": 365 * 24 * 3600,
+    }
+
+    # most IDs the several-IDs endpoints take at once
+    max_ids = {"artist": 50, "album": 20}
+
     def __init__(self, args, ripper):
         self.args = args
         self.ripper = ripper
-        self.cache = {}
+        self.cache = LRUCache(int(args.web_memory_size) * MB_BYTES)
+
+        cache_size = int(args.web_cache_size) * MB_BYTES
+        self.http_cache = HTTPCache(
+            os.path.join(settings_dir(), "web-cache"), cache_size) \
+            if cache_size > 0 else None
+        self.limiter = RateLimiter(float(args.web_rate))
+        self.client = HTTPClient(int(args.web_workers),
+                                 float(args.web_timeout), self.limiter,
+                                 int(args.web_retries))
 
     def cache_result(self, uri, result):
-        self.cache[uri] = result
+        self.cache.put(uri, result)
 
     def get_cached_result(self, uri):
         return self.cache.get(uri)
 
-    def request_json(self, url, msg):
+    def request_json(self, url, msg, ttl_type=None):
+        http_cache = self.http_cache if ttl_type is not None else None
+
+        entry = http_cache.get(url) if http_cache is not None else None
+        if entry is not None and (self.args.web_offline or
+                                  http_cache.is_fresh(entry,
+                                                      self.ttls[ttl_type])):
+            http_cache.hits += 1
+            return entry["body"]
+
+        if self.args.web_offline:
+            print(Fore.YELLOW + "Skipping " + msg + ", it is not in the Web "
+                  "API cache (offline mode)" + Fore.RESET)
+            return None
+
         print(Fore.GREEN + "Attempting to retrieve " + msg +
               " from Spotify's Web API" + Fore.RESET)
         print(Fore.CYAN + url + Fore.RESET)
-        req = requests.get(url)
-        if req.status_code == 200:
-            return req.json()
+        headers = http_cache.validators(entry) if entry is not None else {}
+        try:
+            req = self.client.get(url, headers=headers)
+        except requests.RequestException as e:
+            print(Fore.YELLOW + "Request failed: " + str(e) + Fore.RESET)
+            return None
+        if req.status_code == 304 and entry is not None:
+            http_cache.revalidated += 1
+            http_cache.touch(entry)
+            return entry["body"]
+        elif req.status_code == 200:
+            json_obj = req.json()
+            if http_cache is not None:
+                http_cache.misses += 1
+                http_cache.put(url, json_obj, req.headers)
+            return json_obj
         else:
             print(Fore.YELLOW + "URL returned non-200 HTTP code: " +
                   str(req.status_code) + Fore.RESET)
         return None
 
     def api_url(self, url_path):
-        return 'https://api.spotify.com/v1/' + url_path
+        return self.args.web_api_url.rstrip('/') + '/' + url_path
 
     def charts_url(self, url_path):
-        return 'https://spotifycharts.com/api/' + url_path
+        return self.args.charts_url.rstrip('/') + '/' + url_path
 
     # excludes 'appears on' albums for artist
     def get_non_appears_on_albums(self, uri):
@@ -49,7 +100,7 @@ class WebAPI(object):
                     'artists/' + uri_tokens[2] +
                     '/albums/?=album_type=album,single,compilation' +
                     '&limit=50&offset=' + str(offset))
-            return self.request_json(url, "albums")
+            return self.request_json(url, "albums", "albums")
 
         # check for cached result
         cached_result = self.get_cached_result(uri)
@@ -61,26 +112,22 @@ class WebAPI(object):
         if len(uri_tokens) != 3:
             return []
 
-        # it is possible we won't get all the albums on the first request
-        offset = 0
+        # the first page tells us how many albums there are, the other
+        # pages are then fetched in parallel
         album_uris = []
-        total = None
-        while total is None or offset < total:
-            try:
-                # rate limit if not first request
-                if total is None:
-                    time.sleep(1.0)
-                albums = get_albums_json(offset)
-                if albums is None:
-                    break
-
-                # extract album URIs
+        try:
+            albums = get_albums_json(0)
+            if albums is not None:
                 album_uris += [album['uri'] for album in albums['items']]
-                offset = len(album_uris)
-                if total is None:
-                    total = albums['total']
-            except KeyError as e:
-                break
+                offsets = list(range(len(albums['items']),
+                                     albums['total'], 50)) \
+                    if albums['items'] else []
+                for page in self.client.map(get_albums_json, offsets):
+                    if page is None:
+                        break
+                    album_uris += [album['uri'] for album in page['items']]
+        except KeyError:
+            pass
         print(str(len(album_uris)) + " albums found")
         self.cache_result(uri, album_uris)
         return album_uris
@@ -88,7 +135,7 @@ class WebAPI(object):
     def get_artists_on_album(self, uri):
         def get_album_json(album_id):
             url = self.api_url('albums/' + album_id)
-            return self.request_json(url, "album")
+            return self.request_json(url, "album", "album")
 
         # check for cached result
         cached_result = self.get_cached_result(uri)
@@ -112,14 +159,14 @@ class WebAPI(object):
     def get_genres(self, genre_type, track):
         def get_genre_json(spotify_id):
             url = self.api_url(genre_type + 's/' + spotify_id)
-            return self.request_json(url, "genres")
+            return self.request_json(url, "genres", "genres")
 
         # extract album id from uri
         item = track.artists[0] if genre_type == "artist" else track.album
         uri = item.link.uri
 
         # check for cached result
-        cached_result = self.get_cached_result(uri)
+        cached_result = self.get_cached_result("genres:" + uri)
         if cached_result is not None:
             return cached_result
 
@@ -132,9 +179,38 @@ class WebAPI(object):
             return None
 
         result = json_obj["genres"]
-        self.cache_result(uri, result)
+        self.cache_result("genres:" + uri, result)
         return result
 
+    def prefetch_genres(self, genre_type, uris):
+        """look up the genres of many artists or albums through the
+        several-IDs endpoint, so tagging finds them in the cache"""
+        ids = sorted(set(
+            uri.split(':')[2] for uri in uris
+            if len(uri.split(':')) == 3 and
+            self.get_cached_result("genres:" + uri) is None))
+        chunk_size = self.max_ids[genre_type]
+        chunks = [ids[i:i + chunk_size]
+                  for i in range(0, len(ids), chunk_size)]
+
+        def get_genres_json(chunk):
+            url = self.api_url(genre_type + 's?ids=' + ','.join(chunk))
+            json_obj = self.request_json(url, "genres", "genres")
+            if json_obj is None:
+                return
+            for item in json_obj.get(genre_type + 's', []):
+                # unknown IDs come back as null
+                if item is None:
+                    continue
+                self.cache_result("genres:" + item["uri"], item["genres"])
+                # the album objects have the album artists as well
+                if genre_type == "album":
+                    self.cache_result(
+                        item["uri"],
+                        [artist['name'] for artist in item['artists']])
+
+        self.client.map(get_genres_json, chunks)
+
     # doesn't seem to be officially supported by Spotify
     def get_charts(self, uri):
         def get_tracks_json(metrics, region, time_window, from_date):
@@ -143,7 +219,10 @@ class WebAPI(object):
                     "?limit=" + limit + "&country=" + region +
                     "&recurrence=" + time_window + "&date=" + from_date +
                     "&type=" + metrics)
-            return self.request_json(url, region + " " + metrics + " charts")
+            # only the latest charts change
+            ttl_type = "charts" if from_date == "latest" else "dated charts"
+            return self.request_json(
+                url, region + " " + metrics + " charts", ttl_type)
 
         # check for cached result
         cached_result = self.get_cached_result(uri)
@@ -200,5 +279,16 @@ class WebAPI(object):
         if json_obj is None:
             return None
 
-        self.cache_result(uri, json_obj)
-        return json_obj
+        # only keep the fields we use, the full chart is much bigger
+        try:
+            result = {
+                "name": json_obj["name"],
+                "entries": {"items": [
+                    {"track": {"uri": item["track"]["uri"]}}
+                    for item in json_obj["entries"]["items"]]},
+            }
+        except (KeyError, TypeError):
+            print(Fore.YELLOW + "Unexpected charts response" + Fore.RESET)
+            return None
+        self.cache_result(uri, result)
+        return result
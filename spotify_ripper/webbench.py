@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks :class:`spotify_ripper.web.WebAPI` against the local fake
+Web API (:mod:`spotify_ripper.fakeweb`) with and without latency and
+injected errors::
+
+    python -m spotify_ripper.webbench --artists 20 --albums 500
+"""
+
+from __future__ import unicode_literals
+
+from colorama import Fore
+from spotify_ripper.fakeweb import FakeWebServer
+from spotify_ripper.web import WebAPI
+import os
+import sys
+import time
+import argparse
+import threading
+
+
+scenarios = [
+    ("baseline", {}),
+    ("50ms latency", {"latency": 0.05}),
+    ("5% 429s", {"latency": 0.01, "rate_429": 0.05}),
+    ("5% 5xx", {"latency": 0.01, "rate_5xx": 0.05}),
+]
+
+
+class TimedWebAPI(WebAPI):
+    """keeps the latency of every :meth:`request_json` call"""
+
+    def __init__(self, args, ripper):
+        WebAPI.__init__(self, args, ripper)
+        self.latencies = []
+        self.failures = 0
+        self.timing_lock = threading.Lock()
+
+    def request_json(self, url, msg, ttl_type=None):
+        start = time.time()
+        json_obj = WebAPI.request_json(self, url, msg, ttl_type)
+        with self.timing_lock:
+            self.latencies.append(time.time() - start)
+            if json_obj is None:
+                self.failures += 1
+        return json_obj
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * pct / 100.0), len(values) - 1)]
+
+
+def web_args(bench_args, server):
+    args = argparse.Namespace()
+    args.web_api_url = server.api_url
+    args.charts_url = server.charts_url
+    # only the network path is measured
+    args.web_cache_size = "0"
+    args.web_memory_size = "16"
+    args.web_offline = False
+    args.web_workers = bench_args.workers
+    args.web_timeout = "10"
+    args.web_rate = bench_args.rate
+    args.web_retries = "5"
+    return args
+
+
+def run_scenario(bench_args, name, options):
+    # the 429s ask for no wait, so only the retry overhead is measured
+    server = FakeWebServer(retry_after=0, **options)
+    server.start()
+    web = TimedWebAPI(web_args(bench_args, server), None)
+
+    # the WebAPI reports every request on stdout
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    start = time.time()
+    try:
+        for i in range(bench_args.artists):
+            web.get_non_appears_on_albums("spotify:artist:bench" + str(i))
+        web.prefetch_genres("album", ["spotify:album:bench" + str(i)
+                                      for i in range(bench_args.albums)])
+        for region in ("global", "us", "gb", "de"):
+            web.get_charts("spotify:charts:regional:" + region +
+                           ":weekly:latest")
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    elapsed = time.time() - start
+    server.stop()
+
+    latencies = web.latencies
+    print(Fore.YELLOW + "  " + name + ":" + Fore.RESET)
+    print("    %d calls, %d HTTP requests in %.2fs (%.1f calls/sec)" % (
+        len(latencies), server.requests, elapsed,
+        len(latencies) / elapsed if elapsed > 0 else 0))
+    print("    latency p50 %.3fs, p90 %.3fs, p99 %.3fs, max %.3fs" % (
+        percentile(latencies, 50), percentile(latencies, 90),
+        percentile(latencies, 99), percentile(latencies, 100)))
+    print("    %d retries, %.1fs backoff, %.1fs rate limit waits, "
+          "%d failed calls" % (web.client.retries, web.client.backoff,
+                               web.limiter.waited, web.failures))
+
+
+def main(prog_args=sys.argv[1:]):
+    parser = argparse.ArgumentParser(
+        prog='python -m spotify_ripper.webbench',
+        description='Benchmark the Web API client against a local fake '
+                    'Web API')
+    parser.add_argument('--artists', type=int, default=20,
+                        help='Number of artist album listings to fetch')
+    parser.add_argument('--albums', type=int, default=500,
+                        help='Number of album genres to look up')
+    parser.add_argument('--workers', default="4",
+                        help='Number of parallel Web API requests')
+    parser.add_argument('--rate', default="0",
+                        help='Web API requests per second, 0 for no limit')
+    bench_args = parser.parse_args(prog_args)
+
+    print(Fore.GREEN + "\nWeb API Benchmark\n" + ("-" * 79) + Fore.RESET)
+    for name, options in scenarios:
+        run_scenario(bench_args, name, options)
+
+
+if __name__ == '__main__':
+    main()
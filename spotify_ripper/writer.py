@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+import sys
+import time
+import errno
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# fcntl.F_SETPIPE_SZ is only exposed from Python 3.10 on
+F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+
+
+class WriterStats(object):
+    """write counters accumulated over all tracks of a run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def add(self, writes, _bytes, seconds):
+        with self.lock:
+            self.writes += writes
+            self.bytes += _bytes
+            self.seconds += seconds
+
+    def writes_per_sec(self):
+        return self.writes / self.seconds if self.seconds > 0 else 0.0
+
+
+class EncoderWriter(threading.Thread):
+    """Drains the rip buffer into the track's encoders.
+
+    Runs once per track so the ripping thread only has to deal with
+    progress and control flow.  Data is held back in the rip buffer until
+    at least ``write_size`` bytes are available and then handed to the
+    encoders in as few system calls as possible (``os.writev`` for
+    encoder pipes).  Every encoder is given the same views of the
+    buffer, so fanning out to several outputs doesn't copy the data.
+    """
+
+    name = 'SpotifyEncoderWriter'
+
+    def __init__(self, rip_buffer, stats, write_size, encoders):
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.rip_buffer = rip_buffer
+        self.stats = stats
+        self.write_size = min(write_size, rip_buffer.capacity // 2)
+        self.encoders = encoders
+
+        self.writes = 0
+        self.bytes_written = 0
+        self.error = None
+        self.finished = False
+        self._finishing = False
+        self._stopped = False
+
+        for encoder in encoders:
+            if encoder.pipe is not None:
+                self.grow_pipe(encoder.pipe.fileno())
+
+    def grow_pipe(self, fd):
+        if fcntl is None or not sys.platform.startswith("linux"):
+            return
+        try:
+            fcntl.fcntl(fd, F_SETPIPE_SZ, self.write_size)
+        except (IOError, OSError):
+            # above /proc/sys/fs/pipe-max-size, keep the default size
+            pass
+
+    def run(self):
+        rip_buffer = self.rip_buffer
+        start_time = time.time()
+        try:
+            while not self._stopped:
+                views = rip_buffer.peek(self.write_size, timeout=0.5)
+                if self._stopped:
+                    break
+                if not views:
+                    if self._finishing and rip_buffer.empty():
+                        self.finished = True
+                        break
+                    continue
+
+                size = sum(len(view) for view in views)
+                for encoder in self.encoders:
+                    self.write_views(encoder, views)
+                rip_buffer.consume(size)
+                self.bytes_written += size
+        except Exception as e:
+            # any error fails the track, not just I/O errors
+            self.error = e
+        finally:
+            self.stats.add(self.writes, self.bytes_written,
+                           time.time() - start_time)
+
+    def write_views(self, encoder, views):
+        if encoder.pipe is not None:
+            if hasattr(os, "writev"):
+                self.writev(encoder.pipe.fileno(), views)
+            else:
+                for view in views:
+                    encoder.pipe.write(view)
+                    self.writes += 1
+
+        if encoder.wav_file is not None:
+            for view in views:
+                encoder.wav_file.writeframes(view)
+                self.writes += 1
+
+        if encoder.pcm_file is not None:
+            for view in views:
+                encoder.pcm_file.write(view)
+                self.writes += 1
+
+    def writev(self, fd, views):
+        while views:
+            try:
+                written = os.writev(fd, views)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            self.writes += 1
+
+            # partial write, skip what made it into the pipe
+            while views and written >= len(views[0]):
+                written -= len(views[0])
+                views = views[1:]
+            if views and written > 0:
+                views = [views[0][written:]] + views[1:]
+
+    def finish(self):
+        """write out everything left in the buffer and wait for the
+        writer to exit"""
+        self._finishing = True
+        self.rip_buffer.flush(True)
+        self.join()
+        self.rip_buffer.flush(False)
+
+    def stop(self):
+        """exit without writing out buffered data"""
+        self._stopped = True
+        self.rip_buffer.flush(True)
+        self.join()
+        self.rip_buffer.flush(False)
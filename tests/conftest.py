@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.utils import init_util_globals
+import argparse
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def util_args(tmpdir):
+    """the global args the utils functions read"""
+    args = argparse.Namespace(ascii=False, ascii_path_only=False,
+                              settings=[str(tmpdir.join("settings"))],
+                              directory=[str(tmpdir.join("music"))])
+    init_util_globals(args)
+    return args
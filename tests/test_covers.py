@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.covers import CoverCache
+from io import BytesIO
+import os
+import pytest
+
+
+class Loader(object):
+    """stands in for downloading the image from Spotify"""
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.data
+
+
+def data_files(cache_dir):
+    return [name for _, _, names in os.walk(str(cache_dir.join("data")))
+            for name in names]
+
+
+def test_downloads_once(tmpdir):
+    covers = CoverCache(str(tmpdir))
+    load_image = Loader(b"image data")
+    assert covers.get("spotify:image:abc", load_image) == b"image data"
+    assert covers.get("spotify:image:abc", load_image) == b"image data"
+    assert load_image.calls == 1
+    assert (covers.downloads, covers.hits) == (1, 1)
+
+
+def test_kept_on_disk(tmpdir):
+    CoverCache(str(tmpdir)).get("spotify:image:abc", Loader(b"image data"))
+
+    covers = CoverCache(str(tmpdir))
+    load_image = Loader(b"other")
+    assert covers.get("spotify:image:abc", load_image) == b"image data"
+    assert load_image.calls == 0
+
+
+def test_same_image_is_stored_once(tmpdir):
+    covers = CoverCache(str(tmpdir))
+    covers.get("spotify:image:abc", Loader(b"image data"))
+    covers.get("spotify:image:def", Loader(b"image data"))
+    covers.get("spotify:image:ghi", Loader(b"other image"))
+    assert len(data_files(tmpdir)) == 2
+
+
+def test_resized(tmpdir):
+    Image = pytest.importorskip("PIL.Image")
+    out = BytesIO()
+    Image.new("RGB", (640, 640), (200, 10, 10)).save(out, "PNG")
+    original = out.getvalue()
+
+    covers = CoverCache(str(tmpdir), max_size=100, quality=80)
+    load_image = Loader(original)
+    data = covers.get("spotify:image:abc", load_image)
+    assert Image.open(BytesIO(data)).size == (100, 100)
+    assert covers.bytes_saved == len(original) - len(data)
+
+    # the original and the variant are both cached
+    assert len(data_files(tmpdir)) == 2
+    covers = CoverCache(str(tmpdir), max_size=100, quality=80)
+    assert covers.get("spotify:image:abc", load_image) == data
+    assert load_image.calls == 1
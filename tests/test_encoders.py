@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper import encoders
+from spotify_ripper.encoders import (Encoder, EncoderSpawner, get_encoder,
+                                     temp_dir)
+from spotify_ripper.tags import TrackMetadata
+import os
+import argparse
+import pytest
+
+
+class CatEncoder(Encoder):
+    """copies its input, stands in for a real encoder program"""
+
+    output_type = "cat"
+    command = "sh"
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        return ["sh", "-c", "cat > \"$0\"", audio_file_enc]
+
+
+class TaggingCatEncoder(CatEncoder):
+    """a copying encoder that appends the title tag to its output"""
+
+    output_type = "tcat"
+    tags_at_encode = True
+
+    def command_line(self, audio_file_enc, tag_args=()):
+        return ["sh", "-c", "cat > \"$0\"; printf %s \"$1\" >> \"$0\"",
+                audio_file_enc] + list(tag_args)
+
+    def tag_args(self, fields, cover_file):
+        return [" " + fields["TITLE"]], set(["TITLE"])
+
+
+@pytest.fixture
+def cat_encoder(monkeypatch):
+    monkeypatch.setitem(encoders.encoders, "cat", CatEncoder)
+    monkeypatch.setitem(encoders.encoders, "tcat", TaggingCatEncoder)
+
+
+def output_args(output_type):
+    return argparse.Namespace(output_type=output_type, ascii_path_only=False,
+                              cover_file=None)
+
+
+def metadata(uri="spotify:track:1"):
+    return TrackMetadata.from_dict({
+        "uri": uri, "title": "Song", "artist": "Artist",
+        "album": "Album", "year": 1999, "disc": 1, "index": 3,
+        "num_tracks": 12, "num_discs": 1, "genres": [], "comment": None,
+        "resolved": True})
+
+
+def test_registry():
+    for output_type in ("mp3", "flac", "ogg", "opus", "aac", "m4a",
+                        "alac.m4a", "wav", "pcm"):
+        encoder = get_encoder(output_type)
+        assert issubclass(encoder, Encoder)
+        assert encoder.output_type == output_type
+    assert get_encoder("mp2") is None
+
+
+def test_lame_always_pads_the_id3v2_tag():
+    args = argparse.Namespace(output_type="mp3", stereo_mode=None, cbr=False,
+                              vbr="0", ascii_path_only=False,
+                              cover_file=None)
+    encoder = get_encoder("mp3")(args)
+    padding = ["--id3v2-only", "--pad-id3v2-size", "4096"]
+
+    # an untagged spare, mutagen tags it afterwards
+    command = " ".join(encoder.command_line("a.mp3"))
+    assert command.count(" ".join(padding)) == 1
+
+    tag_args, tagged = encoder.tag_args(
+        {"TITLE": "Song", "TRACKNUMBER": "3", "TRACKTOTAL": "12",
+         "DISCNUMBER": "1", "DISCTOTAL": "1"}, None)
+    command = " ".join(encoder.command_line("a.mp3", tag_args))
+    assert command.count(" ".join(padding)) == 1
+    assert "--tt Song" in command
+
+
+def test_spare_is_used(tmpdir):
+    spawner = EncoderSpawner(output_args("pcm"))
+    spawner.prespawn()
+    spare = spawner.spare
+    # only one spare at a time
+    spawner.prespawn()
+    assert spawner.spare is spare
+
+    audio_file = str(tmpdir.join("a.pcm"))
+    proc = spawner.acquire(audio_file)
+    assert proc is spare
+    assert spawner.spare is None
+    assert proc.audio_file == audio_file
+
+    # no spare, a new one is started
+    other = spawner.acquire(str(tmpdir.join("b.pcm")))
+    assert other is not proc
+    for _proc in (proc, other):
+        _proc.close()
+    spawner.close()
+
+
+def test_pcm_output_is_moved_into_place(tmpdir):
+    spawner = EncoderSpawner(output_args("pcm"))
+    audio_file = str(tmpdir.join("a.pcm"))
+    proc = spawner.acquire(audio_file)
+    assert os.path.dirname(proc.temp_file) == temp_dir()
+    proc.pcm_file.write(b"pcm data")
+    proc.close()
+    spawner.close()
+
+    assert tmpdir.join("a.pcm").read_binary() == b"pcm data"
+    assert not os.path.exists(temp_dir())
+
+
+def test_encoder_process(tmpdir, cat_encoder):
+    spawner = EncoderSpawner(output_args("cat"))
+    spawner.prespawn()
+    proc = spawner.acquire(str(tmpdir.join("a.cat")))
+    proc.pipe.write(b"audio data")
+    proc.close()
+    assert tmpdir.join("a.cat").read_binary() == b"audio data"
+    spawner.close()
+
+
+def test_tagged_spare(tmpdir, cat_encoder):
+    spawner = EncoderSpawner(output_args("tcat"))
+    spawner.prespawn(metadata())
+    spare = spawner.spare
+    assert spawner.spare_uri == "spotify:track:1"
+
+    proc = spawner.acquire(str(tmpdir.join("a.tcat")), metadata())
+    assert proc is spare
+    proc.pipe.write(b"audio data")
+    proc.close()
+    assert tmpdir.join("a.tcat").read_binary() == b"audio data Song"
+    assert proc.tagged == set(["TITLE"])
+    assert (spawner.spare_hits, spawner.spare_misses) == (1, 0)
+    spawner.close()
+
+
+def test_untagged_spare_is_used(tmpdir, cat_encoder):
+    spawner = EncoderSpawner(output_args("tcat"))
+    spawner.prespawn()
+    spare = spawner.spare
+
+    # the file is tagged afterwards instead
+    proc = spawner.acquire(str(tmpdir.join("a.tcat")), metadata())
+    assert proc is spare
+    assert proc.tagged == set()
+    proc.close()
+    spawner.close()
+
+
+def test_spare_for_another_track_is_discarded(tmpdir, cat_encoder):
+    spawner = EncoderSpawner(output_args("tcat"))
+    spawner.prespawn(metadata("spotify:track:2"))
+    spare_file = spawner.spare.temp_file
+
+    proc = spawner.acquire(str(tmpdir.join("a.tcat")), metadata())
+    assert not os.path.exists(spare_file)
+    assert spawner.spare is None
+    assert proc.tagged == set(["TITLE"])
+    assert (spawner.spare_hits, spawner.spare_misses) == (0, 1)
+    proc.close()
+    spawner.close()
+
+
+def test_abort(tmpdir, cat_encoder):
+    spawner = EncoderSpawner(output_args("cat"))
+    proc = spawner.acquire(str(tmpdir.join("a.cat")))
+    proc.pipe.write(b"audio data")
+    proc.abort()
+    assert not os.path.exists(proc.temp_file)
+    assert not tmpdir.join("a.cat").exists()
+
+    # the spare is thrown away when the spawner is closed
+    spawner.prespawn()
+    spare_file = spawner.spare.temp_file
+    spawner.close()
+    assert not os.path.exists(spare_file)
+    assert not os.path.exists(temp_dir())
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.httpcache import HTTPCache
+from spotify_ripper.web import WebAPI
+import os
+import json
+import time
+import argparse
+import threading
+
+try:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+
+def test_put_and_get(tmpdir):
+    cache = HTTPCache(str(tmpdir), 1024 * 1024)
+    url = "https://api.spotify.com/v1/albums/abc"
+    assert cache.get(url) is None
+
+    cache.put(url, {"id": "abc"}, {"ETag": "\"v1\""})
+    entry = cache.get(url)
+    assert entry["body"] == {"id": "abc"}
+    assert entry["etag"] == "\"v1\""
+    assert cache.get(url + "x") is None
+
+
+def test_freshness(tmpdir):
+    cache = HTTPCache(str(tmpdir), 1024 * 1024)
+    cache.put("url", {})
+    entry = cache.get("url")
+    assert cache.is_fresh(entry, 60)
+
+    entry["stored"] -= 120
+    assert not cache.is_fresh(entry, 60)
+    cache.touch(entry)
+    assert cache.is_fresh(cache.get("url"), 60)
+
+
+def test_validators(tmpdir):
+    cache = HTTPCache(str(tmpdir), 1024 * 1024)
+    cache.put("url", {}, {"ETag": "\"v1\"",
+                          "Last-Modified": "Mon, 01 Jan 2018 00:00:00 GMT"})
+    assert cache.validators(cache.get("url")) == {
+        "If-None-Match": "\"v1\"",
+        "If-Modified-Since": "Mon, 01 Jan 2018 00:00:00 GMT"}
+    cache.put("other", {})
+    assert cache.validators(cache.get("other")) == {}
+
+
+def test_evicts_least_recently_used(tmpdir):
+    body = {"data": "x" * 1000}
+    cache = HTTPCache(str(tmpdir), 4000)
+    now = time.time()
+    for i in range(3):
+        cache.put("url" + str(i), body)
+        os.utime(cache.entry_file("url" + str(i)), (now - 100 + i,) * 2)
+    # reading an entry makes it the most recently used
+    cache.get("url0")
+
+    cache.put("url3", body)
+    assert cache.size <= 3000
+    assert cache.get("url1") is None
+    assert cache.get("url0") is not None
+    assert cache.get("url3") is not None
+
+
+class RevalidatingHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        data = json.dumps({"items": [], "next": None}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", self.server.etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_web_api_revalidates(tmpdir):
+    server = HTTPServer(("127.0.0.1", 0), RevalidatingHandler)
+    server.etag = "\"v1\""
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    args = argparse.Namespace(
+        web_api_url="http://127.0.0.1:%d/v1/" % server.server_address[1],
+        charts_url="", web_cache_size="1", web_memory_size="1",
+        web_offline=False, web_workers="1", web_timeout="10",
+        web_rate="0", web_retries="0")
+    web = WebAPI(args, None)
+    web.http_cache = HTTPCache(str(tmpdir.join("web-cache")), 1024 * 1024)
+    url = web.api_url("albums/abc")
+    try:
+        assert web.request_json(url, "album", "albums") is not None
+        # fresh, answered from the cache
+        assert web.request_json(url, "album", "albums") is not None
+        assert server.requests == [None]
+
+        # stale, revalidated with the ETag
+        web.ttls = dict(web.ttls, albums=0)
+        assert web.request_json(url, "album", "albums") == \
+            {"items": [], "next": None}
+        assert server.requests == [None, "\"v1\""]
+        assert web.http_cache.revalidated == 1
+
+        # changed on the server, downloaded again
+        server.etag = "\"v2\""
+        web.request_json(url, "album", "albums")
+        assert web.http_cache.get(url)["etag"] == "\"v2\""
+        assert web.http_cache.misses == 2
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper import httpclient
+from spotify_ripper.fakeweb import FakeWebServer
+from spotify_ripper.httpclient import HTTPClient
+from spotify_ripper.ratelimit import RateLimiter
+import time
+import threading
+import pytest
+
+
+@pytest.fixture
+def server():
+    server = FakeWebServer(retry_after=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_get(server):
+    client = HTTPClient(2, 10, RateLimiter(0))
+    response = client.get(server.api_url + "artists/abc")
+    assert response.status_code == 200
+    assert response.json()["id"] == "abc"
+    assert client.requests == 1
+
+
+def test_concurrent_gets_are_coalesced(server):
+    server.latency = 0.3
+    client = HTTPClient(2, 10, RateLimiter(0))
+    url = server.api_url + "artists/abc"
+    responses = []
+
+    def get():
+        responses.append(client.get(url).json())
+
+    threads = [threading.Thread(target=get) for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert server.requests == 1
+    assert client.coalesced == 4
+    assert len(responses) == 5
+    assert all(response["id"] == "abc" for response in responses)
+
+
+def test_conditional_gets_are_not_coalesced_with_others(server):
+    server.latency = 0.2
+    client = HTTPClient(2, 10, RateLimiter(0))
+    url = server.api_url + "artists/abc"
+    threads = [threading.Thread(target=client.get, args=(url, headers))
+               for headers in (None, {"If-None-Match": "x"})]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.requests == 2
+
+
+def test_429_is_retried_and_pauses(server):
+    server.rate_429 = 1.0
+    limiter = RateLimiter(0)
+    client = HTTPClient(1, 10, limiter, max_retries=3)
+    response = client.get(server.api_url + "artists/abc")
+    # given up after the last retry
+    assert response.status_code == 429
+    assert server.requests == 4
+    assert client.retries == 3
+    assert limiter.throttled == 3
+    assert client.backoff == 0
+
+
+def test_5xx_backoff_is_not_a_rate_limit_wait(server, monkeypatch):
+    monkeypatch.setattr(httpclient, "backoff_delay", lambda attempt: 0.05)
+    server.rate_5xx = 1.0
+    limiter = RateLimiter(0)
+    client = HTTPClient(1, 10, limiter, max_retries=2)
+    response = client.get(server.api_url + "artists/abc")
+    assert response.status_code == 503
+    assert client.retries == 2
+    assert abs(client.backoff - 0.1) < 1e-9
+    assert limiter.waited == 0
+    assert limiter.throttled == 0
+
+
+def test_retry_after_is_honoured(server):
+    server.rate_429 = 1.0
+    server.retry_after = 1
+    client = HTTPClient(1, 10, RateLimiter(0), max_retries=1)
+    start = time.time()
+    client.get(server.api_url + "artists/abc")
+    assert time.time() - start >= 0.9
+    assert server.requests == 2
+
+
+def test_map_keeps_order(server):
+    client = HTTPClient(4, 10, RateLimiter(0))
+    ids = ["id" + str(i) for i in range(20)]
+    results = client.map(
+        lambda _id: client.get(server.api_url + "albums/" + _id).json(),
+        ids)
+    assert [result["id"] for result in results] == ids
+
+
+def test_map_raises_errors():
+    client = HTTPClient(2, 10, RateLimiter(0))
+
+    def fail(item):
+        if item == 2:
+            raise ValueError("bad item")
+        return item
+
+    with pytest.raises(ValueError):
+        client.map(fail, [1, 2, 3])
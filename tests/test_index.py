@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.index import OutputIndex
+import os
+
+
+def test_exists(tmpdir):
+    tmpdir.join("a", "b", "x.mp3").ensure()
+    index = OutputIndex(str(tmpdir))
+    assert index.exists(str(tmpdir.join("a", "b", "x.mp3")))
+    assert index.exists(str(tmpdir.join("a", "b")))
+    assert not index.exists(str(tmpdir.join("a", "b", "y.mp3")))
+    assert not index.exists(str(tmpdir.join("c", "d", "z.mp3")))
+
+
+def test_only_queried_directories_are_listed(tmpdir):
+    tmpdir.join("a", "b", "x.mp3").ensure()
+    tmpdir.join("other", "deep", "y.mp3").ensure()
+    index = OutputIndex(str(tmpdir))
+    index.exists(str(tmpdir.join("a", "b", "x.mp3")))
+    index.exists(str(tmpdir.join("c", "d", "z.mp3")))
+    assert str(tmpdir.join("other")) not in index.listings
+    assert str(tmpdir.join("other", "deep")) not in index.listings
+    # c isn't in the root, so c/d isn't looked up
+    assert index.listings[str(tmpdir.join("c", "d"))] is None
+
+
+def test_symlink_loops(tmpdir):
+    tmpdir.join("a", "x.mp3").ensure()
+    os.symlink(str(tmpdir), str(tmpdir.join("a", "loop")))
+    index = OutputIndex(str(tmpdir))
+    assert index.exists(str(tmpdir.join("a", "x.mp3")))
+    assert index.exists(str(tmpdir.join("a", "loop", "a", "x.mp3")))
+    assert len(index.listings) == 4
+
+
+def test_makedirs_and_add(tmpdir):
+    index = OutputIndex(str(tmpdir))
+    new_dir = str(tmpdir.join("c", "d"))
+    audio_file = os.path.join(new_dir, "z.mp3")
+    assert not index.exists(audio_file)
+
+    index.makedirs(new_dir)
+    assert os.path.isdir(new_dir)
+    assert index.exists(new_dir)
+    assert not index.exists(audio_file)
+
+    open(audio_file, "w").close()
+    index.add(audio_file)
+    assert index.exists(audio_file)
+
+
+def test_move_and_remove(tmpdir):
+    tmpdir.join("a", "x.mp3").ensure()
+    tmpdir.join("b").ensure(dir=True)
+    index = OutputIndex(str(tmpdir))
+    src = str(tmpdir.join("a", "x.mp3"))
+    dst = str(tmpdir.join("b", "x.mp3"))
+    assert index.exists(src) and not index.exists(dst)
+
+    index.move(src, dst)
+    assert not index.exists(src) and index.exists(dst)
+    assert os.path.exists(dst)
+
+    index.remove(dst)
+    assert not index.exists(dst)
+    assert not os.path.exists(dst)
+
+
+def test_paths_outside_the_root(tmpdir):
+    tmpdir.join("outside.mp3").ensure()
+    index = OutputIndex(str(tmpdir.join("music")))
+    assert index.exists(str(tmpdir.join("outside.mp3")))
+    assert index.listings == {}
+
+
+def test_refresh(tmpdir):
+    index = OutputIndex(str(tmpdir))
+    audio_file = str(tmpdir.join("a", "b", "x.mp3"))
+    assert not index.exists(audio_file)
+
+    # written by another process
+    tmpdir.join("a", "b", "x.mp3").ensure()
+    assert not index.exists(audio_file)
+    index.refresh([audio_file])
+    assert index.exists(audio_file)
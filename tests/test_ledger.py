@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.ledger import RipLedger, output_quality
+import argparse
+
+
+def output_args(output_type="mp3", vbr="0", cbr=False, bitrate="320"):
+    return argparse.Namespace(output_type=output_type, quality="320",
+                              vbr=vbr, cbr=cbr, bitrate=bitrate, comp="8")
+
+
+def test_output_quality():
+    assert output_quality(output_args()) == "320k vbr 0"
+    assert output_quality(output_args(cbr=True)) == "320k cbr 320"
+    assert output_quality(output_args("flac")) == "320k comp 8"
+    assert output_quality(output_args("wav")) == "320k"
+
+
+def test_round_trip(tmpdir):
+    db_file = str(tmpdir.join("ledger", "rips.db"))
+    mp3, flac = output_args(), output_args("flac")
+    audio_file = tmpdir.join("a.mp3")
+    audio_file.write(b"x" * 10)
+
+    ledger = RipLedger(db_file)
+    assert ledger.done_files("spotify:track:1", [mp3]) is None
+    ledger.add_rip("spotify:track:1", mp3, str(audio_file), 1000)
+    ledger.add_rip("spotify:track:1", flac, "a.flac", 1000)
+    ledger.close()
+
+    ledger = RipLedger(db_file)
+    assert ledger.done_files("spotify:track:1", [mp3, flac]) == \
+        [str(audio_file), "a.flac"]
+    assert ledger.done_files("spotify:track:2", [mp3]) is None
+    size = ledger.conn.execute("SELECT size FROM rips WHERE output_type = "
+                               "'mp3'").fetchone()[0]
+    assert size == 10
+    ledger.close()
+
+
+def test_other_quality_is_not_done(tmpdir):
+    ledger = RipLedger(str(tmpdir.join("rips.db")))
+    ledger.add_rip("spotify:track:1", output_args(vbr="0"), "a.mp3", 1000)
+    ledger.flush()
+    assert ledger.done_files("spotify:track:1", [output_args(vbr="2")]) \
+        is None
+    # every output has to be done
+    assert ledger.done_files("spotify:track:1",
+                             [output_args(), output_args("flac")]) is None
+    ledger.close()
+
+
+def test_writes_are_batched(tmpdir):
+    ledger = RipLedger(str(tmpdir.join("rips.db")), batch_size=4)
+    mp3 = output_args()
+    ledger.add_rip("spotify:track:1", mp3, "1.mp3", 1000)
+    assert ledger.done_files("spotify:track:1", [mp3]) is None
+    # each rip queues two statements
+    ledger.add_rip("spotify:track:2", mp3, "2.mp3", 1000)
+    assert ledger.done_files("spotify:track:1", [mp3]) == ["1.mp3"]
+    assert ledger.pending == []
+    ledger.close()
+
+
+def test_failures(tmpdir):
+    ledger = RipLedger(str(tmpdir.join("rips.db")))
+    ledger.add_failure("spotify:track:1")
+    ledger.add_failure("spotify:track:1")
+    ledger.flush()
+    assert ledger.conn.execute(
+        "SELECT count FROM failures WHERE uri = ?",
+        ("spotify:track:1", )).fetchone()[0] == 2
+
+    # a successful rip clears the failures
+    ledger.add_rip("spotify:track:1", output_args(), "1.mp3", 1000)
+    ledger.flush()
+    assert ledger.conn.execute("SELECT count(*) FROM failures").fetchone() \
+        == (0, )
+    ledger.close()
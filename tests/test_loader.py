@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+import pytest
+
+spotify = pytest.importorskip("spotify")
+
+from spotify_ripper.loader import BatchLoader  # noqa: E402
+
+
+class Track(object):
+    """a track that finishes loading ``delay`` seconds after it is first
+    polled"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.first_poll = None
+
+    @property
+    def is_loaded(self):
+        if self.first_poll is None:
+            self.first_poll = time.time()
+        return time.time() - self.first_poll >= self.delay
+
+    @property
+    def error(self):
+        return spotify.ErrorType.OK if self.is_loaded \
+            else spotify.ErrorType.IS_LOADING
+
+
+class FailedTrack(object):
+    """a track libspotify gave up on, it never loads"""
+
+    is_loaded = False
+    error = spotify.ErrorType.OTHER_PERMANENT
+
+
+class BrokenTrack(object):
+
+    error = spotify.ErrorType.IS_LOADING
+
+    @property
+    def is_loaded(self):
+        raise spotify.Error("Track is broken")
+
+
+def loader(window_size=8, timeout=5):
+    batch_loader = BatchLoader(window_size, timeout)
+    batch_loader.poll_interval = 0.01
+    return batch_loader
+
+
+def test_yields_tracks_as_they_finish():
+    tracks = [Track(0.2), Track(0), Track(0.1)]
+    batch_loader = loader()
+    results = list(batch_loader.load(tracks))
+
+    assert [idx for idx, _, _ in results] == [1, 2, 0]
+    assert all(track is tracks[idx] for idx, track, _ in results)
+    assert all(error is None for _, _, error in results)
+    assert len(batch_loader.latencies) == 3
+    assert batch_loader.timeouts == 0
+
+
+def test_window_size():
+    tracks = [Track(0.05) for _ in range(4)]
+    batch_loader = loader(window_size=2)
+    for idx, track, error in batch_loader.load(tracks):
+        # the next window isn't polled before a slot is free
+        polled = [t for t in tracks if t.first_poll is not None]
+        assert len(polled) <= idx + 2
+    assert all(t.first_poll is not None for t in tracks)
+
+
+def test_timeout_and_errors():
+    tracks = [Track(60), Track(0), BrokenTrack(), FailedTrack()]
+    batch_loader = loader(timeout=0.1)
+    start = time.time()
+    results = []
+    for idx, _, error in batch_loader.load(tracks):
+        results.append((idx, error, time.time() - start))
+    errors = dict((idx, error) for idx, error, _ in results)
+
+    assert errors == {
+        0: "Timeout while loading track",
+        1: None,
+        2: "Track is broken",
+        3: str(spotify.LibError(spotify.ErrorType.OTHER_PERMANENT)),
+    }
+    # the failed track isn't waited on until it times out
+    assert [idx for idx, _, _ in results][-1] == 0
+    assert [seconds for idx, _, seconds in results if idx == 3][0] < 0.1
+    assert batch_loader.timeouts == 1
+    assert len(batch_loader.latencies) == 1
+
+
+def test_percentile():
+    batch_loader = loader()
+    assert batch_loader.percentile(50) == 0.0
+
+    for seconds in [0.5, 0.1, 0.4, 0.2, 0.3]:
+        batch_loader.add_latency(seconds)
+    assert batch_loader.percentile(0) == 0.1
+    assert batch_loader.percentile(50) == 0.3
+    assert batch_loader.percentile(95) == 0.5
+    assert batch_loader.percentile(100) == 0.5
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.lru import LRUCache, approx_size
+
+
+def test_get_and_put():
+    cache = LRUCache(100)
+    assert cache.get("a") is None
+    cache.put("a", "value", 10)
+    assert cache.get("a") == "value"
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.size == 10
+
+
+def test_evicts_least_recently_used_by_size():
+    cache = LRUCache(30)
+    cache.put("a", 1, 10)
+    cache.put("b", 2, 10)
+    cache.put("c", 3, 10)
+    # "a" is now the most recently used
+    cache.get("a")
+    cache.put("d", 4, 15)
+
+    assert cache.get("b") is None
+    assert cache.get("c") is None
+    assert cache.get("a") == 1
+    assert cache.get("d") == 4
+    assert cache.size == 25
+    assert cache.evictions == 2
+    assert len(cache) == 2
+
+
+def test_replace_updates_size():
+    cache = LRUCache(100)
+    cache.put("a", 1, 40)
+    cache.put("a", 2, 10)
+    assert cache.size == 10
+    assert cache.get("a") == 2
+
+
+def test_too_large_values_are_not_kept():
+    cache = LRUCache(10)
+    cache.put("a", 1, 5)
+    cache.put("a", 2, 20)
+    assert cache.get("a") is None
+    assert cache.size == 0
+
+
+def test_approx_size():
+    assert approx_size({"name": "x" * 100}) > 100
+    assert approx_size(object()) == 1024
+    cache = LRUCache(1000)
+    cache.put("a", ["x" * 100])
+    assert cache.size == approx_size(["x" * 100])
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.pipeline import TrackFinisher
+import time
+import threading
+
+
+def test_synchronous():
+    finished = []
+    finisher = TrackFinisher(0, finished.append)
+    finisher.submit(1)
+    finisher.submit(2)
+    assert finished == [1, 2]
+    assert finisher.in_flight() == 0
+
+
+def test_background():
+    release = threading.Event()
+    finished = []
+
+    def finish(job):
+        release.wait(5)
+        finished.append(job)
+
+    finisher = TrackFinisher(2, finish)
+    finisher.submit(1)
+    finisher.submit(2)
+    assert finisher.in_flight() == 2
+    assert finished == []
+
+    release.set()
+    finisher.wait()
+    assert sorted(finished) == [1, 2]
+    assert finisher.in_flight() == 0
+
+
+def test_submit_blocks_while_all_slots_are_busy():
+    release = threading.Event()
+    submitted = []
+
+    finisher = TrackFinisher(1, lambda job: release.wait(5))
+    finisher.submit(1)
+
+    def submit():
+        finisher.submit(2)
+        submitted.append(2)
+
+    thread = threading.Thread(target=submit)
+    thread.start()
+    time.sleep(0.1)
+    assert submitted == []
+
+    release.set()
+    thread.join()
+    finisher.wait()
+    assert submitted == [2]
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+import argparse
+import pytest
+
+spotify = pytest.importorskip("spotify")
+
+from spotify_ripper.index import OutputIndex  # noqa: E402
+from spotify_ripper.ledger import RipLedger  # noqa: E402
+from spotify_ripper.loader import BatchLoader  # noqa: E402
+from spotify_ripper.metadata import MetadataStore  # noqa: E402
+from spotify_ripper.plan import Planner  # noqa: E402
+
+
+class Link(object):
+
+    def __init__(self, uri):
+        self.uri = uri
+
+
+class Named(object):
+
+    def __init__(self, name, uri=None):
+        self.name = name
+        self.link = Link(uri)
+
+
+class Album(Named):
+    year = 1999
+
+
+class Track(object):
+    """a pyspotify track with its metadata already there"""
+
+    def __init__(self, uri, name="Song", availability=1, load_error=None):
+        self.link = Link(uri)
+        self.name = name
+        self.availability = availability
+        self.artists = [Named("Artist", "spotify:artist:1")]
+        self.album = Album("Album", "spotify:album:1")
+        self.disc = 1
+        self.index = 3
+        self.duration = 200000
+        self.error = spotify.ErrorType.OK
+        self.load_error = load_error
+        self.polls = 0
+
+    @property
+    def is_loaded(self):
+        self.polls += 1
+        if self.load_error is not None:
+            raise spotify.Error(self.load_error)
+        return True
+
+
+class Web(object):
+
+    def __init__(self):
+        self.genre_requests = []
+
+    def prefetch_genres(self, genre_type, uris):
+        self.genre_requests.append((genre_type, sorted(uris)))
+
+
+class Ripper(object):
+    """the parts of the ripper the planner uses"""
+
+    def __init__(self, tracks, music_dir, ledger, metadata):
+        self.tracks = tracks
+        self.music_dir = music_dir
+        self.ledger = ledger
+        self.metadata = metadata
+        self.web = Web()
+        self.loader = BatchLoader(4, 1)
+        self.output_index = OutputIndex(music_dir)
+        self.current_playlist = None
+        self.current_album = None
+        self.current_chart = None
+        self.formatted = 0
+
+    def get_tracks_from_uri(self, uri):
+        if uri.startswith("spotify:charts:"):
+            self.current_chart = uri
+        else:
+            self.current_playlist = Named("Playlist " + uri)
+        return self.tracks
+
+    def format_track_paths(self, idx, track):
+        self.formatted += 1
+        return [os.path.join(self.music_dir, track.name + ".mp3")]
+
+
+def mp3_args():
+    return argparse.Namespace(output_type="mp3", quality="320", vbr="0",
+                              cbr=False, bitrate="320", comp="8")
+
+
+def plan(tmpdir, tracks, overwrite=False, ledger=None, metadata=None,
+         genres=None, uris=("spotify:playlist:1", ), mirror_charts=False,
+         playlist_sync=False):
+    args = argparse.Namespace(overwrite=overwrite, output_args=[mp3_args()],
+                              verify_ledger=False, genres=genres,
+                              mirror_charts=mirror_charts,
+                              playlist_sync=playlist_sync)
+    if ledger is None:
+        ledger = RipLedger(str(tmpdir.join("rips.db")))
+    if metadata is None:
+        metadata = MetadataStore(str(tmpdir.join("metadata.db")), 3600)
+    ripper = Ripper(tracks, str(tmpdir), ledger, metadata)
+    uri_plans = Planner(args, ripper).plan(list(uris))
+    return ripper, uri_plans
+
+
+def test_plan(tmpdir):
+    tracks = [Track("spotify:track:1", "One"), Track("spotify:track:2", "Two")]
+    ripper, uri_plans = plan(tmpdir, tracks)
+
+    assert len(uri_plans) == 1
+    uri_plan = uri_plans[0]
+    assert uri_plan.uri == "spotify:playlist:1"
+    assert uri_plan.playlist.name == "Playlist spotify:playlist:1"
+
+    one, two = uri_plan.tracks
+    assert (one.idx, one.uri, one.title, one.artist, one.album) == \
+        (0, "spotify:track:1", "One", "Artist", "Album")
+    assert one.available and not one.skip
+    assert one.duration == 200000
+    assert one.audio_file == str(tmpdir.join("One.mp3"))
+    assert two.idx == 1
+
+    # every track is loaded and formatted exactly once
+    assert [track.polls for track in tracks] == [1, 1]
+    assert ripper.formatted == 2
+
+
+def test_unavailable_and_failed_tracks(tmpdir):
+    tracks = [Track("spotify:track:1", availability=0),
+              Track("spotify:track:2", load_error="Track is not loaded")]
+    ripper, uri_plans = plan(tmpdir, tracks)
+
+    unavailable, failed = uri_plans[0].tracks
+    assert not unavailable.available
+    assert unavailable.audio_files is None
+    assert not failed.available
+    assert failed.error == "Track is not loaded"
+    assert ripper.formatted == 0
+
+
+def test_existing_files_are_skipped(tmpdir):
+    tmpdir.join("One.mp3").ensure()
+    tracks = [Track("spotify:track:1", "One"), Track("spotify:track:2", "Two")]
+    assert [p.skip for p in plan(tmpdir, tracks)[1][0].tracks] == \
+        [True, False]
+    assert [p.skip for p in plan(tmpdir, tracks, True)[1][0].tracks] == \
+        [False, False]
+
+
+def test_ledger_tracks_are_not_loaded(tmpdir):
+    ledger = RipLedger(str(tmpdir.join("rips.db")))
+    ledger.add_rip("spotify:track:1", mp3_args(),
+                   str(tmpdir.join("One.mp3")), 1000)
+    ledger.flush()
+    tracks = [Track("spotify:track:1", "One"), Track("spotify:track:2", "Two")]
+    ripper, uri_plans = plan(tmpdir, tracks, ledger=ledger)
+
+    done, todo = uri_plans[0].tracks
+    assert done.skip and done.available
+    assert done.audio_file == str(tmpdir.join("One.mp3"))
+    assert not todo.skip
+    assert [track.polls for track in tracks] == [0, 1]
+    assert ripper.formatted == 1
+
+    # a playlist sync needs the paths of the current --format
+    ripper, uri_plans = plan(tmpdir, tracks, ledger=ledger,
+                             playlist_sync=True)
+    assert ripper.formatted == 2
+
+
+def test_stored_tracks_are_not_loaded(tmpdir):
+    metadata = MetadataStore(str(tmpdir.join("metadata.db")), 3600)
+    tracks = [Track("spotify:track:1", "One"),
+              Track("spotify:track:2", availability=0)]
+    plan(tmpdir, tracks, metadata=metadata)
+    assert [track.polls for track in tracks] == [1, 1]
+
+    ripper, uri_plans = plan(tmpdir, tracks, metadata=metadata)
+    stored, unavailable = uri_plans[0].tracks
+    assert (stored.title, stored.artist, stored.album, stored.index) == \
+        ("One", "Artist", "Album", 3)
+    assert stored.audio_file == str(tmpdir.join("One.mp3"))
+    assert not unavailable.available
+    assert [track.polls for track in tracks] == [1, 1]
+    assert metadata.hits == 2
+
+
+def test_genres_are_prefetched_together(tmpdir):
+    tmpdir.join("One.mp3").ensure()
+    tracks = [Track("spotify:track:1", "One"), Track("spotify:track:2", "Two"),
+              Track("spotify:track:3", "Three")]
+    tracks[2].album.link = Link("spotify:album:2")
+    ripper, uri_plans = plan(tmpdir, tracks, genres=["album"])
+    # the skipped track's album isn't looked up
+    assert ripper.web.genre_requests == [
+        ("album", ["spotify:album:1", "spotify:album:2"])]
+
+    ripper, uri_plans = plan(tmpdir, tracks, genres=["artist"])
+    assert ripper.web.genre_requests == [("artist", ["spotify:artist:1"])]
+
+
+def test_chart_tracks_are_ripped_once(tmpdir):
+    tracks = [Track("spotify:track:1", "One"), Track("spotify:track:2", "Two")]
+    charts = ["spotify:charts:regional:global:weekly:latest",
+              "spotify:charts:regional:us:weekly:latest"]
+    ripper, uri_plans = plan(tmpdir, tracks, uris=charts, mirror_charts=True)
+
+    assert [p.skip for p in uri_plans[0].tracks] == [False, False]
+    assert [p.skip for p in uri_plans[1].tracks] == [True, True]
+    assert [p.audio_file for p in uri_plans[1].tracks] == \
+        [p.audio_file for p in uri_plans[0].tracks]
+    assert uri_plans[1].chart == charts[1]
+    assert [track.polls for track in tracks] == [1, 1]
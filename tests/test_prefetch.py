@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import pytest
+
+pytest.importorskip("spotify")
+
+from spotify_ripper.plan import TrackPlan  # noqa: E402
+from spotify_ripper.prefetch import Prefetcher  # noqa: E402
+
+
+def track_plan(idx, uri, available=True, skip=False):
+    plan = TrackPlan(idx, None)
+    plan.uri = uri
+    plan.available = available
+    plan.skip = skip
+    return plan
+
+
+def rip_order():
+    """a URI list file, one track per URI"""
+    return [(track_plan(0, "spotify:track:" + str(i)), "playlist" + str(i))
+            for i in range(5)]
+
+
+def test_looks_into_the_next_uris():
+    prefetcher = Prefetcher(None, None, 2)
+    order = rip_order()
+    upcoming = list(prefetcher.upcoming(order, 0))
+    assert [(plan.uri, playlist) for plan, playlist in upcoming] == [
+        ("spotify:track:1", "playlist1"), ("spotify:track:2", "playlist2")]
+    assert list(prefetcher.upcoming(order, 4)) == []
+    assert list(Prefetcher(None, None, 0).upcoming(order, 0)) == []
+
+
+def test_skips_tracks_that_are_not_ripped():
+    prefetcher = Prefetcher(None, None, 1)
+    order = [(track_plan(0, "spotify:track:0"), None),
+             (track_plan(1, "spotify:track:1", skip=True), None),
+             (track_plan(2, "spotify:track:2", available=False), None),
+             (track_plan(3, None), None),
+             (track_plan(4, "spotify:track:4"), None)]
+    assert [plan.uri for plan, _ in prefetcher.upcoming(order, 0)] == \
+        ["spotify:track:4"]
+
+
+def test_forget_keeps_the_upcoming_tracks():
+    prefetcher = Prefetcher(None, None, 2)
+    order = rip_order()
+    # a track of the finished URI that is also coming up next
+    order.insert(2, (order[0][0], "playlist0"))
+    for plan, _ in order:
+        prefetcher.scheduled.add(plan.uri)
+        prefetcher.snapshots[plan.uri] = object()
+
+    prefetcher.forget([order[0][0], order[1][0]], order, 1)
+    assert sorted(prefetcher.snapshots) == [
+        "spotify:track:0", "spotify:track:2", "spotify:track:3",
+        "spotify:track:4"]
+    assert "spotify:track:1" not in prefetcher.scheduled
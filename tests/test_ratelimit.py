@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.ratelimit import RateLimiter, retry_after, backoff_delay
+from email.utils import formatdate
+import time
+
+
+class Response(object):
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+def test_retry_after_seconds():
+    assert retry_after(Response({"Retry-After": "3"})) == 3.0
+    assert retry_after(Response({"Retry-After": "-1"})) == 0.0
+    assert retry_after(Response({})) is None
+    assert retry_after(Response({"Retry-After": "soon"})) is None
+
+
+def test_retry_after_date():
+    date = formatdate(time.time() + 30, usegmt=True)
+    assert 25 < retry_after(Response({"Retry-After": date})) <= 30
+    date = formatdate(time.time() - 30, usegmt=True)
+    assert retry_after(Response({"Retry-After": date})) == 0.0
+
+
+def test_backoff_delay():
+    for attempt in range(8):
+        delay = min(2 ** attempt, 60.0)
+        assert delay / 2 <= backoff_delay(attempt) <= delay
+    assert backoff_delay(20) <= 60.0
+
+
+def test_burst_then_rate():
+    limiter = RateLimiter(50, burst=5)
+    start = time.time()
+    for i in range(5):
+        limiter.acquire()
+    assert time.time() - start < 0.05
+    assert limiter.waited == 0
+
+    for i in range(5):
+        limiter.acquire()
+    # 5 more tokens at 50 per second
+    assert time.time() - start >= 0.08
+    assert limiter.waited > 0
+
+
+def test_no_limit():
+    limiter = RateLimiter(0)
+    start = time.time()
+    for i in range(1000):
+        limiter.acquire()
+    assert time.time() - start < 0.5
+    assert limiter.waited == 0
+
+
+def test_pause():
+    limiter = RateLimiter(0)
+    limiter.pause(0.2)
+    start = time.time()
+    limiter.acquire()
+    assert time.time() - start >= 0.15
+    assert limiter.throttled == 1
+
+    # pauses never get shorter
+    limiter.pause(0.2)
+    limiter.pause(0.0)
+    assert limiter.paused_until - time.time() > 0.1
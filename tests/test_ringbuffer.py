@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.ringbuffer import RingBuffer
+import os
+import time
+import threading
+
+
+def read_all(rip_buffer):
+    views = rip_buffer.peek(timeout=0)
+    data = b"".join(view.tobytes() for view in views)
+    rip_buffer.consume(len(data))
+    return data
+
+
+def test_write_and_read():
+    rip_buffer = RingBuffer(16)
+    assert rip_buffer.write(b"abcdefgh", 2, 4, 44100) == 2
+    assert rip_buffer.used == 8
+    assert read_all(rip_buffer) == b"abcdefgh"
+    assert rip_buffer.empty()
+    assert rip_buffer.total_bytes == 8
+
+
+def test_wrap_around():
+    rip_buffer = RingBuffer(16)
+    rip_buffer.write(b"0123456789ab", 3, 4, 44100)
+    views = rip_buffer.peek(timeout=0)
+    rip_buffer.consume(8)
+    assert len(views) == 1
+
+    # the second write wraps past the end of the buffer
+    rip_buffer.write(b"cdefghij", 2, 4, 44100)
+    views = rip_buffer.peek(timeout=0)
+    assert len(views) == 2
+    assert b"".join(view.tobytes() for view in views) == b"89abcdefghij"
+
+
+def test_only_whole_frames_when_full():
+    rip_buffer = RingBuffer(10)
+    assert rip_buffer.write(b"x" * 12, 3, 4, 44100) == 2
+    assert rip_buffer.used == 8
+    assert rip_buffer.stalls == 1
+    assert rip_buffer.stalled_frames == 1
+
+    assert rip_buffer.write(b"y" * 4, 1, 4, 44100) == 0
+    assert rip_buffer.stalls == 2
+    assert rip_buffer.high_water == 8
+
+
+def test_peek_waits_for_min_bytes():
+    rip_buffer = RingBuffer(16)
+    rip_buffer.write(b"abcd", 1, 4, 44100)
+    assert rip_buffer.peek(8, timeout=0.05) == []
+
+    # a flush hands out whatever there is
+    rip_buffer.flush(True)
+    views = rip_buffer.peek(8, timeout=0.05)
+    assert b"".join(view.tobytes() for view in views) == b"abcd"
+    rip_buffer.flush(False)
+
+
+def test_peek_is_woken_by_write():
+    rip_buffer = RingBuffer(16)
+
+    def write_later():
+        time.sleep(0.05)
+        rip_buffer.write(b"abcdefgh", 2, 4, 44100)
+
+    thread = threading.Thread(target=write_later)
+    thread.start()
+    views = rip_buffer.peek(8, timeout=5)
+    thread.join()
+    assert b"".join(view.tobytes() for view in views) == b"abcdefgh"
+
+
+def test_clear():
+    rip_buffer = RingBuffer(16)
+    rip_buffer.write(b"abcdefgh", 2, 4, 44100)
+    rip_buffer.clear()
+    assert rip_buffer.empty()
+    assert rip_buffer.peek(timeout=0) == []
+
+
+def test_producer_consumer():
+    data = os.urandom(4 * 10000)
+    rip_buffer = RingBuffer(4 * 64)
+    received = []
+
+    def consume():
+        size = 0
+        while size < len(data):
+            views = rip_buffer.peek(1, timeout=5)
+            chunk = b"".join(view.tobytes() for view in views)
+            rip_buffer.consume(len(chunk))
+            received.append(chunk)
+            size += len(chunk)
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+
+    # deliver like libspotify, re-delivering what wasn't accepted
+    pos = 0
+    while pos < len(data):
+        chunk = data[pos:pos + 4 * 100]
+        frames = rip_buffer.write(chunk, len(chunk) // 4, 4, 44100)
+        pos += frames * 4
+        if frames == 0:
+            time.sleep(0.001)
+    thread.join()
+
+    assert b"".join(received) == data
+    assert rip_buffer.high_water <= rip_buffer.capacity
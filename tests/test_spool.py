@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import argparse
+import pytest
+
+pytest.importorskip("spotify")
+
+from spotify_ripper import spool as spool_module  # noqa: E402
+from spotify_ripper.index import OutputIndex  # noqa: E402
+from spotify_ripper.spool import Spool, SpoolEntry  # noqa: E402
+from spotify_ripper.tags import TrackMetadata  # noqa: E402
+
+
+class Link(object):
+
+    def __init__(self, uri):
+        self.uri = uri
+
+
+class Track(object):
+
+    def __init__(self, uri):
+        self.link = Link(uri)
+
+
+class Ledger(object):
+
+    def __init__(self):
+        self.rips = []
+
+    def add_rip(self, uri, args, audio_file, duration):
+        self.rips.append((uri, args, audio_file, duration))
+
+
+class Post(object):
+
+    def __init__(self):
+        self.tag_failures = []
+
+    def log_tag_failure(self, metadata, audio_file, error):
+        self.tag_failures.append(audio_file)
+
+
+class Ripper(object):
+    """the parts of the ripper the spool uses"""
+
+    def __init__(self, music_dir):
+        self.output_index = OutputIndex(music_dir)
+        self.ledger = Ledger()
+        self.post = Post()
+
+
+def metadata(uri="spotify:track:1"):
+    meta = TrackMetadata.from_dict({
+        "uri": uri, "title": "Song", "artist": "Artist", "album": "Album",
+        "year": 1999, "disc": 1, "index": 3, "num_tracks": 12,
+        "num_discs": 1, "genres": ["rock"], "comment": None,
+        "resolved": True})
+    meta.cover = b"cover"
+    return meta
+
+
+def spool_args(util_args, *outputs):
+    """``outputs`` are "<output_type>[:<quality>]" like in --outputs"""
+    util_args.output_args = []
+    for output in outputs:
+        output_type, _, quality = output.partition(":")
+        util_args.output_args.append(argparse.Namespace(
+            output_type=output_type, quality=quality or "320", comp="8",
+            cbr=False, bitrate="320", vbr="0"))
+    return util_args
+
+
+def test_entry_round_trip(tmpdir):
+    entry = SpoolEntry(str(tmpdir), "spotify:track:1")
+    entry.metadata = metadata()
+    entry.outputs = [("wav", "320k", "a.wav"), ("pcm", "320k", "a.pcm")]
+    entry.save()
+
+    loaded = SpoolEntry(str(tmpdir), "spotify:track:1")
+    loaded.load()
+    assert loaded.metadata.to_dict() == entry.metadata.to_dict()
+    assert loaded.metadata.cover == b"cover"
+    assert loaded.outputs == entry.outputs
+
+    loaded.remove()
+    assert tmpdir.listdir() == []
+
+
+def test_encode(tmpdir, util_args):
+    args = spool_args(util_args, "wav", "pcm")
+    ripper = Ripper(str(tmpdir))
+    spool = Spool(args, ripper, str(tmpdir.join("spool")), 2)
+    track = Track("spotify:track:1")
+    entry = spool.entry(track.link.uri)
+    with open(entry.pcm_file, "wb") as f:
+        f.write(b"\0\1" * 44100)
+
+    audio_files = [str(tmpdir.join("a.wav")), str(tmpdir.join("a.pcm"))]
+    spool.add(track, metadata(), audio_files)
+    spool.wait()
+
+    assert tmpdir.join("a.pcm").read_binary() == b"\0\1" * 44100
+    assert tmpdir.join("a.wav").size() > 44100 * 2
+    assert spool.encoded_tracks == 1
+    assert ripper.ledger.rips == [
+        ("spotify:track:1", args.output_args[0], audio_files[0], 500),
+        ("spotify:track:1", args.output_args[1], audio_files[1], 500)]
+    assert not spool.has_track(track.link.uri)
+    assert tmpdir.join("spool").listdir() == []
+
+
+def test_resume(tmpdir, util_args):
+    spool_dir = tmpdir.join("spool")
+    spool_dir.ensure(dir=True)
+    entry = SpoolEntry(str(spool_dir), "spotify:track:1")
+    entry.metadata = metadata()
+    entry.outputs = [("pcm", "320k", str(tmpdir.join("a.pcm")))]
+    with open(entry.pcm_file, "wb") as f:
+        f.write(b"pcm")
+    entry.save()
+    # streaming was interrupted, there is no sidecar
+    spool_dir.join("spotify_track_2.pcm").write_binary(b"partial")
+
+    spool = Spool(spool_args(util_args, "pcm"), Ripper(str(tmpdir)), str(spool_dir), 1)
+    spool.resume()
+    spool.wait()
+
+    assert tmpdir.join("a.pcm").read_binary() == b"pcm"
+    assert spool_dir.listdir() == []
+
+
+def test_outputs_of_the_same_type(tmpdir, util_args):
+    spool_dir = tmpdir.join("spool")
+    spool_dir.ensure(dir=True)
+    entry = SpoolEntry(str(spool_dir), "spotify:track:1")
+    entry.metadata = metadata()
+    entry.outputs = [("pcm", "160k", str(tmpdir.join("a.pcm"))),
+                     ("pcm", "320k", str(tmpdir.join("b.pcm")))]
+    with open(entry.pcm_file, "wb") as f:
+        f.write(b"pcm")
+    entry.save()
+
+    # the outputs are configured in another order than they were spooled
+    args = spool_args(util_args, "pcm:320", "pcm:160")
+    ripper = Ripper(str(tmpdir))
+    spool = Spool(args, ripper, str(spool_dir), 1)
+    spool.resume()
+    spool.wait()
+
+    assert [(rip[1], rip[2]) for rip in ripper.ledger.rips] == [
+        (args.output_args[1], str(tmpdir.join("a.pcm"))),
+        (args.output_args[0], str(tmpdir.join("b.pcm")))]
+
+
+def test_entries_without_quality(tmpdir, util_args):
+    spool_dir = tmpdir.join("spool")
+    spool_dir.ensure(dir=True)
+    entry = SpoolEntry(str(spool_dir), "spotify:track:1")
+    entry.metadata = metadata()
+    entry.outputs = [("pcm", None, str(tmpdir.join("a.pcm"))),
+                     ("wav", None, str(tmpdir.join("a.wav")))]
+    with open(entry.pcm_file, "wb") as f:
+        f.write(b"pcm")
+    entry.save()
+
+    # matched by position, the wav output is no longer configured
+    args = spool_args(util_args, "pcm:160", "mp3")
+    ripper = Ripper(str(tmpdir))
+    spool = Spool(args, ripper, str(spool_dir), 1)
+    spool.resume()
+    spool.wait()
+
+    assert [(rip[1], rip[2]) for rip in ripper.ledger.rips] == [
+        (args.output_args[0], str(tmpdir.join("a.pcm")))]
+    assert not tmpdir.join("a.wav").exists()
+
+
+def test_wait_tracks(tmpdir, util_args):
+    args = spool_args(util_args, "pcm")
+    spool = Spool(args, Ripper(str(tmpdir)), str(tmpdir.join("spool")), 1)
+    tracks = [Track("spotify:track:1"), Track("spotify:track:2")]
+    for idx, track in enumerate(tracks):
+        with open(spool.entry(track.link.uri).pcm_file, "wb") as f:
+            f.write(b"\0\1" * 44100)
+        audio_file = str(tmpdir.join(str(idx) + ".pcm"))
+        if idx == 1:
+            # can't be written, the track stays in the spool
+            audio_file = str(tmpdir.join("missing", "1.pcm"))
+        spool.add(track, metadata(track.link.uri), [audio_file])
+
+    spool.wait_tracks(track.link.uri for track in tracks)
+    assert tmpdir.join("0.pcm").size() == 44100 * 2
+    assert not spool.has_track("spotify:track:1")
+    assert spool.has_track("spotify:track:2")
+
+
+def test_tag_failures_are_not_ledgered(tmpdir, util_args, monkeypatch):
+    def set_metadata_tags(args, audio_file, *rest):
+        raise ValueError("can't sync to MPEG frame")
+
+    monkeypatch.setattr(spool_module, "set_metadata_tags", set_metadata_tags)
+    ripper = Ripper(str(tmpdir))
+    spool = Spool(spool_args(util_args, "pcm"), ripper,
+                  str(tmpdir.join("spool")), 1)
+    track = Track("spotify:track:1")
+    with open(spool.entry(track.link.uri).pcm_file, "wb") as f:
+        f.write(b"pcm")
+    audio_file = str(tmpdir.join("a.pcm"))
+    spool.add(track, metadata(), [audio_file])
+    spool.wait()
+
+    assert ripper.post.tag_failures == [audio_file]
+    assert ripper.ledger.rips == []
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper import tags
+from spotify_ripper.tags import TaggingPool, TrackMetadata
+import argparse
+
+
+class Track(object):
+    duration = 200000
+
+
+class Ledger(object):
+
+    def __init__(self):
+        self.rips = []
+
+    def add_rip(self, uri, args, audio_file, duration):
+        self.rips.append((uri, args.output_type, audio_file, duration))
+
+
+class Post(object):
+
+    def __init__(self):
+        self.tag_failures = []
+
+    def log_tag_failure(self, metadata, audio_file, error):
+        self.tag_failures.append((metadata.uri, audio_file, str(error)))
+
+
+class Ripper(object):
+    """the parts of the ripper tagging uses"""
+
+    def __init__(self):
+        self.output_index = None
+        self.ledger = Ledger()
+        self.post = Post()
+
+
+def metadata():
+    meta = TrackMetadata.from_dict({
+        "uri": "spotify:track:1", "title": "Song", "artist": "Artist",
+        "album": "Album", "year": 1999, "disc": 1, "index": 3,
+        "num_tracks": 12, "num_discs": 1, "genres": [], "comment": None,
+        "resolved": True})
+    meta.track = Track()
+    return meta
+
+
+def tag(monkeypatch, error=None, num_workers=0):
+    def set_metadata_tags(args, audio_file, meta, output_index, tagged):
+        if error is not None:
+            raise error
+
+    monkeypatch.setattr(tags, "set_metadata_tags", set_metadata_tags)
+    ripper = Ripper()
+    pool = TaggingPool(argparse.Namespace(), ripper, num_workers)
+    pool.submit("a.mp3", metadata(), argparse.Namespace(output_type="mp3"))
+    pool.wait()
+    return ripper
+
+
+def test_tagged_files_are_ledgered(monkeypatch):
+    ripper = tag(monkeypatch, num_workers=2)
+    assert ripper.ledger.rips == [
+        ("spotify:track:1", "mp3", "a.mp3", 200000)]
+    assert ripper.post.tag_failures == []
+
+
+def test_tag_failures_are_not_ledgered(monkeypatch):
+    ripper = tag(monkeypatch, ValueError("can't sync to MPEG frame"))
+    assert ripper.ledger.rips == []
+    assert ripper.post.tag_failures == [
+        ("spotify:track:1", "a.mp3", "can't sync to MPEG frame")]
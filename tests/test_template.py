@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""The expected paths are what the original, string replacing
+``format_track_path`` produced for the same format strings."""
+
+from __future__ import unicode_literals
+
+from spotify_ripper.metadata import TrackInfo
+from spotify_ripper.template import PathTemplate, TrackFields
+import argparse
+
+
+class User(object):
+    display_name = "me"
+
+
+class Session(object):
+    user = User()
+
+
+class Playlist(object):
+
+    def __init__(self, name, owner):
+        self.name = name
+        self.owner = User()
+        self.owner.display_name = owner
+
+
+class Ripper(object):
+
+    def __init__(self, playlist=None):
+        self.session = Session()
+        self.current_album = None
+        self.current_playlist = playlist
+
+
+def track_info(name="Song - Live", artists=("AC/DC", "Guest")):
+    info = TrackInfo("spotify:track:1")
+    info.name = name
+    info.artists = list(artists)
+    info.album = "Album: Deluxe"
+    info.album_year = 1999
+    info.disc = 1
+    info.index = 3
+    return info
+
+
+def render(format_str, info=None, idx=4, playlist=None, replace=None):
+    args = argparse.Namespace(output_type="mp3")
+    template = PathTemplate(format_str, replace)
+    fields = TrackFields(Ripper(playlist), args, idx, info or track_info())
+    return template.replace(template.render(fields))
+
+
+def test_default_format():
+    assert render("{album_artist}/{album}/{artist} - {track_name}.{ext}") \
+        == "AC & DC/Album Deluxe/AC & DC - Song - Live.mp3"
+
+
+def test_aliases():
+    assert render("{track_artist}|{artists}|{track}|{extension}|{year}") \
+        == "AC & DC|AC/DC, Guest|Song - Live|mp3|1999"
+
+
+def test_zero_fill():
+    assert render("{disc_idx}-{track_num:2} {idx:3} {index}") == \
+        "1-03 005 5"
+
+
+def test_feat_artists():
+    assert render("{artist} {feat_artists:feat.} - {track}") == \
+        "AC & DC feat. Guest - Song - Live"
+    assert render("{artist} {feat_artists:feat.} - {track}",
+                  track_info(artists=["Solo"])) == "Solo - Song - Live"
+    assert render("{artist} ({featuring_artists})",
+                  track_info(artists=["Solo"])) == "Solo ()"
+
+
+def test_paren():
+    assert render("{track_name:paren}") == "Song (Live)"
+    assert render("{track:paren}", track_info(name="Song")) == "Song"
+
+
+def test_playlist_fields():
+    assert render("{playlist}/{playlist_owner}/{user}") == \
+        "No Playlist/No Playlist Owner/me"
+    assert render("{playlist_name}/{playlist_user}/{username}",
+                  playlist=Playlist("Mix", "dj")) == "Mix/dj/me"
+
+
+def test_unknown_fields_are_kept():
+    assert render("{foo}/{idx:x}/{track_name:upper}") == \
+        "{foo}/{idx:x}/{track_name:upper}"
+
+
+def test_repeated_fields():
+    assert render("{artist}/{artist}") == "AC & DC/AC & DC"
+
+
+def test_replace():
+    assert render("{artist} - {track}", replace=["AC & DC/ACDC", " /_"]) \
+        == "ACDC_-_Song_-_Live"
+
+
+def test_only_used_fields_are_computed():
+    template = PathTemplate("{artist}.{ext}")
+    assert template.fields == set(["artist", "ext"])
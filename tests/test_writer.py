@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from spotify_ripper.ringbuffer import RingBuffer
+from spotify_ripper.writer import EncoderWriter, WriterStats
+from io import BytesIO
+import os
+import threading
+
+
+class Sink(object):
+    """the parts of an EncoderProcess the writer writes to"""
+
+    def __init__(self, pipe=None, pcm_file=None):
+        self.pipe = pipe
+        self.wav_file = None
+        self.pcm_file = pcm_file
+
+
+def deliver(rip_buffer, data):
+    pos = 0
+    while pos < len(data):
+        chunk = data[pos:pos + 4096]
+        pos += rip_buffer.write(chunk, len(chunk) // 4, 4, 44100) * 4
+
+
+def test_writes_pipe():
+    data = os.urandom(4 * 50000)
+    rip_buffer = RingBuffer(64 * 1024)
+    stats = WriterStats()
+    read_fd, write_fd = os.pipe()
+    pipe = os.fdopen(write_fd, "wb")
+    received = []
+
+    def read():
+        with os.fdopen(read_fd, "rb") as f:
+            received.append(f.read())
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    writer = EncoderWriter(rip_buffer, stats, 16 * 1024,
+                           [Sink(pipe=pipe)])
+    writer.start()
+    deliver(rip_buffer, data)
+    writer.finish()
+    pipe.close()
+    reader.join()
+
+    assert writer.error is None
+    assert received[0] == data
+    assert stats.bytes == len(data)
+    # data is written in batches, not per delivery
+    assert 0 < stats.writes < len(data) // 4096
+
+
+def test_writes_pcm_file():
+    data = os.urandom(4 * 1000)
+    rip_buffer = RingBuffer(64 * 1024)
+    pcm_file = BytesIO()
+    writer = EncoderWriter(rip_buffer, WriterStats(), 1024,
+                           [Sink(pcm_file=pcm_file)])
+    writer.start()
+    deliver(rip_buffer, data)
+    writer.finish()
+    assert pcm_file.getvalue() == data
+
+
+def test_fans_out_to_every_encoder():
+    data = os.urandom(4 * 1000)
+    rip_buffer = RingBuffer(64 * 1024)
+    sinks = [Sink(pcm_file=BytesIO()), Sink(pcm_file=BytesIO())]
+    writer = EncoderWriter(rip_buffer, WriterStats(), 1024, sinks)
+    writer.start()
+    deliver(rip_buffer, data)
+    writer.finish()
+    assert [sink.pcm_file.getvalue() for sink in sinks] == [data, data]
+
+
+def test_stop_drops_buffered_data():
+    rip_buffer = RingBuffer(64 * 1024)
+    pcm_file = BytesIO()
+    # nothing is written until write_size bytes are buffered
+    writer = EncoderWriter(rip_buffer, WriterStats(), 16 * 1024,
+                           [Sink(pcm_file=pcm_file)])
+    writer.start()
+    deliver(rip_buffer, b"x" * 400)
+    writer.stop()
+    assert not writer.is_alive()
+    assert pcm_file.getvalue() == b""
+
+
+def test_broken_pipe_is_reported():
+    rip_buffer = RingBuffer(64 * 1024)
+    read_fd, write_fd = os.pipe()
+    os.close(read_fd)
+    pipe = os.fdopen(write_fd, "wb")
+    writer = EncoderWriter(rip_buffer, WriterStats(), 1024,
+                           [Sink(pipe=pipe)])
+    writer.start()
+    deliver(rip_buffer, b"x" * 4096)
+    writer.finish()
+    pipe.close()
+    assert isinstance(writer.error, (IOError, OSError))